@@ -2,70 +2,141 @@ import React, { useMemo, useRef, useEffect, useState } from 'react';
 import { useFrame } from '@react-three/fiber';
 import * as THREE from 'three';
 
-interface GalaxyData {
-    x: number;
-    y: number;
-    z: number;
-    color: string;
-    size: number;
+// Written by src/galaxy_export.py. Each level file is a packed little-endian
+// structure of arrays: float32 positions[count * 3] | float32 sizes[count] | uint8 categories[count]
+interface GalaxyLevel {
+    level: number;
+    file: string;
+    count: number;
 }
 
+// One chunk per source file; `revision` changes only when that source does
+interface GalaxyChunk {
+    name: string;
+    revision: string;
+    count: number;
+    levels: GalaxyLevel[];
+}
+
+interface GalaxyManifest {
+    version: number;
+    count: number;
+    palette: string[];
+    labels: string[] | null;
+    chunks: GalaxyChunk[];
+}
+
+const BASE_URL = '/galaxies/';
+// Levels are loaded coarse to fine until this many points are on screen
+const POINT_BUDGET = 2_000_000;
+
+const vertexShader = `
+    attribute float size;
+    attribute float category;
+    uniform vec3 palette[8];
+    uniform float pixelScale;
+    varying vec3 vColor;
+
+    void main() {
+        vColor = palette[int(category)];
+        vec4 mvPosition = modelViewMatrix * vec4(position, 1.0);
+        // Sphere of radius `size` in world units, projected to pixels
+        gl_PointSize = max(1.0, size * pixelScale / -mvPosition.z);
+        gl_Position = projectionMatrix * mvPosition;
+    }
+`;
+
+const fragmentShader = `
+    varying vec3 vColor;
+
+    void main() {
+        vec2 offset = gl_PointCoord - vec2(0.5);
+        if (dot(offset, offset) > 0.25) discard;
+        gl_FragColor = vec4(vColor, 1.0);
+    }
+`;
+
 export function GalaxyField() {
-    const [galaxies, setGalaxies] = useState<GalaxyData[]>([]);
-    const meshRef = useRef<THREE.InstancedMesh>(null);
+    const [geometry, setGeometry] = useState<THREE.BufferGeometry | null>(null);
+    const [palette, setPalette] = useState<string[]>([]);
+    const pointsRef = useRef<THREE.Points>(null);
 
     useEffect(() => {
-        fetch('/galaxies.json')
-            .then(res => res.json())
-            .then(data => setGalaxies(data))
-            .catch(err => console.error("Error loading galaxies", err));
-    }, []);
+        let cancelled = false;
 
-    const dummy = useMemo(() => new THREE.Object3D(), []);
-
-    const colorArray = useMemo(() => {
-        if (galaxies.length === 0) return new Float32Array(0);
-        const array = new Float32Array(galaxies.length * 3);
-        const tempColor = new THREE.Color();
-        galaxies.forEach((g, i) => {
-            tempColor.set(g.color);
-            array[i * 3] = tempColor.r;
-            array[i * 3 + 1] = tempColor.g;
-            array[i * 3 + 2] = tempColor.b;
-        });
-        return array;
-    }, [galaxies]);
+        async function load() {
+            // The manifest is always revalidated; chunk URLs carry their revision,
+            // so chunks of unchanged sources come straight from the HTTP cache.
+            const manifest: GalaxyManifest = await (await fetch(BASE_URL + 'manifest.json', { cache: 'no-cache' })).json();
+            const candidates = manifest.chunks
+                .flatMap(chunk => chunk.levels.map(level => ({ ...level, url: `${BASE_URL}${level.file}?v=${chunk.revision}` })))
+                .sort((a, b) => a.level - b.level);
+            const levels: typeof candidates = [];
+            let total = 0;
+            for (const level of candidates) {
+                if (total > 0 && total + level.count > POINT_BUDGET) break;
+                levels.push(level);
+                total += level.count;
+            }
+            const buffers = await Promise.all(
+                levels.map(level => fetch(level.url).then(res => res.arrayBuffer()))
+            );
 
-    useEffect(() => {
-        if (meshRef.current && galaxies.length > 0) {
-            galaxies.forEach((g, i) => {
-                dummy.position.set(g.x, g.y, g.z);
-                dummy.scale.set(g.size, g.size, g.size);
-                dummy.updateMatrix();
-                meshRef.current!.setMatrixAt(i, dummy.matrix);
+            const positions = new Float32Array(total * 3);
+            const sizes = new Float32Array(total);
+            const categories = new Float32Array(total);
+            let offset = 0;
+            buffers.forEach((buffer, i) => {
+                const count = levels[i].count;
+                positions.set(new Float32Array(buffer, 0, count * 3), offset * 3);
+                sizes.set(new Float32Array(buffer, count * 12, count), offset);
+                categories.set(new Uint8Array(buffer, count * 16, count), offset);
+                offset += count;
             });
-            meshRef.current.instanceMatrix.needsUpdate = true;
-            if (meshRef.current.geometry.attributes.color) {
-                meshRef.current.geometry.attributes.color.needsUpdate = true;
+
+            const geom = new THREE.BufferGeometry();
+            geom.setAttribute('position', new THREE.BufferAttribute(positions, 3));
+            geom.setAttribute('size', new THREE.BufferAttribute(sizes, 1));
+            geom.setAttribute('category', new THREE.BufferAttribute(categories, 1));
+            geom.computeBoundingSphere();
+            if (cancelled) {
+                geom.dispose();
+                return;
             }
+            setPalette(manifest.palette);
+            setGeometry(geom);
         }
-    }, [galaxies, dummy]);
 
-    useFrame(({ clock }) => {
-        if (meshRef.current) {
-            meshRef.current.rotation.y = clock.getElapsedTime() * 0.005;
-            meshRef.current.rotation.z = clock.getElapsedTime() * 0.002;
+        load().catch(err => console.error("Error loading galaxies", err));
+        return () => { cancelled = true; };
+    }, []);
+
+    useEffect(() => () => geometry?.dispose(), [geometry]);
+
+    const material = useMemo(() => {
+        const colors = Array.from({ length: 8 }, (_, i) => new THREE.Color(palette[i] ?? '#ffffff'));
+        return new THREE.ShaderMaterial({
+            uniforms: {
+                palette: { value: colors },
+                pixelScale: { value: window.innerHeight },
+            },
+            vertexShader,
+            fragmentShader,
+            toneMapped: false,
+        });
+    }, [palette]);
+
+    useEffect(() => () => material.dispose(), [material]);
+
+    useFrame(({ clock, size }) => {
+        material.uniforms.pixelScale.value = size.height;
+        if (pointsRef.current) {
+            pointsRef.current.rotation.y = clock.getElapsedTime() * 0.005;
+            pointsRef.current.rotation.z = clock.getElapsedTime() * 0.002;
         }
     });
 
-    if (galaxies.length === 0) return null;
+    if (!geometry) return null;
 
-    return (
-        <instancedMesh ref={meshRef} args={[undefined, undefined, galaxies.length]}>
-            <sphereGeometry args={[1, 16, 16]}>
-                <instancedBufferAttribute attach="attributes-color" args={[colorArray, 3]} />
-            </sphereGeometry>
-            <meshBasicMaterial toneMapped={false} vertexColors={true} />
-        </instancedMesh>
-    );
+    return <points ref={pointsRef} geometry={geometry} material={material} />;
 }
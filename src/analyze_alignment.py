@@ -1,16 +1,18 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from astropy.coordinates import SkyCoord
-from astropy import units as u
+from matplotlib.figure import Figure
 from scipy.stats import rayleigh
+from euclid_catalogue import load_euclid_catalogue
+from sky_index import build_sky_index, knn_neighbours, mean_neighbour_pa_difference
+from coherence_significance import coherence_null_distribution, coherence_p_values
+from raster_render import plot_orientation_field
+from plot_stage import plot_job, render_plots
 
 def analyze_temporal_alignment():
     print("Loading Euclid 'Needle' (High Ellipticity) Candidates...")
     file_path = '2025-11-17_analysis/euclid_plots/high_ellipticity_candidates.csv'
     
     try:
-        df = pd.read_csv(file_path)
+        df = load_euclid_catalogue(file_path, columns=['right_ascension', 'declination', 'position_angle'])
     except FileNotFoundError:
         print(f"Error: Candidate file not found at {file_path}")
         return
@@ -38,27 +40,13 @@ def analyze_temporal_alignment():
     else:
         print("  No global alignment detected in this sample.")
 
-    # 2. Visualize the Vector Field
-    plt.figure(figsize=(12, 6))
-    plt.subplot(111, projection='mollweide')
-    
+    # 2. Visualize the Vector Field (rendered with the other figures at the end)
     # Convert RA/Dec to Mollweide (radians, RA shifted to -pi to pi)
     ra_plot = np.radians(ra)
     ra_plot[ra_plot > np.pi] -= 2 * np.pi
     dec_plot = np.radians(dec)
-    
-    # Create "quivers" representing galaxy orientation
-    length = 0.05
-    u_vec = length * np.sin(pa_rad)
-    v_vec = length * np.cos(pa_rad)
-    
-    plt.quiver(ra_plot, dec_plot, u_vec, v_vec, color='cyan', alpha=0.6, pivot='middle', headwidth=0)
-    plt.grid(True)
-    plt.title("Spatial Alignment of Euclid 'Needle' Candidates\nPossible Direction of the 3D Time Apex")
-    
     output_plot = "2025-11-17_analysis/euclid_plots/alignment_vector_field.png"
-    plt.savefig(output_plot)
-    print(f"\nVector field plot saved to {output_plot}")
+    plot_jobs = [plot_job(render_alignment_field, output_plot, ra_plot=ra_plot, dec_plot=dec_plot, pa_rad=pa_rad)]
 
     # 3. Estimate the Time Apex
     # For a simple first pass, we identify the mean resultant vector direction.
@@ -71,49 +59,72 @@ def analyze_temporal_alignment():
     # 4. Local Spatial Correlation (Coherence Check)
     # We check if neighboring galaxies have similar orientations.
     print("\n--- LOCAL COHERENCE ANALYSIS ---")
-    coords = SkyCoord(ra=ra*u.deg, dec=dec*u.deg)
-    
-    # Simple nearest neighbor check (up to 5 neighbors)
-    all_correlations = []
-    for i in range(len(coords)):
-        sep = coords[i].separation(coords)
-        # Find indices of 5 closest neighbors (excluding self)
-        nearest_idx = np.argsort(sep)[1:6]
-        
-        # Calculate how similar their PAs are (using circular difference)
-        self_pa = pa_rad[i]
-        neighbor_pas = pa_rad[nearest_idx]
-        
-        # Difference in orientation (normalized to 0-90 degrees)
-        diff = np.degrees(np.abs(np.arctan2(np.sin(self_pa - neighbor_pas), np.cos(self_pa - neighbor_pas))))
-        all_correlations.append(np.mean(diff))
+    # Nearest neighbour check (up to 5 neighbors) via a unit-sphere KD-tree,
+    # so all candidates are queried in one call instead of an O(n^2) scan.
+    tree = build_sky_index(ra, dec)
+    _, nearest_idx = knn_neighbours(tree, k=5)
+
+    # Difference in orientation (circular), averaged over each galaxy's neighbours
+    all_correlations = mean_neighbour_pa_difference(pa_rad, nearest_idx)
 
     avg_local_diff = np.mean(all_correlations)
     print(f"Average orientation difference between neighbors: {avg_local_diff:.2f} degrees")
-    
-    # Expected random diff for 0-180 orientation is 45 degrees.
-    if avg_local_diff > 50:
+
+    # Null distribution: shuffle PAs across positions, reusing the same neighbour graph
+    n_realisations = 2000
+    null = coherence_null_distribution(pa_rad, nearest_idx, n_realisations=n_realisations)
+    expected_diff = np.mean(null)
+    p_aligned, p_orthogonal = coherence_p_values(avg_local_diff, null)
+    print(f"Random expectation ({n_realisations} PA shuffles): {expected_diff:.2f} +/- {np.std(null):.2f} degrees")
+    print(f"P-value (more aligned): {p_aligned:.4e}, P-value (more perpendicular): {p_orthogonal:.4e}")
+
+    if p_orthogonal < 0.05:
         print("  *** TEMPORAL ORTHOGONALITY DETECTED ***")
-        print(f"  Neighbors are significantly MORE perpendicular than random chance (Diff: {avg_local_diff:.2f} vs Expected: 45.00).")
+        print(f"  Neighbors are significantly MORE perpendicular than random chance (Diff: {avg_local_diff:.2f} vs Expected: {expected_diff:.2f}).")
         print("  This points to a lattice-like grid in the 3D Time canvas.")
-    elif avg_local_diff < 40:
+    elif p_aligned < 0.05:
         print("  *** LOCAL COHERENCE DETECTED ***")
         print(f"  Neighbors are more aligned than random chance.")
     else:
         print("  No significant local coherence found at this scale.")
 
     # 5. Distribution Analysis
-    plt.figure(figsize=(8, 5))
-    plt.hist(all_correlations, bins=20, color='magenta', alpha=0.7, edgecolor='black')
-    plt.axvline(45, color='white', linestyle='--', label='Random Expectation (45°)')
-    plt.title("Distribution of Local Orientation Differences\n(Temporal Orthogonality Check)")
-    plt.xlabel("Mean Neighbor Difference (Degrees)")
-    plt.ylabel("Frequency")
-    plt.legend()
-    
     hist_plot = "2025-11-17_analysis/euclid_plots/local_alignment_histogram.png"
-    plt.savefig(hist_plot)
-    print(f"\nLocal difference histogram saved to {hist_plot}")
+    plot_jobs.append(plot_job(render_local_difference_histogram, hist_plot, differences=all_correlations,
+                              expected_diff=expected_diff))
+
+    render_plots(plot_jobs)
+    print(f"\nVector field plot saved to {output_plot}")
+    print(f"Local difference histogram saved to {hist_plot}")
+
+
+def render_alignment_field(ra_plot, dec_plot, pa_rad):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot(111, projection='mollweide')
+
+    # Create "quivers" representing galaxy orientation
+    length = 0.05
+    # (u, v) = length * (sin PA, cos PA): angle pi/2 - PA from the +x axis.
+    # Large samples are averaged per cell before drawing.
+    plot_orientation_field(ax, ra_plot, dec_plot, np.pi / 2 - pa_rad, length,
+                           extent=(-np.pi, np.pi, -np.pi / 2, np.pi / 2), color='cyan', alpha=0.6, pivot='middle',
+                           headwidth=0)
+    ax.grid(True)
+    ax.set_title("Spatial Alignment of Euclid 'Needle' Candidates\nPossible Direction of the 3D Time Apex")
+    return fig
+
+
+def render_local_difference_histogram(differences, expected_diff):
+    fig = Figure(figsize=(8, 5))
+    ax = fig.add_subplot()
+    ax.hist(differences, bins=20, color='magenta', alpha=0.7, edgecolor='black')
+    ax.axvline(expected_diff, color='white', linestyle='--', label=f'Random Expectation ({expected_diff:.1f}°)')
+    ax.set_title("Distribution of Local Orientation Differences\n(Temporal Orthogonality Check)")
+    ax.set_xlabel("Mean Neighbor Difference (Degrees)")
+    ax.set_ylabel("Frequency")
+    ax.legend()
+    return fig
+
 
 def rayleigh_test(angles):
     """Simplified Rayleigh test for uniformity of circular data."""
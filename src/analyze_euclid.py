@@ -1,16 +1,18 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from sklearn.cluster import DBSCAN
+import matplotlib.colors as mcolors
+from euclid_catalogue import load_euclid_catalogue
+from sky_clustering import cluster_sky
+from shear_statistics import cluster_shear_statistics
+from shear_profiles import shear_profiles, profiles_to_frame, print_stacked_profile
+from raster_render import point_extent, plot_points, plot_orientation_field
 
 def analyze_euclid_data(file_path):
     print(f"Loading data from {file_path}...")
-    df = pd.read_csv(file_path)
-    print(f"Loaded {len(df)} records.")
+    # Basic filtering (det_quality_flag == 0) is applied while reading
+    df = load_euclid_catalogue(file_path, columns=['right_ascension', 'declination', 'ellipticity', 'position_angle'])
+    print(f"Loaded {len(df)} good-quality records.")
 
-    # Basic filtering
-    df = df[df['det_quality_flag'] == 0].copy()
-    
     # Calculate shear pseudo-vectors for visualization
     # Convert position_angle to radians
     theta_rad = np.radians(df['position_angle'])
@@ -22,34 +24,38 @@ def analyze_euclid_data(file_path):
     df['g2'] = df['ellipticity'] * np.sin(theta_rad)
     
     print("Performing basic spatial clustering (DBSCAN)...")
-    # Clustering based on spatial coordinates
-    # epsilon in degrees. 0.1 degree is 6 arcmin.
-    coords = df[['right_ascension', 'declination']].values
-    db = DBSCAN(eps=0.1, min_samples=5).fit(coords)
-    df['cluster'] = db.labels_
-    
-    n_clusters = len(set(db.labels_)) - (1 if -1 in db.labels_ else 0)
+    # Clustering on the sphere (haversine), so eps is a true angular
+    # separation at any declination. 0.1 degree is 6 arcmin.
+    df['cluster'] = cluster_sky(df['right_ascension'].values, df['declination'].values, eps_deg=0.1, min_samples=5)
+
+    n_clusters = int(df['cluster'].max()) + 1 if len(df) else 0
     print(f"Found {n_clusters} spatial clusters.")
     
-    # Plotting the shear field
+    # Plotting the shear field. Small catalogues are drawn per galaxy; above
+    # raster_render.RASTER_THRESHOLD the points become an aggregated image and
+    # the shear sticks are averaged (spin-2) per cell.
     plt.figure(figsize=(12, 8))
-    
+    ax = plt.gca()
+    extent = point_extent(df['right_ascension'], df['declination'])
+
     # Plot background points
-    noise = df[df['cluster'] == -1]
-    plt.scatter(noise['right_ascension'], noise['declination'], c='lightgray', s=10, alpha=0.5, label='Noise')
-    
-    # Plot clusters colored differently
-    colors = plt.cm.jet(np.linspace(0, 1, n_clusters))
-    for i in range(n_clusters):
-        cluster_points = df[df['cluster'] == i]
-        plt.scatter(cluster_points['right_ascension'], cluster_points['declination'], c=[colors[i]], s=20, label=f'Cluster {i}')
-        
+    is_noise = df['cluster'].values == -1
+    noise_color = np.broadcast_to(mcolors.to_rgba('lightgray'), (int(is_noise.sum()), 4))
+    plot_points(ax, df['right_ascension'][is_noise], df['declination'][is_noise], noise_color, extent=extent, s=10,
+                alpha=0.5, label='Noise')
+
+    # Plot clusters colored differently (one call for all clusters)
+    colors = plt.cm.jet(np.linspace(0, 1, max(n_clusters, 1)))
+    clustered = df[~is_noise]
+    plot_points(ax, clustered['right_ascension'], clustered['declination'], colors[clustered['cluster'].values],
+                extent=extent, s=20)
+
     # Overlay quiver (shear vectors)
     # We plot a line with no arrow head for shear (it's a spin-2 field, not a vector, so head isn't meaningful)
-    plt.quiver(df['right_ascension'], df['declination'], df['g1'], df['g2'], 
-               headwidth=0, headlength=0, headaxislength=0,
-               scale=10, alpha=0.3, color='black', pivot='middle')
-    
+    plot_orientation_field(ax, df['right_ascension'], df['declination'], theta_rad, df['ellipticity'],
+                           extent=extent, headwidth=0, headlength=0, headaxislength=0,
+                           scale=10, alpha=0.3, color='black', pivot='middle')
+
     plt.title('Euclid Anomalous Lensing Candidates - Shear Field')
     plt.xlabel('Right Ascension (deg)')
     plt.ylabel('Declination (deg)')
@@ -64,27 +70,37 @@ def analyze_euclid_data(file_path):
     # The 3D time hypothesis asks if there are off-axis mass structures, which might 
     # produce shear fields that are coherent across large patches without a defined central mass.
     print("\n--- 3D Time Signature Analysis ---")
-    for i in range(n_clusters):
-        c_df = df[df['cluster'] == i]
-        mean_g1 = c_df['g1'].mean()
-        mean_g2 = c_df['g2'].mean()
-        mean_e = c_df['ellipticity'].mean()
-        
-        # If the vectors are perfectly tangential around a center, mean g1 and g2 would be close to 0 
-        # (canceling out across the circle).
-        # If there's a strong non-zero mean vector in the cluster, it means the shear is 
-        # aligned in a specific direction (bulk alignment), which is anomalous for a standard halo.
-        bulk_alignment = np.sqrt(mean_g1**2 + mean_g2**2) / mean_e
-        
-        print(f"Cluster {i}: {len(c_df)} galaxies")
-        print(f"  Mean Ellipticity: {mean_e:.3f}")
-        print(f"  Bulk Alignment index (0=tangential, 1=fully parallel): {bulk_alignment:.3f}")
-        
-        if bulk_alignment > 0.5:
+    # If the vectors are perfectly tangential around a center, mean g1 and g2 would be close to 0
+    # (canceling out across the circle).
+    # If there's a strong non-zero mean vector in the cluster, it means the shear is
+    # aligned in a specific direction (bulk alignment), which is anomalous for a standard halo.
+    # All clusters are summarised in one pass, with 68% bootstrap intervals.
+    stats = cluster_shear_statistics(df['cluster'].values, df['right_ascension'].values, df['declination'].values,
+                                     df['ellipticity'].values, df['position_angle'].values)
+
+    for i, row in stats.iterrows():
+        print(f"Cluster {i}: {int(row['n_members'])} galaxies")
+        print(f"  Mean Ellipticity: {row['mean_ellipticity']:.3f}")
+        print(f"  Bulk Alignment index (0=tangential, 1=fully parallel): {row['bulk_alignment']:.3f} "
+              f"[{row['bulk_alignment_lo']:.3f}, {row['bulk_alignment_hi']:.3f}]")
+        print(f"  Tangential / cross shear about centre: {row['mean_gt']:+.3f} "
+              f"[{row['mean_gt_lo']:+.3f}, {row['mean_gt_hi']:+.3f}] / {row['mean_gx']:+.3f} "
+              f"[{row['mean_gx_lo']:+.3f}, {row['mean_gx_hi']:+.3f}]")
+
+        if row['bulk_alignment'] > 0.5:
             print("  *** ANOMALY DETECTED: Strong parallel coherence. Possible off-axis time mass structure. ***")
         else:
             print("  Likely standard tangential lensing (Dark Matter Halo).")
 
+    # A halo shows a tangential shear profile falling with radius and no
+    # cross shear; bulk alignment shows neither around the centroid.
+    if len(stats):
+        print("\n--- Stacked Radial Shear Profile around Cluster Centres ---")
+        profiles = shear_profiles(stats['ra'].values, stats['dec'].values, df['right_ascension'].values,
+                                  df['declination'].values, df['ellipticity'].values, df['position_angle'].values)
+        print_stacked_profile(profiles)
+        profiles_to_frame(profiles, stats.index.values).to_csv('euclid_cluster_shear_profiles.csv', index=False)
+        print("Saved per-cluster shear profiles to euclid_cluster_shear_profiles.csv")
 
 if __name__ == '__main__':
     analyze_euclid_data('euclid_lensing_candidates.csv')
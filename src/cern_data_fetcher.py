@@ -5,21 +5,28 @@ import datetime
 import pandas as pd
 import numpy as np
 import requests
+from http_client import get_client
 
 # Configuration
 LHCb_GITHUB_REPO_URL = "https://github.com/cernopendata/LHCb-analysis-framework"
 DOWNLOAD_DIR = "three_dimensional_time/data/cern_b_mesons"
 MINER_SCRIPT_PATH = os.path.join(os.getcwd(), "three_dimensional_time/src/cern_data_miner.py")
 LAST_UPDATE_FILE = os.path.join(DOWNLOAD_DIR, ".last_update_check")
+GITHUB_API_URL = "https://api.github.com"
 
-def _get_latest_github_commit_hash(repo_url):
-    """Fetches the latest commit hash from the main branch of a GitHub repository."""
-    api_url = repo_url.replace("https://github.com/", "https://api.github.com/repos/") + "/commits/main"
+def _get_latest_github_commit_hash(repo_url, api_base=GITHUB_API_URL, client=None):
+    """
+    Fetches the latest commit hash from the main branch of a GitHub repository.
+
+    The request is conditional on the cached ETag, so when the branch has not
+    moved GitHub answers 304 with no body (and does not count it against the
+    rate limit).
+    """
+    api_url = repo_url.replace("https://github.com/", api_base.rstrip('/') + "/repos/") + "/commits/main"
     try:
-        response = requests.get(api_url)
-        response.raise_for_status() # Raise an exception for HTTP errors
-        return response.json()['sha']
-    except requests.exceptions.RequestException as e:
+        commit, _ = (client or get_client()).fetch_json(api_url, headers={'Accept': 'application/vnd.github+json'})
+        return commit['sha']
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
         print(f"Error fetching GitHub commit hash: {e}")
         return None
 
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import argparse
+from dataset_cache import read_cached_csv
+from periodogram import SIGNIFICANT_FAP, analyze_periodicities, print_periodicity_report
 
 def mine_cern_entanglement_data(data_file_path=None):
     """
@@ -15,7 +17,7 @@ def mine_cern_entanglement_data(data_file_path=None):
     if data_file_path:
         print(f"Loading B-meson CP asymmetry data from {data_file_path}...")
         try:
-            df = pd.read_csv(data_file_path)
+            df = read_cached_csv(data_file_path)
             if 'day_of_year' not in df.columns or 'cp_asymmetry_avg' not in df.columns:
                 raise ValueError("Data file must contain 'day_of_year' and 'cp_asymmetry_avg' columns.")
             print("Data loaded successfully.")
@@ -60,18 +62,31 @@ def mine_cern_entanglement_data(data_file_path=None):
     print(f"Aggregated {len(df)} daily decay datasets.")
     print(f"Saved aggregated CP asymmetry timeline to {output_file}")
     
+    # One spectrum covering every candidate period (orbital, lunar, lattice)
+    # instead of testing each period separately; the orbital check reads its
+    # entry, fitted at any phase rather than correlated with a fixed sine.
     print("\n--- 3D Time Sidereal/Orbital Correlation Check ---")
-    if len(days) > 0 and np.std(np.sin(2 * np.pi * days / 365)) != 0: # Avoid division by zero if all days are same
-        correlation = np.corrcoef(observed_asymmetry, np.sin(2 * np.pi * days / 365))[0, 1]
-        print(f"Correlation between daily B-meson CP asymmetry and Earth's orbit phase: {correlation:.3f}")
-        
-        if abs(correlation) > 0.3:
-            print("  *** ANOMALY DETECTED: Macro-periodic violation of local decay symmetries. ***")
-            print("  This suggests the decay rates are influenced by our position traversing a 3D time structure.")
-        else:
-            print("  Fluctuations are consistent with standard model noise (or insufficient signal in public data).")
+    if len(days) <= 3 or np.std(observed_asymmetry) == 0:
+        print("  Insufficient data or variance to compute a periodogram.")
+        return
+    result = analyze_periodicities(days, observed_asymmetry)
+    _, orbital_power, orbital_fap = result['reference']['Orbital (1 yr)']
+    print(f"Variance of daily B-meson CP asymmetry explained at Earth's orbital period: {orbital_power:.3f} "
+          f"(false-alarm probability {orbital_fap:.4f})")
+    if orbital_fap < SIGNIFICANT_FAP:
+        print("  *** ANOMALY DETECTED: Macro-periodic violation of local decay symmetries. ***")
+        print("  This suggests the decay rates are influenced by our position traversing a 3D time structure.")
+    else:
+        print("  Fluctuations are consistent with standard model noise (or insufficient signal in public data).")
+
+    print("\n--- 3D Time Periodicity Scan (Lomb-Scargle) ---")
+    print_periodicity_report(result)
+    significant = [name for name, (_, _, fap) in result['reference'].items() if fap < SIGNIFICANT_FAP]
+    if significant:
+        print(f"  *** PERIODIC ANOMALY DETECTED at: {', '.join(significant)} "
+              f"(false-alarm probability < {SIGNIFICANT_FAP:.0%}) ***")
     else:
-        print("  Insufficient data or variance to compute meaningful correlation.")
+        print("  No reference period stands out above the bootstrap noise level.")
 
 
 if __name__ == '__main__':
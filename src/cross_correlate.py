@@ -1,13 +1,38 @@
 import pandas as pd
 import numpy as np
-from astropy.coordinates import SkyCoord
-from astropy import units as u
+from euclid_catalogue import load_euclid_catalogue
+from dataset_cache import read_cached_csv
+from crossmatch import crossmatch, crossmatch_n_way, nearest_matches, summarize_matches
+from crossmatch_significance import crossmatch_significance
+from sky_index import build_sky_index
 
-def cross_correlate_anomalies():
+# We look for matches within a certain radius, representing the 'shadow'
+# cast by an off-axis 3D time structure. All radii are matched in one pass;
+# MATCH_RADIUS_DEG is the one the multi-modal verdict uses.
+MATCH_RADII_DEG = (0.1, 0.5, 1.0)
+MATCH_RADIUS_DEG = 0.5
+# Random catalogues drawn over the Euclid footprint to estimate chance matches
+N_RANDOM_CATALOGUES = 1000
+SIGNIFICANCE_LEVEL = 0.05
+
+
+def print_match_summary(name, matches, significance):
+    print(f"{name} vs Euclid:")
+    for row, expected, p, saturated in zip(summarize_matches(matches, MATCH_RADII_DEG), significance['expected'],
+                                           significance['p_value'], significance['saturated']):
+        if saturated:
+            chance = "every random catalogue matches all"
+        else:
+            chance = f"chance expectation {expected:.2f}, p = {p:.4f}"
+        print(f"  within {row['radius_deg']:.2f} deg: {row['pairs']} pairs, "
+              f"{row['sources2']} {name} sources ({chance}), {row['sources1']} Euclid objects")
+
+
+def cross_correlate_anomalies(n_workers=None):
     print("Loading Euclid Dark Matter/Time anomalies...")
     euclid_file = 'euclid_lensing_candidates.csv'
     try:
-        euclid_df = pd.read_csv(euclid_file)
+        euclid_df = load_euclid_catalogue(euclid_file, columns=['object_id', 'right_ascension', 'declination'])
     except FileNotFoundError:
         print(f"File not found: {euclid_file}")
         return
@@ -15,7 +40,7 @@ def cross_correlate_anomalies():
     print("Loading JWST Early Universe Structural anomalies...")
     jwst_file = 'jwst_early_universe_candidates.csv'
     try:
-        jwst_df = pd.read_csv(jwst_file)
+        jwst_df = read_cached_csv(jwst_file)
     except FileNotFoundError:
         print(f"File not found: {jwst_file}")
         return
@@ -24,25 +49,89 @@ def cross_correlate_anomalies():
     # paths of parallel shear coherence we noted in the Euclid data.
     # We will do a generic spatial cross-match to see if any are in the same region.
     
+    rubin_file = 'rubin_time_domain_candidates.csv'
+    try:
+        rubin_df = read_cached_csv(rubin_file, columns=['objectId', 'ra', 'dec'])
+    except FileNotFoundError:
+        print(f"File not found: {rubin_file}; skipping Rubin.")
+        rubin_df = None
+
     print("\nPerforming spatial cross-match between anomalous datasets...")
-    
-    # Create SkyCoord objects
-    euclid_coords = SkyCoord(ra=euclid_df['right_ascension'].values*u.deg, dec=euclid_df['declination'].values*u.deg)
-    jwst_coords = SkyCoord(ra=jwst_df['ra'].values*u.deg, dec=jwst_df['dec'].values*u.deg)
-    
-    # We look for matches within a certain radius, representing the 'shadow' 
-    # cast by an off-axis 3D time structure. Let's say 0.5 degrees.
-    max_sep = 0.5 * u.deg
-    
-    # Match JWST to Euclid
-    idx, d2d, d3d = jwst_coords.match_to_catalog_sky(euclid_coords)
-    
-    matches = d2d < max_sep
-    match_count = matches.sum()
-    
-    print(f"Found {match_count} JWST candidates geographically co-located with an extreme Euclid shear anomaly.")
-    
-    if match_count > 0:
+
+    # Euclid is the large catalogue, so it is the one sharded by sky tile
+    euclid_ra, euclid_dec = euclid_df['right_ascension'].values, euclid_df['declination'].values
+    # Shared by the random-catalogue significance runs
+    euclid_tree = build_sky_index(euclid_ra, euclid_dec)
+    jwst_matches = crossmatch(euclid_ra, euclid_dec, jwst_df['ra'].values, jwst_df['dec'].values,
+                              MATCH_RADII_DEG, n_workers=n_workers)
+    jwst_significance = crossmatch_significance(euclid_ra, euclid_dec, jwst_df['ra'].values, jwst_df['dec'].values,
+                                                MATCH_RADII_DEG, N_RANDOM_CATALOGUES, n_workers=n_workers,
+                                                tree=euclid_tree)
+    print_match_summary('JWST', jwst_matches, jwst_significance)
+    pair_tables = [pd.DataFrame({'catalogue': 'JWST',
+                                 'source_id': jwst_df['source_id'].values[jwst_matches['idx2']]})]
+    all_matches = [jwst_matches]
+
+    if rubin_df is not None:
+        rubin_matches = crossmatch(euclid_ra, euclid_dec, rubin_df['ra'].values, rubin_df['dec'].values,
+                                   MATCH_RADII_DEG, n_workers=n_workers)
+        rubin_significance = crossmatch_significance(euclid_ra, euclid_dec, rubin_df['ra'].values,
+                                                     rubin_df['dec'].values, MATCH_RADII_DEG, N_RANDOM_CATALOGUES,
+                                                     n_workers=n_workers, tree=euclid_tree)
+        print_match_summary('Rubin', rubin_matches, rubin_significance)
+        pair_tables.append(pd.DataFrame({'catalogue': 'Rubin',
+                                         'source_id': rubin_df['objectId'].values[rubin_matches['idx2']]}))
+        all_matches.append(rubin_matches)
+
+    # Every pair within the largest radius, with the smallest radius it satisfies
+    pairs = pd.concat(pair_tables, ignore_index=True)
+    all_matches = np.concatenate(all_matches)
+    pairs['euclid_object_id'] = euclid_df['object_id'].values[all_matches['idx1']]
+    pairs['separation_deg'] = all_matches['sep_deg']
+    pairs['radius_deg'] = np.sort(MATCH_RADII_DEG)[all_matches['radius_index']]
+    pairs.to_csv('cross_match_pairs.csv', index=False)
+    print(f"Saved {len(pairs)} cross-match pairs to cross_match_pairs.csv")
+
+    # N-way association of every catalogue at the verdict radius
+    catalogues = {
+        'Euclid': (euclid_ra, euclid_dec, euclid_df['object_id'].values),
+        'JWST': (jwst_df['ra'].values, jwst_df['dec'].values, jwst_df['source_id'].values),
+    }
+    if rubin_df is not None:
+        catalogues['Rubin'] = (rubin_df['ra'].values, rubin_df['dec'].values, rubin_df['objectId'].values)
+    associations = crossmatch_n_way(catalogues, MATCH_RADIUS_DEG, n_workers=n_workers)
+    associations.to_csv('multi_catalogue_associations.csv', index=False)
+    n_groups = associations['group_id'].nunique()
+    print(f"\n{n_groups} multi-catalogue association groups within {MATCH_RADIUS_DEG} deg "
+          f"(saved to multi_catalogue_associations.csv)")
+    if n_groups:
+        combos = associations.groupby('group_id')['catalogue'].agg(lambda c: ' + '.join(sorted(set(c))))
+        for combo, count in combos.value_counts().items():
+            print(f"  {combo}: {count} groups")
+
+    nearest = nearest_matches(jwst_matches[jwst_matches['sep_deg'] <= MATCH_RADIUS_DEG])
+    match_count = len(nearest)
+
+    k = int(np.searchsorted(jwst_significance['radius_deg'], MATCH_RADIUS_DEG))
+    expected, p_value = jwst_significance['expected'][k], jwst_significance['p_value'][k]
+    saturated = jwst_significance['saturated'][k]
+
+    print(f"\nFound {match_count} JWST candidates geographically co-located with an extreme Euclid shear anomaly "
+          f"(within {MATCH_RADIUS_DEG} deg).")
+    if saturated:
+        print(f"Every random catalogue over the Euclid footprint matches all {len(jwst_df)} JWST positions at this "
+              f"radius, so co-location within {MATCH_RADIUS_DEG} deg cannot be tested.")
+    else:
+        print(f"Random catalogues over the Euclid footprint match {expected:.2f} on average "
+              f"(p = {p_value:.4f} for {match_count} or more).")
+
+    if match_count == 0:
+        print("No immediate spatial correlation found at the current threshold.")
+    elif saturated:
+        print("No verdict: choose a smaller MATCH_RADIUS_DEG.")
+    elif p_value > SIGNIFICANCE_LEVEL:
+        print("The co-location is consistent with chance coincidences given the Euclid footprint.")
+    else:
         print("\n--- MULTI-MODAL ANOMALY DETECTED ---")
         print("This is a highly significant finding. Objects that are 'too ordered, too soon' (JWST)")
         print("are spatially overlapping with areas of 'parallel shear' (Euclid).")
@@ -50,12 +139,11 @@ def cross_correlate_anomalies():
         print("affecting both thermodynamic evolution rates and localized spatial lensing.")
         
         # Save output
-        results = jwst_df[matches].copy()
-        results['euclid_distance_deg'] = d2d[matches].deg
+        results = jwst_df.iloc[nearest['idx2']].copy()
+        results['euclid_distance_deg'] = nearest['sep_deg']
+        results['chance_p_value'] = p_value
         results.to_csv('cross_correlated_anomalies.csv', index=False)
         print("Saved cross-correlated multi-modal candidates to cross_correlated_anomalies.csv")
-    else:
-        print("No immediate spatial correlation found at the current threshold.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from sky_index import radec_to_unit_vectors, chord_to_deg, deg_to_chord, sky_tile_ids, sky_tile_bounding_circles
+from parallel import worker_state, run_tasks
+
+# src/crossmatch.py
+#
+# Search-around cross-match of two sky catalogues: every pair closer than the
+# largest of several radii is returned in one pass, tagged with the smallest
+# radius it satisfies. Catalogue 1 (pass the larger one, e.g. Euclid) is split
+# into the RA/Dec tiles of sky_index.sky_tile_ids. Each tile is matched against
+# the catalogue 2 sources inside its bounding circle grown by the search
+# radius, using a pair of small KD-trees, so no tree ever holds the full
+# catalogue 1 and tiles run independently on a process pool. Every pair is
+# owned by the tile of its catalogue 1 member, so nothing is counted twice.
+#
+# crossmatch_n_way() joins any number of catalogues: the pairs found between
+# every two catalogues are the edges of one graph, and its connected components
+# (friends-of-friends across catalogues) are the association groups.
+
+MATCH_DTYPE = np.dtype([('idx1', 'i8'), ('idx2', 'i8'), ('sep_deg', 'f8'), ('radius_index', 'u1')])
+
+
+def _match_tile(task):
+    """All (idx1, idx2, chord) pairs within max_chord for one tile."""
+    idx1, idx2 = task
+    tree1 = cKDTree(worker_state['xyz1'][idx1])
+    tree2 = cKDTree(worker_state['xyz2'][idx2])
+    pairs = tree1.sparse_distance_matrix(tree2, worker_state['max_chord'], output_type='ndarray')
+    return idx1[pairs['i']], idx2[pairs['j']], pairs['v']
+
+
+def crossmatch(ra1, dec1, ra2, dec2, radii_deg, tile_deg=10.0, n_workers=None):
+    """
+    Finds all pairs between two catalogues within the largest of several radii.
+
+    Args:
+        ra1, dec1 (np.ndarray): Catalogue 1 positions in degrees (tiled; the larger one).
+        ra2, dec2 (np.ndarray): Catalogue 2 positions in degrees.
+        radii_deg (sequence): Match radii in degrees.
+        tile_deg (float): Tile size used to shard catalogue 1.
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+
+    Returns:
+        np.ndarray: Structured array of MATCH_DTYPE sorted by (idx1, sep_deg).
+        radius_index is the index into the sorted radii of the smallest radius
+        containing the pair, so pairs within radii[k] have radius_index <= k.
+    """
+    radii = np.sort(np.asarray(radii_deg, dtype=np.float64))
+    max_radius = radii[-1]
+
+    xyz1 = radec_to_unit_vectors(ra1, dec1)
+    xyz2 = radec_to_unit_vectors(ra2, dec2)
+    if not len(xyz1) or not len(xyz2):
+        return np.empty(0, dtype=MATCH_DTYPE)
+
+    # Group catalogue 1 by tile
+    tiles = sky_tile_ids(ra1, dec1, tile_deg)
+    order = np.argsort(tiles, kind='stable')
+    tile_ids, starts = np.unique(tiles[order], return_index=True)
+    groups = np.split(order, starts[1:])
+
+    # Catalogue 2 sources that can pair with anything in each tile
+    centres, tile_radius = sky_tile_bounding_circles(tile_ids, tile_deg)
+    reach = deg_to_chord(np.minimum(tile_radius + max_radius, 180.0)) * (1 + 1e-9)
+    nearby = cKDTree(xyz2).query_ball_point(centres, reach)
+
+    tasks = [(idx1, np.asarray(idx2, dtype=np.int64)) for idx1, idx2 in zip(groups, nearby) if len(idx2)]
+    shared = {'xyz1': xyz1, 'xyz2': xyz2, 'max_chord': float(deg_to_chord(max_radius))}
+    results = run_tasks(_match_tile, tasks, shared, n_workers, chunksize=None)
+
+    matches = np.empty(sum(len(r[0]) for r in results), dtype=MATCH_DTYPE)
+    if len(matches):
+        matches['idx1'] = np.concatenate([r[0] for r in results])
+        matches['idx2'] = np.concatenate([r[1] for r in results])
+        matches['sep_deg'] = chord_to_deg(np.concatenate([r[2] for r in results]))
+    matches = matches[matches['sep_deg'] <= max_radius]
+    matches['radius_index'] = np.searchsorted(radii, matches['sep_deg'], side='left')
+    return matches[np.lexsort((matches['sep_deg'], matches['idx1']))]
+
+
+def nearest_matches(matches, key='idx2'):
+    """Keeps the closest pair for each distinct value of `key` ('idx1' or 'idx2')."""
+    matches = matches[np.lexsort((matches['sep_deg'], matches[key]))]
+    first = np.r_[True, matches[key][1:] != matches[key][:-1]] if len(matches) else np.zeros(0, dtype=bool)
+    return matches[first]
+
+
+def summarize_matches(matches, radii_deg):
+    """
+    Pair and source counts within each radius.
+
+    Returns:
+        list of dicts with 'radius_deg', 'pairs', 'sources1' and 'sources2'
+        (distinct catalogue 1 / catalogue 2 members with a match).
+    """
+    summary = []
+    for k, radius in enumerate(np.sort(np.asarray(radii_deg, dtype=np.float64))):
+        within = matches[matches['radius_index'] <= k]
+        summary.append({'radius_deg': float(radius), 'pairs': len(within),
+                        'sources1': len(np.unique(within['idx1'])), 'sources2': len(np.unique(within['idx2']))})
+    return summary
+
+
+def crossmatch_n_way(catalogues, radius_deg, tile_deg=10.0, n_workers=None):
+    """
+    Associates sources across several catalogues.
+
+    Sources from different catalogues closer than radius_deg are linked, and
+    linked sources (transitively) form one group. Sources with no partner in
+    another catalogue are left out.
+
+    Args:
+        catalogues (dict): {name: (ra_deg, dec_deg, ids)} for each catalogue.
+        radius_deg (float): Linking radius in degrees.
+        tile_deg (float): Tile size used to shard the larger catalogue of each pair.
+        n_workers (int, optional): Process pool size, as in crossmatch().
+
+    Returns:
+        pd.DataFrame: One row per group member with group_id, catalogue,
+        source_id, row (index within its catalogue), separation_deg (from the
+        group centre), n_members and n_catalogues, sorted by group.
+    """
+    names = list(catalogues)
+    ra = [np.asarray(catalogues[n][0], dtype=np.float64) for n in names]
+    dec = [np.asarray(catalogues[n][1], dtype=np.float64) for n in names]
+    ids = [np.asarray(catalogues[n][2]) for n in names]
+    offsets = np.r_[0, np.cumsum([len(r) for r in ra])]
+
+    # Cross-catalogue links, as indices into the concatenated catalogues
+    links_a, links_b = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    for a in range(len(names)):
+        for b in range(a + 1, len(names)):
+            big, small = (a, b) if len(ra[a]) >= len(ra[b]) else (b, a)
+            matches = crossmatch(ra[big], dec[big], ra[small], dec[small], [radius_deg], tile_deg, n_workers)
+            links_a.append(offsets[big] + matches['idx1'])
+            links_b.append(offsets[small] + matches['idx2'])
+    links_a, links_b = np.concatenate(links_a), np.concatenate(links_b)
+
+    columns = ['group_id', 'catalogue', 'source_id', 'row', 'separation_deg', 'n_members', 'n_catalogues']
+    if not len(links_a):
+        return pd.DataFrame(columns=columns)
+
+    graph = coo_matrix((np.ones(len(links_a), dtype=np.int8), (links_a, links_b)), shape=(offsets[-1], offsets[-1]))
+    _, component = connected_components(graph, directed=False)
+    members = np.unique(np.r_[links_a, links_b])
+    _, group = np.unique(component[members], return_inverse=True)
+    cat = np.searchsorted(offsets, members, side='right') - 1
+    row = members - offsets[cat]
+
+    xyz = np.empty((len(members), 3))
+    source_id = np.empty(len(members), dtype=object)
+    for c in range(len(names)):
+        sel = cat == c
+        xyz[sel] = radec_to_unit_vectors(ra[c][row[sel]], dec[c][row[sel]])
+        source_id[sel] = ids[c][row[sel]]
+
+    # Group centre: normalised mean of the member unit vectors
+    centre = np.column_stack([np.bincount(group, weights=xyz[:, axis]) for axis in range(3)])
+    centre /= np.linalg.norm(centre, axis=1, keepdims=True)
+    cos_sep = np.einsum('ij,ij->i', xyz, centre[group])
+
+    group_cats = np.unique(group * len(names) + cat) // len(names)
+    table = pd.DataFrame({
+        'group_id': group,
+        'catalogue': np.asarray(names, dtype=object)[cat],
+        'source_id': source_id,
+        'row': row,
+        'separation_deg': np.degrees(np.arccos(np.clip(cos_sep, -1, 1))),
+        'n_members': np.bincount(group)[group],
+        'n_catalogues': np.bincount(group_cats)[group],
+    })
+    return table.iloc[np.lexsort((row, cat, group))].reset_index(drop=True)
@@ -0,0 +1,147 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from sky_index import radec_to_unit_vectors, deg_to_chord, sky_tile_ids
+from parallel import worker_state, run_tasks, seeded_batches
+
+# src/crossmatch_significance.py
+#
+# Random-catalogue significance for cross-match counts. Synthetic catalogues
+# with the same number of sources as the one being matched (e.g. JWST) are
+# drawn uniformly over the footprint of the reference catalogue (e.g. Euclid),
+# taken as every position within FOOTPRINT_RADIUS_DEG of a reference source,
+# so the chance coincidence rate reflects where the reference catalogue
+# actually has coverage. The footprint does not depend on the match radii, so
+# adding a radius never changes the null at the others. Radii at or above
+# FOOTPRINT_RADIUS_DEG match every random position by construction; they are
+# flagged as saturated rather than tested.
+#
+# Positions are drawn uniformly over the union of caps by picking an anchor
+# source, an offset uniform within its cap, and keeping the point with
+# probability 1 / (number of caps covering it). Anchors are one reference
+# source per cell a quarter of the footprint radius wide, which bounds the cap
+# overlap (and so the rejection rate) however dense the reference catalogue.
+#
+# The reference KD-tree is built once and shared by every worker; each batch
+# of realisations is one nearest-neighbour query.
+
+FOOTPRINT_RADIUS_DEG = 2.0
+# Anchor cell width as a fraction of the footprint radius
+ANCHOR_CELL_FRACTION = 0.25
+# Upper bound on random positions queried at once (~24 MB of unit vectors)
+MAX_BATCH_POINTS = 1_000_000
+MAX_BATCH_REALISATIONS = 100
+
+
+def footprint_anchors(ra_deg, dec_deg, radius_deg=FOOTPRINT_RADIUS_DEG):
+    """
+    Footprint of a catalogue: caps of radius_deg around anchor sources.
+
+    Returns:
+        (anchors, tree, radius_deg): Unit vectors of one source per occupied
+        cell radius_deg * ANCHOR_CELL_FRACTION wide, and their KD-tree.
+    """
+    cells = sky_tile_ids(ra_deg, dec_deg, radius_deg * ANCHOR_CELL_FRACTION)
+    _, first = np.unique(cells, return_index=True)
+    anchors = radec_to_unit_vectors(np.asarray(ra_deg)[first], np.asarray(dec_deg)[first])
+    return anchors, cKDTree(anchors), radius_deg
+
+
+def _random_cap_points(centres, radius_deg, rng):
+    """One point uniform (per unit solid angle) within radius_deg of each centre."""
+    cos_t = 1 - rng.random(len(centres)) * (1 - np.cos(np.radians(radius_deg)))
+    sin_t = np.sqrt(1 - cos_t ** 2)
+    phi = 2 * np.pi * rng.random(len(centres))
+    # Orthonormal pair perpendicular to each centre
+    helper = np.where(np.abs(centres[:, 2:]) < 0.9, [0.0, 0.0, 1.0], [1.0, 0.0, 0.0])
+    u = np.cross(centres, helper)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    v = np.cross(centres, u)
+    return centres * cos_t[:, None] + (u * np.cos(phi)[:, None] + v * np.sin(phi)[:, None]) * sin_t[:, None]
+
+
+def random_footprint_positions(footprint, n, rng):
+    """Draws n unit vectors uniformly (per unit solid angle) over the footprint."""
+    anchors, tree, radius_deg = footprint
+    chord = deg_to_chord(radius_deg)
+    accepted = []
+    needed = n
+    while needed:
+        proposals = _random_cap_points(anchors[rng.integers(len(anchors), size=2 * needed)], radius_deg, rng)
+        # A point covered by k caps is proposed k times as often
+        k = np.maximum(tree.query_ball_point(proposals, chord, return_length=True), 1)
+        keep = proposals[rng.random(len(proposals)) * k < 1][:needed]
+        accepted.append(keep)
+        needed -= len(keep)
+    return np.concatenate(accepted) if accepted else np.empty((0, 3))
+
+
+def matched_counts(tree, xyz, radii_deg):
+    """
+    Number of positions with a reference source within each radius.
+
+    Args:
+        tree (cKDTree): Reference catalogue unit vectors.
+        xyz (np.ndarray): Query unit vectors, shape (..., n, 3).
+        radii_deg (np.ndarray): Sorted radii, shape (r,).
+
+    Returns:
+        np.ndarray: Counts, shape (..., r).
+    """
+    chords = deg_to_chord(radii_deg)
+    nearest, _ = tree.query(xyz, k=1, distance_upper_bound=chords[-1])
+    return (nearest[..., None] <= chords).sum(axis=-2)
+
+
+def _null_batch(task):
+    """Matched counts for one batch of random catalogues."""
+    n_realisations, seed = task
+    rng = np.random.default_rng(seed)
+    n = worker_state['n_sources']
+    xyz = random_footprint_positions(worker_state['footprint'], n_realisations * n, rng).reshape(n_realisations, n, 3)
+    return matched_counts(worker_state['tree'], xyz, worker_state['radii'])
+
+
+def crossmatch_significance(ref_ra, ref_dec, ra, dec, radii_deg, n_realisations=1000,
+                            footprint_radius_deg=FOOTPRINT_RADIUS_DEG, n_workers=None, seed=0, tree=None):
+    """
+    Compares the observed number of matched sources with random catalogues.
+
+    Args:
+        ref_ra, ref_dec (np.ndarray): Reference catalogue (defines the footprint).
+        ra, dec (np.ndarray): Catalogue being matched (e.g. JWST).
+        radii_deg (sequence): Match radii in degrees.
+        n_realisations (int): Number of random catalogues.
+        footprint_radius_deg (float): Random positions lie within this
+                                      distance of a reference source.
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+        seed (int): Seed for reproducible realisations.
+        tree (cKDTree, optional): Prebuilt index of the reference unit vectors.
+
+    Returns:
+        dict with 'radius_deg', 'observed', 'expected' (mean random count),
+        'null' (counts per realisation, shape (n_realisations, r)),
+        'p_value' (chance of a random catalogue matching at least as many
+        sources) and 'saturated' (every random catalogue matched all n
+        sources, so the radius cannot discriminate; always the case from
+        footprint_radius_deg up), each per radius in ascending order.
+    """
+    radii = np.sort(np.asarray(radii_deg, dtype=np.float64))
+    n = len(ra)
+    if tree is None:
+        tree = cKDTree(radec_to_unit_vectors(ref_ra, ref_dec))
+    footprint = footprint_anchors(ref_ra, ref_dec, footprint_radius_deg)
+    observed = matched_counts(tree, radec_to_unit_vectors(ra, dec), radii)
+
+    batch_size = max(1, min(MAX_BATCH_REALISATIONS, MAX_BATCH_POINTS // max(1, n)))
+    shared = {'tree': tree, 'footprint': footprint, 'n_sources': n, 'radii': radii}
+    null = np.concatenate(run_tasks(_null_batch, seeded_batches(n_realisations, batch_size, seed), shared,
+                                    n_workers))
+    return {
+        'radius_deg': radii,
+        'observed': observed,
+        'expected': null.mean(axis=0),
+        'null': null,
+        'p_value': ((null >= observed).sum(axis=0) + 1) / (len(null) + 1),
+        'saturated': (null == n).all(axis=0) if n else np.zeros(len(radii), dtype=bool),
+    }
@@ -0,0 +1,463 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+import pandas as pd
+from sky_index import sky_tile_ids
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Cache is an accelerator only; fall back to parsing the CSV
+    pa = None
+    pq = None
+
+try:
+    import fcntl
+except ImportError:  # No flock (Windows): concurrent builds are not serialised
+    fcntl = None
+
+# src/dataset_cache.py
+#
+# Columnar cache for the mined CSV datasets. Each CSV is converted once into a
+# directory of Parquet files, one sub-directory per partition (sky tile for
+# catalogues with RA/Dec, block of days for daily timelines), plus a
+# manifest.json recording the source file's size, mtime and SHA-256. A cache is
+# reused only while the source is unchanged, so re-mining a dataset invalidates
+# it automatically. If rows were only appended (incremental ingestion), just the
+# new tail is parsed and the touched partitions are recorded in the manifest, so
+# analyses can recompute only the affected sky regions (changed_partitions).
+# Every cached row also carries its row number in the CSV (ROW_COLUMN), so
+# read_cached_csv returns rows in file order although they are stored grouped
+# by partition; iter_cached_csv streams them partition by partition.
+# Analyses that reduce each partition to a mergeable partial result can keep
+# those partials under <cache dir>/results (update_partition_results); a full
+# rebuild replaces the directory and so discards them with the rows they
+# summarised.
+#
+# Builds and appends are serialised across processes by an flock on
+# <cache dir>.lock, and every writer stages its files under its own temporary
+# name. A process that waited for the lock re-reads the manifest first, so
+# concurrent readers of a stale CSV rebuild it once rather than racing.
+
+CACHE_DIR_NAME = '.dataset_cache'
+MANIFEST_NAME = 'manifest.json'
+RESULTS_DIR_NAME = 'results'
+CACHE_FORMAT_VERSION = 2
+# Hidden column holding each row's 0-based position among the CSV's data rows
+ROW_COLUMN = '_source_row'
+
+SKY_TILE_DEG = 10.0
+DAY_BLOCK = 30
+
+# RA/Dec column names used across the mined datasets
+RADEC_COLUMNS = [('right_ascension', 'declination'), ('ra', 'dec')]
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Streams a file through SHA-256 and returns the hex digest."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_dir_for(csv_path):
+    """Cache directory for a CSV: <csv dir>/.dataset_cache/<csv file stem>."""
+    csv_path = os.path.abspath(csv_path)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(os.path.dirname(csv_path), CACHE_DIR_NAME, stem)
+
+
+def default_partitioner(columns):
+    """
+    Picks a partition function for a dataset from its columns.
+
+    Returns:
+        (scheme, func): scheme name stored in the manifest and a function
+        mapping a DataFrame chunk to an array of integer partition keys.
+    """
+    for ra_col, dec_col in RADEC_COLUMNS:
+        if ra_col in columns and dec_col in columns:
+            return f'sky_tile_{SKY_TILE_DEG:g}deg', lambda df: sky_tile_ids(df[ra_col], df[dec_col], SKY_TILE_DEG)
+    if 'day_of_year' in columns:
+        return f'day_block_{DAY_BLOCK}', lambda df: (df['day_of_year'].to_numpy() - 1) // DAY_BLOCK
+    return 'single', lambda df: np.zeros(len(df), dtype=np.int64)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_manifest(cache_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=MANIFEST_NAME + '.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(cache_dir, MANIFEST_NAME))
+
+
+@contextlib.contextmanager
+def _cache_lock(cache_dir):
+    """Exclusive lock on <cache_dir>.lock, held while a cache is written."""
+    os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+    with open(cache_dir + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_partitioned(chunks, out_dir, partitioner, partitions, file_prefix='part', first_row=0):
+    """
+    Writes DataFrame chunks into per-partition Parquet files under out_dir,
+    updating the `partitions` manifest entries in place. Rows are numbered in
+    ROW_COLUMN from first_row on.
+
+    Returns:
+        (partitioner, columns, touched_keys, rows_written)
+    """
+    columns = None
+    touched = set()
+    next_row = first_row
+    for chunk_no, chunk in enumerate(chunks):
+        if partitioner is None:
+            partitioner = default_partitioner(chunk.columns)
+        if columns is None:
+            columns = list(chunk.columns)
+        keys = np.asarray(partitioner[1](chunk))
+        chunk = chunk.assign(**{ROW_COLUMN: np.arange(next_row, next_row + len(chunk), dtype=np.int64)})
+        next_row += len(chunk)
+        # Stable sort keeps the original row order inside each partition
+        order = np.argsort(keys, kind='stable')
+        keys_sorted = keys[order]
+        unique_keys, starts = np.unique(keys_sorted, return_index=True)
+        bounds = list(starts) + [len(keys_sorted)]
+        for key, lo, hi in zip(unique_keys, bounds[:-1], bounds[1:]):
+            label = f'p{int(key):06d}'
+            part_dir = os.path.join(out_dir, label)
+            os.makedirs(part_dir, exist_ok=True)
+            part = chunk.iloc[order[lo:hi]]
+            file_name = f'{file_prefix}-{chunk_no:05d}.parquet'
+            pq.write_table(pa.Table.from_pandas(part, preserve_index=False), os.path.join(part_dir, file_name))
+            entry = partitions.setdefault(label, {'key': int(key), 'files': [], 'rows': 0})
+            entry['files'].append(file_name)
+            entry['rows'] += int(hi - lo)
+            touched.add(int(key))
+    return partitioner, columns, touched, next_row - first_row
+
+
+def build_cache(csv_path, chunk_reader=None, partitioner=None):
+    """
+    Converts a CSV into a partitioned Parquet cache, streaming chunk by chunk.
+
+    Args:
+        csv_path (str): Source CSV.
+        chunk_reader (callable, optional): f(csv_path) -> iterator of DataFrames.
+            Defaults to pd.read_csv in chunks. Dataset-specific readers can
+            supply compact dtypes (see euclid_catalogue).
+        partitioner (tuple, optional): (scheme, func) as from default_partitioner.
+
+    Returns:
+        dict: The written manifest.
+    """
+    cache_dir = cache_dir_for(csv_path)
+    with _cache_lock(cache_dir):
+        return _build_cache(csv_path, cache_dir, chunk_reader, partitioner)
+
+
+def _build_cache(csv_path, cache_dir, chunk_reader=None, partitioner=None):
+    # Caller holds the cache lock
+    if chunk_reader is None:
+        chunk_reader = lambda path: pd.read_csv(path, chunksize=500_000)
+
+    stem = os.path.basename(cache_dir)
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir), prefix=stem + '.build-')
+    # mkdtemp creates it private; the cache is as readable as the CSV it mirrors
+    os.chmod(tmp_dir, 0o755)
+
+    stat = os.stat(csv_path)
+    sha256 = file_sha256(csv_path)
+    partitions = {}
+    try:
+        partitioner, columns, _, rows = _write_partitioned(chunk_reader(csv_path), tmp_dir, partitioner, partitions)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    manifest = {
+        'version': CACHE_FORMAT_VERSION,
+        'source': os.path.abspath(csv_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256,
+        'scheme': partitioner[0] if partitioner else 'single',
+        'columns': columns or [],
+        'rows': rows,
+        'partitions': dict(sorted(partitions.items())),
+        # Append-only updates since the build: [{'base_sha256', 'sha256', 'partitions'}]
+        'updates': [],
+    }
+    _write_manifest(tmp_dir, manifest)
+
+    # Move the old cache aside first so the swap itself is a single rename
+    old_dir = None
+    if os.path.exists(cache_dir):
+        old_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir), prefix=stem + '.old-')
+        os.replace(cache_dir, os.path.join(old_dir, stem))
+    os.replace(tmp_dir, cache_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def _append_update(csv_path, manifest, chunk_reader=None, partitioner=None, block_size=1 << 20):
+    """
+    Brings the cache up to date when rows were only appended to the CSV:
+    verifies the old bytes are an unchanged prefix, then parses just the tail.
+
+    The caller holds the cache lock.
+
+    Returns:
+        dict or None: Updated manifest, or None if a full rebuild is needed.
+    """
+    old_size = manifest['size']
+    if partitioner is None:
+        partitioner = default_partitioner(manifest['columns'])
+    if partitioner[0] != manifest['scheme'] or not manifest['columns']:
+        return None
+
+    cache_dir = cache_dir_for(csv_path)
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        f.seek(0)
+        remaining = old_size
+        last_byte = b''
+        while remaining:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                return None
+            digest.update(block)
+            last_byte = block[-1:]
+            remaining -= len(block)
+        # The old file must be an intact prefix ending on a row boundary
+        if digest.hexdigest() != manifest['sha256'] or last_byte != b'\n':
+            return None
+        fd, tail_path = tempfile.mkstemp(dir=os.path.dirname(cache_dir),
+                                         prefix=os.path.basename(cache_dir) + '.append-', suffix='.csv')
+        with os.fdopen(fd, 'wb') as tail:
+            tail.write(header)
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+                tail.write(block)
+
+    if chunk_reader is None:
+        chunk_reader = lambda path: pd.read_csv(path, chunksize=500_000)
+    update_no = len(manifest.get('updates', [])) + 1
+    try:
+        _, _, touched, rows = _write_partitioned(chunk_reader(tail_path), cache_dir, partitioner,
+                                                 manifest['partitions'], file_prefix=f'update{update_no:04d}',
+                                                 first_row=manifest['rows'])
+    finally:
+        os.remove(tail_path)
+
+    stat = os.stat(csv_path)
+    manifest.setdefault('updates', []).append({
+        'base_sha256': manifest['sha256'],
+        'sha256': digest.hexdigest(),
+        'partitions': sorted(touched),
+    })
+    manifest.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=digest.hexdigest(),
+                    rows=manifest['rows'] + rows, partitions=dict(sorted(manifest['partitions'].items())))
+    # New part files are in place before the manifest that lists them
+    _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+def _is_current(manifest, stat):
+    return (manifest is not None and manifest.get('version') == CACHE_FORMAT_VERSION
+            and manifest['size'] == stat.st_size and manifest['mtime_ns'] == stat.st_mtime_ns)
+
+
+def ensure_cache(csv_path, chunk_reader=None, partitioner=None):
+    """Returns a fresh manifest for csv_path, (re)building the cache if needed."""
+    cache_dir = cache_dir_for(csv_path)
+    manifest = _read_manifest(cache_dir)
+    if _is_current(manifest, os.stat(csv_path)):
+        return manifest
+
+    with _cache_lock(cache_dir):
+        # Another process may have brought the cache up to date while we waited
+        manifest = _read_manifest(cache_dir)
+        stat = os.stat(csv_path)
+        if _is_current(manifest, stat):
+            return manifest
+
+        if manifest is not None and manifest.get('version') == CACHE_FORMAT_VERSION:
+            if manifest['size'] == stat.st_size:
+                # Touched but possibly unchanged (e.g. a miner re-run writing identical output)
+                if manifest['sha256'] == file_sha256(csv_path):
+                    manifest['mtime_ns'] = stat.st_mtime_ns
+                    _write_manifest(cache_dir, manifest)
+                    return manifest
+            elif manifest['size'] < stat.st_size:
+                updated = _append_update(csv_path, manifest, chunk_reader, partitioner)
+                if updated is not None:
+                    print(f"Appended new rows of {csv_path} to its columnar cache "
+                          f"(partitions {updated['updates'][-1]['partitions']}).")
+                    return updated
+
+        print(f"Building columnar cache for {csv_path}...")
+        return _build_cache(csv_path, cache_dir, chunk_reader, partitioner)
+
+
+def changed_partitions(csv_path, since_sha256):
+    """
+    Partition keys touched by appends since the source had hash since_sha256.
+
+    Returns:
+        set or None: Keys to recompute, or None if since_sha256 predates the
+        current cache build (everything must be recomputed).
+    """
+    manifest = _read_manifest(cache_dir_for(csv_path))
+    return None if manifest is None else _changed_since(manifest, since_sha256)
+
+
+def _changed_since(manifest, since_sha256):
+    changed = set()
+    sha = manifest['sha256']
+    for update in reversed(manifest.get('updates', [])):
+        if sha == since_sha256:
+            return changed
+        changed.update(update['partitions'])
+        sha = update['base_sha256']
+    return changed if sha == since_sha256 else None
+
+
+def update_partition_results(csv_path, name, compute, chunk_reader=None, partitioner=None):
+    """
+    Per-partition results of an analysis, kept beside the cache and
+    recomputed only for partitions changed since they were stored.
+
+    Args:
+        csv_path (str): Source CSV (the cache is keyed on it).
+        name (str): Result set name; include any parameters the results
+                    depend on (e.g. 'sky_maps_0.5deg').
+        compute (callable): f(keys) -> {partition key: picklable result}.
+        chunk_reader, partitioner: Passed to build_cache on a cache miss.
+
+    Returns:
+        (results, recomputed): {partition key: result} for every partition,
+        and the sorted keys computed by this call.
+    """
+    manifest = ensure_cache(csv_path, chunk_reader, partitioner)
+    cache_dir = cache_dir_for(csv_path)
+    path = os.path.join(cache_dir, RESULTS_DIR_NAME, name + '.pkl')
+    try:
+        with open(path, 'rb') as f:
+            stored = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        stored = None
+    changed = None if stored is None else _changed_since(manifest, stored['sha256'])
+    if changed is None:
+        results, recomputed = {}, sorted(entry['key'] for entry in manifest['partitions'].values())
+    else:
+        results, recomputed = stored['results'], sorted(changed)
+    if not recomputed and stored is not None:
+        return results, recomputed
+    results.update(compute(recomputed))
+
+    # Stored against the manifest read before computing: rows appended
+    # meanwhile fall in partitions the next call recomputes anyway
+    with _cache_lock(cache_dir):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=name + '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'sha256': manifest['sha256'], 'results': results}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    return results, recomputed
+
+
+def iter_cached_csv(csv_path, columns=None, filters=None, partitions=None, chunk_reader=None, partitioner=None,
+                    row_numbers=False):
+    """
+    Streams a dataset through its Parquet cache, one cached file at a time.
+    Chunks come partition by partition, so rows are in file order only within
+    each partition; read_cached_csv restores the full file order.
+
+    Args:
+        csv_path (str): Source CSV (the cache is keyed on it).
+        columns (list, optional): Columns to read.
+        filters (list, optional): pyarrow row filters, e.g. [('flag', '==', 0)].
+            Filter columns need not be among `columns`.
+        partitions (iterable, optional): Partition keys to read (default: all).
+        chunk_reader, partitioner: Passed to build_cache on a cache miss.
+        row_numbers (bool): Add ROW_COLUMN, each row's position in the CSV.
+
+    Yields:
+        pd.DataFrame
+    """
+    if pq is None:
+        next_row = 0
+        for chunk in (chunk_reader or (lambda path: pd.read_csv(path, chunksize=500_000)))(csv_path):
+            if row_numbers:
+                chunk = chunk.assign(**{ROW_COLUMN: np.arange(next_row, next_row + len(chunk), dtype=np.int64)})
+                next_row += len(chunk)
+            if filters:
+                for col, op, value in filters:
+                    chunk = chunk[_FILTER_OPS[op](chunk[col], value)]
+            if columns is not None:
+                chunk = chunk[list(columns) + ([ROW_COLUMN] if row_numbers else [])]
+            yield chunk
+        return
+
+    manifest = ensure_cache(csv_path, chunk_reader, partitioner)
+    cache_dir = cache_dir_for(csv_path)
+    wanted = None if partitions is None else {int(p) for p in partitions}
+    columns = list(manifest['columns'] if columns is None else columns) + ([ROW_COLUMN] if row_numbers else [])
+    for label, entry in manifest['partitions'].items():
+        if wanted is not None and entry['key'] not in wanted:
+            continue
+        for file_name in entry['files']:
+            table = pq.read_table(os.path.join(cache_dir, label, file_name), columns=columns, filters=filters)
+            yield table.to_pandas()
+
+
+def read_cached_csv(csv_path, columns=None, filters=None, partitions=None, chunk_reader=None, partitioner=None):
+    """Reads a whole dataset through its Parquet cache into one DataFrame, in file order."""
+    chunks = [c for c in iter_cached_csv(csv_path, columns, filters, partitions, chunk_reader, partitioner,
+                                         row_numbers=True) if len(c)]
+    if not chunks:
+        columns = columns or (_read_manifest(cache_dir_for(csv_path)) or {}).get('columns')
+        return pd.DataFrame(columns=columns)
+    return in_file_order(pd.concat(chunks, ignore_index=True))
+
+
+def in_file_order(df):
+    """Sorts rows read with row_numbers=True back into file order and drops ROW_COLUMN."""
+    order = np.argsort(df[ROW_COLUMN].to_numpy(), kind='stable')
+    return df.drop(columns=ROW_COLUMN).iloc[order].reset_index(drop=True)
+
+
+_FILTER_OPS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+}
@@ -1,19 +1,103 @@
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.signal import find_peaks
+from matplotlib.figure import Figure
+from scipy.signal import find_peaks, peak_prominences
+from dataset_cache import read_cached_csv
+from plot_stage import plot_job, render_plots
+from periodogram import REFERENCE_PERIODS, SIGNIFICANT_FAP, reference_power
+from parallel import worker_state, run_tasks
 
-def detect_temporal_boundaries():
+# Based on Euclid spatial density, we predicted a crossing every ~16 days.
+PREDICTED_INTERVAL = REFERENCE_PERIODS['Euclid lattice prediction']
+
+
+def _sweep_task(params):
+    """Evaluates one (height, distance) pair against every prominence setting."""
+    height, distance = params
+    st = worker_state
+    peaks, _ = find_peaks(st['flux'], height=height, distance=distance)
+    # Prominence depends only on the peak and the series, so it is looked up
+    # from the precomputed table; find_peaks applies it after the distance cut.
+    prom = st['base_prominences'][np.searchsorted(st['base_peaks'], peaks)]
+
+    rows = []
+    for min_prominence in st['prominences']:
+        spike_days = st['days'][peaks[prom >= min_prominence]]
+        intervals = np.diff(spike_days)
+        avg_interval = intervals.mean() if len(intervals) else np.nan
+        rows.append((height, distance, min_prominence, len(spike_days), avg_interval,
+                     abs(avg_interval - st['prediction']) / st['prediction']))
+    return rows
+
+
+def sweep_peak_parameters(flux, days, heights, distances, prominences=(0.0,), prediction=PREDICTED_INTERVAL,
+                          n_workers=None):
+    """
+    Runs the boundary spike detection over a grid of find_peaks settings.
+
+    Args:
+        flux (np.ndarray): Temporal flux series (computed once by the caller).
+        days (np.ndarray): Day of each sample.
+        heights, distances, prominences: Grid values for find_peaks.
+        prediction (float): Predicted crossing interval in days.
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+
+    Returns:
+        pd.DataFrame: One row per setting, sorted by prediction error.
+    """
+    flux = np.asarray(flux, dtype=np.float64)
+    days = np.asarray(days)
+    base_peaks, _ = find_peaks(flux)
+    base_prominences = peak_prominences(flux, base_peaks)[0]
+    tasks = [(h, d) for h in heights for d in distances]
+    shared = {'flux': flux, 'days': days, 'base_peaks': base_peaks, 'base_prominences': base_prominences,
+              'prominences': np.asarray(prominences), 'prediction': prediction}
+    results = run_tasks(_sweep_task, tasks, shared, n_workers, chunksize=None)
+
+    table = pd.DataFrame([row for rows in results for row in rows],
+                         columns=['height', 'distance', 'prominence', 'n_events', 'avg_interval', 'error'])
+    return table.sort_values(['error', 'height', 'distance', 'prominence'], na_position='last', ignore_index=True)
+
+
+def load_temporal_flux(cern_file='cern_b_meson_anomalies.csv'):
+    """Loads the CERN timeline and adds the 'temporal_flux' residual column."""
+    df = read_cached_csv(cern_file)
+    # Calculate the 'Temporal Flux' - deviation from SM baseline
+    df['temporal_flux'] = df['cp_asymmetry_avg'] - df['sm_baseline']
+    return df
+
+
+def run_parameter_sweep(output_file='boundary_crossing_sweep.csv'):
     print("Loading CERN B-meson decay data...")
     cern_file = 'cern_b_meson_anomalies.csv'
     try:
-        df = pd.read_csv(cern_file)
+        df = load_temporal_flux(cern_file)
     except FileNotFoundError:
         print(f"Error: {cern_file} not found.")
         return
 
-    # Calculate the 'Temporal Flux' - deviation from SM baseline
-    df['temporal_flux'] = df['cp_asymmetry_avg'] - df['sm_baseline']
+    heights = np.round(np.arange(0.0005, 0.0051, 0.0005), 6)
+    distances = np.arange(2, 31)
+    prominences = np.round(np.arange(0.0, 0.0061, 0.001), 6)
+    print(f"Sweeping {len(heights) * len(distances) * len(prominences)} find_peaks settings...")
+    table = sweep_peak_parameters(df['temporal_flux'].values, df['day_of_year'].values,
+                                  heights, distances, prominences)
+    table.to_csv(output_file, index=False)
+
+    print("\n--- BEST MATCHES TO PREDICTED INTERVAL ---")
+    print(table.head(10).to_string(index=False))
+    print(f"\nFull sweep table saved to {output_file}")
+
+
+def detect_temporal_boundaries():
+    print("Loading CERN B-meson decay data...")
+    cern_file = 'cern_b_meson_anomalies.csv'
+    try:
+        df = load_temporal_flux(cern_file)
+    except FileNotFoundError:
+        print(f"Error: {cern_file} not found.")
+        return
 
     print("Analyzing Temporal Flux for boundary crossing spikes...")
     
@@ -32,34 +116,55 @@ def detect_temporal_boundaries():
         print(f"Average interval between crossings: {avg_interval:.2f} days")
         
         # PREDICTION CHECK:
-        # Based on Euclid spatial density, we predicted a crossing every ~16 days.
-        prediction = 16.0
+        prediction = PREDICTED_INTERVAL
         error = abs(avg_interval - prediction) / prediction
         
         print(f"Predicted Interval (from Euclid lattice): {prediction:.2f} days")
         print(f"Deviation from prediction: {error*100:.2f}%")
-        
-        if error < 0.15:
+
+        # The spike spacing depends on the find_peaks settings; the periodogram
+        # tests the whole flux series at the predicted period.
+        _, lattice_power, lattice_fap = reference_power(
+            df['day_of_year'].values, df['temporal_flux'].values)['Euclid lattice prediction']
+        print(f"Periodogram power at {prediction:.0f} days: {lattice_power:.4f} "
+              f"(false-alarm probability {lattice_fap:.4f})")
+
+        if error < 0.15 and lattice_fap < SIGNIFICANT_FAP:
             print("\n  *** SPECTACULAR MULTI-SCALE CORRELATION DETECTED ***")
             print("  The frequency of particle-level spikes matches the astronomical lattice density.")
             print("  This provides quantitative proof of a unified 3D Time structure.")
+        elif error < 0.15:
+            print("\n  Spike spacing matches the prediction, but the flux has no significant power at that period.")
         else:
             print("\n  Intervals detected, but do not yet match simple lattice prediction.")
     
     # 3. Visualization
-    plt.figure(figsize=(12, 6))
-    plt.plot(df['day_of_year'], df['temporal_flux'], label='Temporal Flux (Anomaly Residual)', color='lime')
-    plt.scatter(spike_days, df.iloc[peaks]['temporal_flux'], color='red', marker='x', label='Boundary Crossings')
-    plt.axhline(0, color='white', linestyle='--', alpha=0.5)
-    plt.xlabel("Day of Year")
-    plt.ylabel("CP Asymmetry Deviation")
-    plt.title("Temporal Boundary Crossings Detected in CERN Data\nCorrelation with 3D Time Lattice Density")
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    
     output_plot = "2025-11-17_analysis/euclid_plots/temporal_boundary_crossings.png"
-    plt.savefig(output_plot)
+    render_plots([plot_job(render_boundary_crossings, output_plot, days=df['day_of_year'].values,
+                           flux=df['temporal_flux'].values, spike_days=spike_days,
+                           spike_flux=df.iloc[peaks]['temporal_flux'].values)])
     print(f"\nCrossing analysis plot saved to {output_plot}")
 
+
+def render_boundary_crossings(days, flux, spike_days, spike_flux):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.plot(days, flux, label='Temporal Flux (Anomaly Residual)', color='lime')
+    ax.scatter(spike_days, spike_flux, color='red', marker='x', label='Boundary Crossings')
+    ax.axhline(0, color='white', linestyle='--', alpha=0.5)
+    ax.set_xlabel("Day of Year")
+    ax.set_ylabel("CP Asymmetry Deviation")
+    ax.set_title("Temporal Boundary Crossings Detected in CERN Data\nCorrelation with 3D Time Lattice Density")
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    return fig
+
 if __name__ == '__main__':
-    detect_temporal_boundaries()
+    parser = argparse.ArgumentParser(description="Detect temporal boundary crossings in the CERN timeline.")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Evaluate a grid of (height, distance, prominence) settings instead of one run.")
+    args = parser.parse_args()
+    if args.sweep:
+        run_parameter_sweep()
+    else:
+        detect_temporal_boundaries()
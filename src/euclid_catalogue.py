@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import dataset_cache
+from dataset_cache import iter_cached_csv, in_file_order, ROW_COLUMN
+
+# src/euclid_catalogue.py
+#
+# Shared reader for Euclid MER catalogue extracts (euclid_lensing_candidates.csv
+# and the candidate lists derived from it). The file is streamed in chunks with
+# compact dtypes, only the requested columns are parsed, and the detection
+# quality cut is applied while reading, so analyses never hold the raw text
+# table in memory. By default reads go through the columnar cache, which is
+# built from the CSV on first use.
+
+EUCLID_DTYPES = {
+    'object_id': np.int64,
+    # Positions stay float64: float32 would cost ~0.1 arcsec near RA = 360
+    'right_ascension': np.float64,
+    'declination': np.float64,
+    'ellipticity': np.float32,
+    'position_angle': np.float32,
+    'point_like_prob': np.float32,
+    'extended_prob': np.float32,
+    'blended_prob': np.float32,
+    'det_quality_flag': np.uint8,
+}
+
+DEFAULT_CHUNKSIZE = 500_000
+
+
+def iter_euclid_catalogue(file_path, columns=None, chunksize=DEFAULT_CHUNKSIZE, good_quality_only=True,
+                          use_cache=True, partitions=None, row_numbers=False):
+    """
+    Streams a Euclid catalogue as DataFrame chunks. Through the cache, chunks
+    come sky tile by sky tile, not in file order.
+
+    Args:
+        file_path (str): Path to the catalogue CSV.
+        columns (list, optional): Columns to return. Defaults to all columns.
+        chunksize (int): Rows parsed per chunk.
+        good_quality_only (bool): Keep only rows with det_quality_flag == 0.
+        use_cache (bool): Read through the Parquet cache (see dataset_cache)
+                          instead of parsing the CSV text.
+        partitions (iterable, optional): Sky tiles to read (cache only), e.g.
+                          from dataset_cache.changed_partitions().
+        row_numbers (bool): Add dataset_cache.ROW_COLUMN, each row's position
+                          in the CSV.
+
+    Yields:
+        pd.DataFrame: Filtered chunk with compact dtypes.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    wanted = list(header) if columns is None else list(columns)
+    missing = [c for c in wanted if c not in header]
+    if missing:
+        raise ValueError(f"Columns not found in {file_path}: {missing}")
+
+    apply_quality_cut = good_quality_only and 'det_quality_flag' in header
+
+    if use_cache:
+        # The cache holds every row with compact dtypes; the quality cut is a
+        # row filter pushed down into the Parquet read.
+        filters = [('det_quality_flag', '==', 0)] if apply_quality_cut else None
+        reader = lambda path: iter_euclid_catalogue(path, chunksize=chunksize, good_quality_only=False,
+                                                    use_cache=False)
+        yield from iter_cached_csv(file_path, columns=wanted, filters=filters, partitions=partitions,
+                                   chunk_reader=reader, row_numbers=row_numbers)
+        return
+
+    usecols = list(wanted)
+    if apply_quality_cut and 'det_quality_flag' not in usecols:
+        usecols.append('det_quality_flag')
+    dtypes = {c: EUCLID_DTYPES[c] for c in usecols if c in EUCLID_DTYPES}
+
+    if row_numbers:
+        wanted.append(ROW_COLUMN)
+    next_row = 0
+    with pd.read_csv(file_path, usecols=usecols, dtype=dtypes, chunksize=chunksize) as reader:
+        for chunk in reader:
+            if row_numbers:
+                chunk = chunk.assign(**{ROW_COLUMN: np.arange(next_row, next_row + len(chunk), dtype=np.int64)})
+            next_row += len(chunk)
+            if apply_quality_cut:
+                chunk = chunk[chunk['det_quality_flag'] == 0]
+            yield chunk[wanted].reset_index(drop=True)
+
+
+def load_euclid_catalogue(file_path, columns=None, chunksize=DEFAULT_CHUNKSIZE, good_quality_only=True,
+                          use_cache=True, partitions=None):
+    """Reads a whole Euclid catalogue via iter_euclid_catalogue into one DataFrame, in file order."""
+    chunks = [c for c in iter_euclid_catalogue(file_path, columns, chunksize, good_quality_only, use_cache, partitions,
+                                               row_numbers=True) if len(c)]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return in_file_order(pd.concat(chunks, ignore_index=True))
+
+
+def euclid_partitions(file_path):
+    """
+    Sky-tile partition keys of a Euclid catalogue's columnar cache (built on
+    first use), for reading tiles independently via iter_euclid_catalogue.
+
+    Returns:
+        list or None: Partition keys, or None if the cache is unavailable.
+    """
+    if dataset_cache.pq is None:
+        return None
+    manifest = dataset_cache.ensure_cache(file_path, chunk_reader=_cache_reader)
+    return [entry['key'] for entry in manifest['partitions'].values()]
+
+
+def euclid_partition_results(file_path, name, compute):
+    """
+    Per-sky-tile results of an analysis, recomputed only for the tiles that
+    changed since they were stored (see dataset_cache.update_partition_results).
+
+    Args:
+        file_path (str): Path to the catalogue CSV.
+        name (str): Result set name, including the analysis parameters.
+        compute (callable): f(tiles) -> {tile: result}, reading each tile with
+                            iter_euclid_catalogue(..., partitions=[tile]).
+
+    Returns:
+        (results, recomputed) or None if the cache is unavailable.
+    """
+    if dataset_cache.pq is None:
+        return None
+    return dataset_cache.update_partition_results(file_path, name, compute, chunk_reader=_cache_reader)
+
+
+def _cache_reader(path):
+    # The cache holds every row with compact dtypes; reads apply the quality cut
+    return iter_euclid_catalogue(path, good_quality_only=False, use_cache=False)
@@ -10,11 +10,22 @@
 # Before running, ensure you have astroquery installed:
 # pip install astroquery
 
+import os
+import argparse
 from astroquery.esa.euclid import Euclid
+from tap_download import TiledTapDownload
+from euclid_catalogue import load_euclid_catalogue, euclid_partitions
 
-def find_lensing_anomalies():
+def find_lensing_anomalies(tile_deg=10.0, max_workers=4, incremental=False):
     """
     Queries the Euclid Science Archive for anomalous lensing candidates.
+
+    Args:
+        tile_deg (float): Size of the RA/Dec tiles the query is split into.
+        max_workers (int): Number of tiles downloaded concurrently.
+        incremental (bool): Re-page every tile and append only the objects
+                            not yet in the existing output, instead of
+                            rewriting it.
     """
     print("Connecting to Euclid Science Archive...")
 
@@ -57,40 +68,64 @@ def find_lensing_anomalies():
         print("Please check your internet connection and the ESA/Euclid server status.")
         return # Exit if column info cannot be retrieved
 
-    # Now, execute the main ADQL query to find anomalous lensing candidates
-    adql_query = """
-    SELECT
-      object_id, right_ascension, declination, ellipticity, position_angle,
-      point_like_prob, det_quality_flag
-    FROM
-      catalogue.mer_catalogue
-    WHERE
-      det_quality_flag = 0
-    """
-
-    print("Executing ADQL query for anomalous lensing candidates...")
-    print(f"Query: {adql_query}")
-
-    try:
-        print("Launching ADQL job for candidates...")
-        job = Euclid.launch_job(adql_query)
-        print("ADQL job launched. Waiting for candidate results...")
-        candidate_table = job.get_results()
-        print("Candidate results received.")
-
-        if not candidate_table:
-            print("Query executed successfully, but no candidate objects were found with the specified criteria.")
+    # Now, download the anomalous lensing candidates. The query is split into
+    # RA/Dec tiles fetched concurrently and paged by object_id, with progress
+    # checkpointed under work_dir so an interrupted run resumes where it stopped.
+    output_file = "euclid_lensing_candidates.csv"
+    downloader = TiledTapDownload(
+        Euclid,
+        table="catalogue.mer_catalogue",
+        select_columns=["object_id", "right_ascension", "declination", "ellipticity", "position_angle",
+                        "point_like_prob", "det_quality_flag"],
+        where="det_quality_flag = 0",
+        work_dir=output_file + ".tiles",
+        tile_deg=tile_deg,
+        max_workers=max_workers,
+    )
+
+    if incremental and os.path.exists(output_file):
+        # object_id encodes position, not release order, so every tile is re-paged
+        # and only ids missing from the output are appended
+        print(f"Incremental update of {output_file} ({max_workers} workers)...")
+        new_rows, failed = downloader.refresh()
+        if failed:
+            print(f"{len(failed)} tiles failed: {failed}")
+            print("Completed tiles are checkpointed; re-run to resume the remaining tiles.")
+            return
+        existing_ids = load_euclid_catalogue(output_file, columns=["object_id"], good_quality_only=False)["object_id"]
+        appended = downloader.append_new_rows(output_file, existing_ids=existing_ids.to_numpy())
+        if not appended:
+            print("No new candidates since the last update.")
             return
+        print(f"Appended {sum(appended.values())} new candidates to {output_file}.")
+        print(f"Affected sky tiles (recompute these regions only): {sorted(appended)}")
+        print("process_euclid_candidates.py and sky_maps.py with --incremental re-read only these tiles.")
+        # Bring the columnar cache up to date here, once, so analyses started
+        # next (possibly concurrently) all find it current
+        euclid_partitions(output_file)
+        return
+
+    print(f"Downloading anomalous lensing candidates in {tile_deg:g} degree tiles ({max_workers} workers)...")
+    failed = downloader.run()
+    if failed:
+        print(f"{len(failed)} tiles failed: {failed}")
+        print("This could be due to a connection issue, or the archive may not be available.")
+        print("Completed tiles are checkpointed; re-run to resume the remaining tiles.")
+        return
 
-        # Save the results to a local file
-        output_file = "euclid_lensing_candidates.csv"
-        candidate_table.write(output_file, format="csv", overwrite=True)
-        print(f"Success! Found {len(candidate_table)} anomalous lensing candidates. Saved to {output_file}")
+    n_rows = downloader.merge(output_file)
+    if n_rows == 0:
+        print("Query executed successfully, but no candidate objects were found with the specified criteria.")
+        return
+    print(f"Success! Found {n_rows} anomalous lensing candidates. Saved to {output_file}")
+    euclid_partitions(output_file)
 
-    except Exception as e:
-        print(f"An error occurred during the candidate query: {e}")
-        print("This could be due to a connection issue, or the archive may not be available.")
-        print("Please check your internet connection and the ESA/Euclid server status.")
 
 if __name__ == "__main__":
-    find_lensing_anomalies()
+    parser = argparse.ArgumentParser(description="Download Euclid anomalous lensing candidates.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Fetch only new objects and append them to euclid_lensing_candidates.csv.")
+    parser.add_argument("--tile_deg", type=float, default=10.0, help="RA/Dec tile size in degrees.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of tiles downloaded concurrently.")
+    args = parser.parse_args()
+    find_lensing_anomalies(tile_deg=args.tile_deg, max_workers=args.workers, incremental=args.incremental)
@@ -1,7 +1,8 @@
-import pandas as pd
 import numpy as np
-import json
 import os
+from euclid_catalogue import load_euclid_catalogue
+from dataset_cache import read_cached_csv
+from galaxy_export import write_chunked_export
 
 def ra_dec_to_cartesian(ra_deg, dec_deg, distance=100):
     # Convert RA and Dec from degrees to radians
@@ -15,71 +16,91 @@ def ra_dec_to_cartesian(ra_deg, dec_deg, distance=100):
     
     return x, y, z
 
-def extract_galaxies():
-    galaxies = []
+# One entry per source; the list index is the category stored per point as
+# uint8 and `name` is its chunk directory in the export. distance = (mean,
+# sigma) of the radial depth jitter, size = uniform (low, high) point size.
+SOURCES = [
+    # Blueish for Euclid (full catalogue; the viewer streams level-of-detail chunks)
+    {'name': 'euclid', 'file': 'euclid_lensing_candidates.csv', 'ra': 'right_ascension', 'dec': 'declination',
+     'color': '#88ccff', 'label': 'Euclid General Survey', 'distance': (100, 20), 'size': (0.5, 1.5)},
+    # Reddish for early universe, put them further away
+    {'name': 'jwst', 'file': 'jwst_early_universe_candidates.csv', 'ra': 'ra', 'dec': 'dec',
+     'color': '#ff4444', 'label': 'JWST Early Universe', 'distance': (300, 50), 'size': (2.0, 4.0)},
+    # Yellow/gold for time domain anomalies
+    {'name': 'rubin', 'file': 'rubin_time_domain_candidates.csv', 'ra': 'ra', 'dec': 'dec',
+     'color': '#ffcc00', 'label': 'Rubin Time-Domain Anomalies', 'distance': (50, 10), 'size': (1.5, 3.0)},
+]
+EUCLID, JWST, RUBIN = 0, 1, 2
+
+
+def load_source_coordinates(path, source):
+    """Reads just the RA/Dec columns of one source file as float64 arrays."""
+    columns = [source['ra'], source['dec']]
+    if source['ra'] == 'right_ascension':
+        df = load_euclid_catalogue(path, columns=columns)
+    else:
+        df = read_cached_csv(path, columns=columns)
+    return df[source['ra']].to_numpy(np.float64), df[source['dec']].to_numpy(np.float64)
+
+
+def transform_sources(ra, dec, categories, seed=0):
+    """
+    Batched sky -> viewer transform for points from any mix of sources.
+
+    Depth jitter and sizes are drawn in bulk from one seeded Generator, with
+    each point's parameters looked up from SOURCES by its category, so the
+    export is reproducible for a given seed.
+
+    Args:
+        ra, dec (np.ndarray): Coordinates in degrees, shape (n,).
+        categories (np.ndarray): Index into SOURCES per point, shape (n,).
+        seed (int or sequence): Seed for the depth jitter and sizes.
+
+    Returns:
+        (positions, sizes): float32 arrays of shape (n, 3) and (n,).
+    """
+    categories = np.asarray(categories, dtype=np.intp)
+    distance_mean, distance_sigma = np.array([s['distance'] for s in SOURCES], dtype=np.float64).T
+    size_low, size_high = np.array([s['size'] for s in SOURCES], dtype=np.float64).T
+
+    rng = np.random.default_rng(seed)
+    n = len(categories)
+    # Add some variability to distance for 3D depth
+    distance = distance_mean[categories] + distance_sigma[categories] * rng.standard_normal(n)
+    sizes = size_low[categories] + (size_high - size_low)[categories] * rng.random(n)
+
+    x, y, z = ra_dec_to_cartesian(ra, dec, distance)
+    return np.column_stack((x, y, z)).astype(np.float32), sizes.astype(np.float32)
+
+
+def extract_galaxies(seed=0):
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
-    # 1. Euclid Data (Sample a subset to avoid rendering millions of points and lagging the browser)
-    euclid_file = os.path.join(base_dir, 'euclid_lensing_candidates.csv')
-    if os.path.exists(euclid_file):
-        print(f"Loading {euclid_file}...")
-        df_euclid = pd.read_csv(euclid_file)
-        # Sample 5000 galaxies for performance
-        df_sampled = df_euclid.sample(n=min(5000, len(df_euclid)), random_state=42)
-        for _, row in df_sampled.iterrows():
-            ra = row.get('right_ascension', 0)
-            dec = row.get('declination', 0)
-            # Add some variability to distance for 3D depth
-            dist = 100 + np.random.normal(0, 20)
-            x, y, z = ra_dec_to_cartesian(ra, dec, dist)
-            galaxies.append({
-                'x': x, 'y': y, 'z': z,
-                'color': '#88ccff', # Blueish for Euclid
-                'size': np.random.uniform(0.5, 1.5)
-            })
-
-    # 2. JWST Data
-    jwst_file = os.path.join(base_dir, 'jwst_early_universe_candidates.csv')
-    if os.path.exists(jwst_file):
-        print(f"Loading {jwst_file}...")
-        df_jwst = pd.read_csv(jwst_file)
-        for _, row in df_jwst.iterrows():
-            ra = row.get('ra', 0)
-            dec = row.get('dec', 0)
-            # JWST early universe, put them further away
-            dist = 300 + np.random.normal(0, 50)
-            x, y, z = ra_dec_to_cartesian(ra, dec, dist)
-            galaxies.append({
-                'x': x, 'y': y, 'z': z,
-                'color': '#ff4444', # Reddish for early universe
-                'size': np.random.uniform(2.0, 4.0)
-            })
-
-    # 3. Rubin Data
-    rubin_file = os.path.join(base_dir, 'rubin_time_domain_candidates.csv')
-    if os.path.exists(rubin_file):
-        print(f"Loading {rubin_file}...")
-        df_rubin = pd.read_csv(rubin_file)
-        for _, row in df_rubin.iterrows():
-            ra = row.get('ra', 0)
-            dec = row.get('dec', 0)
-            dist = 50 + np.random.normal(0, 10)
-            x, y, z = ra_dec_to_cartesian(ra, dec, dist)
-            galaxies.append({
-                'x': x, 'y': y, 'z': z,
-                'color': '#ffcc00', # Yellow/gold for time domain anomalies
-                'size': np.random.uniform(1.5, 3.0)
-            })
+
+    # One chunk per source file, seeded per source so a chunk only changes
+    # when its own source (or its settings) does.
+    chunks = []
+    for category, source in enumerate(SOURCES):
+        path = os.path.join(base_dir, source['file'])
+        if not os.path.exists(path):
+            continue
+
+        def build(path=path, source=source, category=category):
+            print(f"Loading {path}...")
+            ra, dec = load_source_coordinates(path, source)
+            categories = np.full(len(ra), category, dtype=np.uint8)
+            positions, sizes = transform_sources(ra, dec, categories, seed=(seed, category))
+            return positions, sizes, categories
+
+        chunks.append({'name': source['name'], 'source_file': path, 'build': build,
+                       'params': {'source': source, 'category': category, 'seed': seed}})
 
     # Define the output directory (public folder of the React app)
-    output_dir = os.path.join(base_dir, 'lattice_3d_viz', 'public')
-    os.makedirs(output_dir, exist_ok=True)
-    output_file = os.path.join(output_dir, 'galaxies.json')
-    
-    with open(output_file, 'w') as f:
-        json.dump(galaxies, f)
-        
-    print(f"Successfully extracted {len(galaxies)} galaxies to {output_file}")
+    output_dir = os.path.join(base_dir, 'lattice_3d_viz', 'public', 'galaxies')
+    manifest, rebuilt = write_chunked_export(output_dir, chunks, palette=[s['color'] for s in SOURCES],
+                                             labels=[s['label'] for s in SOURCES])
+
+    print(f"Successfully extracted {manifest['count']} galaxies to {output_dir} "
+          f"({len(manifest['chunks'])} source chunks, regenerated: {', '.join(rebuilt) or 'none'})")
 
 if __name__ == '__main__':
     extract_galaxies()
@@ -0,0 +1,243 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from dataset_cache import file_sha256
+
+# src/galaxy_export.py
+#
+# Binary, level-of-detail point export for the 3D viewer (lattice_3d_viz).
+# Points are assigned to octree levels: at each depth every occupied octree
+# node keeps up to `capacity` randomly chosen points and passes the rest down,
+# so level 0 is a coarse sample of the whole sky and each further level adds
+# detail everywhere. Each level is one file of packed little-endian arrays
+# (structure of arrays, 4-byte aligned so the browser can view them directly):
+#
+#     float32 positions[count * 3] | float32 sizes[count] | uint8 categories[count]
+#
+# and manifest.json lists the levels, point counts, bounds and the category
+# palette. GalaxyField.tsx fetches levels in order until its point budget.
+#
+# write_chunked_export() splits the export into one such level set per source
+# file (output_dir/<chunk>/level_XX.bin) and only rebuilds chunks whose source
+# content hash or parameters changed. The top-level manifest gives each chunk a
+# revision, which the viewer appends to chunk URLs so unchanged chunks are
+# served from the browser cache after a refresh.
+
+EXPORT_FORMAT_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+
+def _morton_codes(positions, depth):
+    """Interleaves quantized x/y/z bits into octree (Morton) codes of `depth` levels."""
+    lo = positions.min(axis=0)
+    extent = float((positions.max(axis=0) - lo).max()) or 1.0
+    cells = 1 << depth
+    q = np.clip(((positions - lo) / extent * cells).astype(np.int64), 0, cells - 1)
+    codes = np.zeros(len(positions), dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((q[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def assign_lod_levels(positions, capacity=20_000, max_depth=7, seed=0):
+    """
+    Assigns each point an octree level of detail.
+
+    Args:
+        positions (np.ndarray): (n, 3) coordinates.
+        capacity (int): Maximum points kept per octree node at each level.
+        max_depth (int): Deepest level; leftover points all land here. The
+            packed sort keys need 3 * max_depth + log2(n) + 4 <= 63 bits.
+        seed (int): Seed for the random point priority within nodes.
+
+    Returns:
+        (levels, codes, priority): uint8 level per point, Morton codes at
+        max_depth (for spatial ordering within a level) and the priority used.
+    """
+    n = len(positions)
+    codes = _morton_codes(np.asarray(positions, dtype=np.float64), max_depth)
+    priority = np.random.default_rng(seed).permutation(n)
+    levels = np.full(n, max_depth, dtype=np.uint8)
+
+    # Sorting one packed int64 key (node, priority) is much faster than lexsort
+    priority_bits = max(1, int(n - 1).bit_length())
+    remaining = np.arange(n)
+    for depth in range(max_depth):
+        if not len(remaining):
+            break
+        node = codes[remaining] >> (3 * (max_depth - depth))
+        order = np.argsort((node << priority_bits) | priority[remaining])
+        node_sorted = node[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(node_sorted)) + 1]
+        group_start = np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        # Rank of each point within its node, by priority
+        rank = np.arange(len(order)) - group_start
+        taken = order[rank < capacity]
+        levels[remaining[taken]] = depth
+        keep = np.ones(len(remaining), dtype=bool)
+        keep[taken] = False
+        remaining = remaining[keep]
+    return levels, codes, priority
+
+
+def write_lod_export(output_dir, positions, sizes, categories, palette, labels=None, capacity=20_000,
+                     max_depth=7, seed=0):
+    """
+    Writes the level-of-detail binary export and its manifest.
+
+    Args:
+        output_dir (str): Directory for level_XX.bin files and manifest.json.
+        positions (np.ndarray): (n, 3) float coordinates.
+        sizes (np.ndarray): (n,) point sizes.
+        categories (np.ndarray): (n,) uint8 indices into `palette`.
+        palette (list): Hex colour per category.
+        labels (list, optional): Display name per category.
+
+    Returns:
+        dict: The written manifest.
+    """
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+    sizes = np.asarray(sizes, dtype=np.float32)
+    categories = np.asarray(categories, dtype=np.uint8)
+    os.makedirs(output_dir, exist_ok=True)
+
+    levels_meta = []
+    if len(positions):
+        levels, codes, priority = assign_lod_levels(positions, capacity, max_depth, seed)
+        # Group by level, then spatially (Morton order) within each level
+        priority_bits = max(1, int(len(positions) - 1).bit_length())
+        order = np.argsort((((levels.astype(np.int64) << (3 * max_depth)) | codes) << priority_bits) | priority)
+        level_sorted = levels[order]
+        bounds = np.searchsorted(level_sorted, np.arange(max_depth + 2))
+        for level in range(max_depth + 1):
+            idx = order[bounds[level]:bounds[level + 1]]
+            if not len(idx):
+                continue
+            file_name = f'level_{level:02d}.bin'
+            with open(os.path.join(output_dir, file_name + '.tmp'), 'wb') as f:
+                f.write(positions[idx].astype('<f4').tobytes())
+                f.write(sizes[idx].astype('<f4').tobytes())
+                f.write(categories[idx].tobytes())
+            os.replace(os.path.join(output_dir, file_name + '.tmp'), os.path.join(output_dir, file_name))
+            levels_meta.append({'level': level, 'file': file_name, 'count': int(len(idx))})
+
+    # Drop level files left over from a previous, deeper export
+    written = {m['file'] for m in levels_meta}
+    for name in os.listdir(output_dir):
+        if name.startswith('level_') and name.endswith('.bin') and name not in written:
+            os.remove(os.path.join(output_dir, name))
+
+    manifest = {
+        'version': EXPORT_FORMAT_VERSION,
+        'count': int(len(positions)),
+        'bounds': ([positions.min(axis=0).tolist(), positions.max(axis=0).tolist()] if len(positions) else None),
+        'palette': list(palette),
+        'labels': list(labels) if labels is not None else None,
+        'layout': ['position:float32x3', 'size:float32', 'category:uint8'],
+        'levels': levels_meta,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def _chunk_revision(sha256, params):
+    key = json.dumps({'sha256': sha256, 'params': params, 'version': EXPORT_FORMAT_VERSION}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def _reusable_chunk(output_dir, previous, source_file, params):
+    """Previous manifest entry for a chunk if its source and parameters are unchanged, else None."""
+    if previous is None or previous.get('params') != params:
+        return None
+    if not os.path.exists(os.path.join(output_dir, previous['name'], MANIFEST_NAME)):
+        return None
+    stat = os.stat(source_file)
+    source = previous['source']
+    if source['size'] != stat.st_size:
+        return None
+    if source['mtime_ns'] != stat.st_mtime_ns:
+        # Touched but possibly unchanged (e.g. a miner re-run writing identical output)
+        if source['sha256'] != file_sha256(source_file):
+            return None
+        source['mtime_ns'] = stat.st_mtime_ns
+    return previous
+
+
+def write_chunked_export(output_dir, chunks, palette, labels=None, capacity=20_000, max_depth=7):
+    """
+    Incremental export with one level-of-detail chunk per source file.
+
+    Args:
+        output_dir (str): Export directory; chunk k is written to output_dir/<name>/.
+        chunks (list): Dicts with 'name', 'source_file', 'params' (JSON-serialisable
+            settings that affect the output) and 'build', a callable returning
+            (positions, sizes, categories) for that source.
+        palette (list): Hex colour per category.
+        labels (list, optional): Display name per category.
+
+    Returns:
+        (manifest, rebuilt): The written top-level manifest and the names of
+        the chunks that were regenerated.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            old = json.load(f)
+        if old.get('version') == EXPORT_FORMAT_VERSION:
+            previous = {c['name']: c for c in old.get('chunks', [])}
+
+    entries, rebuilt = [], []
+    for chunk in chunks:
+        name = chunk['name']
+        # Normalise through JSON (tuples -> lists) so params compare equal to the stored copy
+        params = json.loads(json.dumps(chunk['params']))
+        entry = _reusable_chunk(output_dir, previous.get(name), chunk['source_file'], params)
+        if entry is None:
+            stat = os.stat(chunk['source_file'])
+            sha256 = file_sha256(chunk['source_file'])
+            positions, sizes, categories = chunk['build']()
+            lod = write_lod_export(os.path.join(output_dir, name), positions, sizes, categories, palette, labels,
+                                   capacity, max_depth, seed=0)
+            entry = {
+                'name': name,
+                'source': {'file': os.path.basename(chunk['source_file']), 'size': stat.st_size,
+                           'mtime_ns': stat.st_mtime_ns, 'sha256': sha256},
+                'params': params,
+                'revision': _chunk_revision(sha256, params),
+                'count': lod['count'],
+                'bounds': lod['bounds'],
+                'levels': [dict(level, file=f"{name}/{level['file']}") for level in lod['levels']],
+            }
+            rebuilt.append(name)
+        entries.append(entry)
+
+    # Drop chunks of sources that are gone and files of the single-set layout
+    current = {e['name'] for e in entries}
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if os.path.isdir(path) and name not in current and os.path.exists(os.path.join(path, MANIFEST_NAME)):
+            shutil.rmtree(path)
+        elif name.startswith('level_') and name.endswith('.bin'):
+            os.remove(path)
+
+    bounds = [e['bounds'] for e in entries if e['bounds']]
+    manifest = {
+        'version': EXPORT_FORMAT_VERSION,
+        'count': sum(e['count'] for e in entries),
+        'bounds': ([np.min([b[0] for b in bounds], axis=0).tolist(),
+                    np.max([b[1] for b in bounds], axis=0).tolist()] if bounds else None),
+        'palette': list(palette),
+        'labels': list(labels) if labels is not None else None,
+        'layout': ['position:float32x3', 'size:float32', 'category:uint8'],
+        'chunks': entries,
+    }
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest, rebuilt
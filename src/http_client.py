@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# src/http_client.py
+#
+# Shared HTTP layer for the data fetchers and miners. One pooled
+# requests.Session per process, with timeouts on every request and bounded
+# retries (exponential backoff, honouring Retry-After) for connection errors
+# and 429/5xx responses. GET responses are cached on disk with their ETag and
+# Last-Modified validators; the next request for the same URL is conditional
+# (If-None-Match / If-Modified-Since), so a "has it changed?" check costs a
+# 304 with no body. Base URLs are plain arguments everywhere, so a local stub
+# server can stand in for the real services.
+
+HTTP_CACHE_DIR = '.http_cache'
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+USER_AGENT = 'three-dimensional-time-miners/1.0'
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def make_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_maxsize=10):
+    """A Session with connection pooling and retries on idempotent requests."""
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff,
+                  status_forcelist=RETRY_STATUSES, allowed_methods=frozenset({'GET', 'HEAD'}),
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+class CachedHttpClient:
+    """
+    GET with an on-disk cache revalidated by conditional requests.
+
+    Cache layout (cache_dir):
+        <sha256(url)>.json    url, etag, last_modified, body sha256, fetched_at
+        <sha256(url)>.body    last response body
+    """
+
+    def __init__(self, cache_dir=HTTP_CACHE_DIR, session=None, timeout=DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.session = session or make_session()
+        self.timeout = timeout
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + '.json'), os.path.join(self.cache_dir, key + '.body')
+
+    def cached(self, url):
+        """(metadata, body) of the cached response for url, or (None, None)."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        # A crash between the two writes leaves a body that the metadata does not describe
+        if hashlib.sha256(body).hexdigest() != meta.get('sha256'):
+            return None, None
+        return meta, body
+
+    def _store(self, url, response, body_sha256):
+        meta_path, body_path = self._paths(url)
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha256': body_sha256,
+            'fetched_at': time.time(),
+        }
+        for path, data, mode in ((body_path, response.content, 'wb'), (meta_path, json.dumps(meta), 'w')):
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return meta
+
+    def fetch(self, url, headers=None):
+        """
+        GETs url, revalidating any cached copy.
+
+        Returns:
+            dict with 'url', 'status' (200, or 304 when the cached copy was
+            still valid), 'content' (bytes), 'changed' (body differs from the
+            previously cached one, True on first fetch), 'etag' and
+            'from_cache'.
+
+        Raises:
+            requests.RequestException: On network errors or an HTTP error
+            status once retries are exhausted.
+        """
+        meta, body = self.cached(url)
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=request_headers, timeout=self.timeout)
+        if response.status_code == 304 and meta is not None:
+            return {'url': url, 'status': 304, 'content': body, 'changed': False, 'etag': meta.get('etag'),
+                    'from_cache': True}
+        response.raise_for_status()
+
+        body_sha256 = hashlib.sha256(response.content).hexdigest()
+        stored = self._store(url, response, body_sha256)
+        return {'url': url, 'status': response.status_code, 'content': response.content,
+                'changed': meta is None or meta.get('sha256') != body_sha256, 'etag': stored['etag'],
+                'from_cache': False}
+
+    def fetch_json(self, url, headers=None):
+        """(decoded JSON, changed) for url, via fetch()."""
+        result = self.fetch(url, headers)
+        return json.loads(result['content']), result['changed']
+
+
+def get_client():
+    """The process-wide client (one pooled session and cache directory)."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = CachedHttpClient()
+        return _default_client
@@ -1,74 +1,262 @@
+import os
+import json
 import pandas as pd
 import numpy as np
 import datetime
 from datetime import timedelta
 
+# 1. Calibration Constants (Derived from Feb 20, 2026 Analysis)
+t0_day_of_year = 40.0  # Peak anomaly date (Feb 9)
+lattice_period = 29.33 # Confirmed Lattice Period
+moon_period = 29.53    # Synodic Month
+
+# Continuous time origin: day t0_day_of_year of the calibration year. Using
+# elapsed days from a fixed epoch (instead of tm_yday) keeps the phase
+# continuous across year rollovers.
+CALIBRATION_YEAR = 2026
+LUNAR_MODULATION = 0.1    # 10% lunar influence
+BOUNDARY_THRESHOLD = 0.2  # |Psi| below this = boundary crossing
+DEEP_CELL_THRESHOLD = 0.8 # |Psi| above this = deep cell stability
+
+STATUS_STABLE, STATUS_BOUNDARY, STATUS_DEEP_CELL = 0, 1, 2
+STATUS_LABELS = ["STABLE", "*** BOUNDARY CROSSING ***", "Deep Cell Stability"]
+
+PREDICTION_DTYPE = np.dtype([('time', 'datetime64[s]'), ('phase', 'f8'), ('psi', 'f8'), ('status', 'u1')])
+CROSSING_DTYPE = np.dtype([('time', 'datetime64[s]'), ('window_start', 'datetime64[s]'),
+                           ('window_end', 'datetime64[s]')])
+
+
+def lattice_epoch(t0=t0_day_of_year):
+    """Epoch (datetime64) of zero lattice phase in the calibration year."""
+    return np.datetime64(f'{CALIBRATION_YEAR}-01-01', 's') + np.timedelta64(int(round((t0 - 1) * 86400)), 's')
+
+
+def _to_datetime64(t):
+    return np.asarray(t, dtype='datetime64[s]')
+
+
+def days_since_epoch(times, t0=t0_day_of_year):
+    """Fractional days elapsed since the lattice epoch for datetime-like input."""
+    return (_to_datetime64(times) - lattice_epoch(t0)) / np.timedelta64(1, 'D')
+
+
+def lattice_psi(days, period=lattice_period, lunar_period=moon_period):
+    """
+    Stability factor for elapsed days since the epoch (array in, array out).
+
+    Psi = 1.0 (Deep in Cell, Max Stability), 0.0 (Boundary Crossing, Max
+    Volatility), -1.0 (Deep in Anti-Cell, Max Stability), modulated by the
+    lunar phase.
+
+    Returns:
+        (phase, psi_modulated): lattice phase in [0, 2pi) and modulated Psi.
+    """
+    days = np.asarray(days, dtype=np.float64)
+    phase = 2 * np.pi * days / period
+    lunar_phase = 2 * np.pi * days / lunar_period
+    psi_modulated = np.cos(phase) * (1 + LUNAR_MODULATION * np.cos(lunar_phase))
+    return np.mod(phase, 2 * np.pi), psi_modulated
+
+
+def classify_psi(psi):
+    """Status codes (STATUS_*) for an array of Psi values."""
+    abs_psi = np.abs(psi)
+    status = np.full(abs_psi.shape, STATUS_STABLE, dtype=np.uint8)
+    status[abs_psi > DEEP_CELL_THRESHOLD] = STATUS_DEEP_CELL
+    status[abs_psi < BOUNDARY_THRESHOLD] = STATUS_BOUNDARY
+    return status
+
+
+def predict_lattice(start, end, step_hours=24.0, t0=t0_day_of_year, period=lattice_period,
+                    lunar_period=moon_period):
+    """
+    Evaluates the lattice over [start, end) at a fixed step in one NumPy pass.
+
+    Args:
+        start, end: Anything np.datetime64 accepts (date, datetime, ISO string).
+        step_hours (float): Sampling step; may be sub-daily.
+
+    Returns:
+        np.ndarray: Structured array of PREDICTION_DTYPE (time, phase, psi, status).
+    """
+    step = np.timedelta64(int(round(step_hours * 3600)), 's')
+    times = np.arange(_to_datetime64(start), _to_datetime64(end), step)
+    phase, psi = lattice_psi(days_since_epoch(times, t0), period, lunar_period)
+
+    result = np.empty(len(times), dtype=PREDICTION_DTYPE)
+    result['time'] = times
+    result['phase'] = phase
+    result['psi'] = psi
+    result['status'] = classify_psi(psi)
+    return result
+
+
+def find_boundary_crossings(start, end, t0=t0_day_of_year, period=lattice_period, lunar_period=moon_period,
+                            iterations=40):
+    """
+    Finds every boundary crossing in [start, end) without sampling.
+
+    The lunar factor (1 + 0.1 cos) never vanishes, so Psi = 0 exactly where
+    cos(phase) = 0, i.e. at days = period * (1/4 + k/2). The edges of each
+    |Psi| < BOUNDARY_THRESHOLD window are then located by vectorized bisection
+    within the quarter period either side of the zero, where |cos(phase)| is
+    monotonic.
+
+    Returns:
+        np.ndarray: Structured array of CROSSING_DTYPE (time, window_start, window_end).
+    """
+    d0, d1 = days_since_epoch([start, end], t0)
+    k = np.arange(np.ceil(d0 / (period / 2) - 0.5), np.ceil(d1 / (period / 2) - 0.5))
+    zeros = period * (0.25 + k / 2)
+
+    def excess(days):
+        return np.abs(lattice_psi(days, period, lunar_period)[1]) - BOUNDARY_THRESHOLD
+
+    def bisect(inside, outside):
+        # excess(inside) < 0 <= excess(outside)
+        for _ in range(iterations):
+            mid = (inside + outside) / 2
+            is_inside = excess(mid) < 0
+            inside = np.where(is_inside, mid, inside)
+            outside = np.where(is_inside, outside, mid)
+        return (inside + outside) / 2
+
+    quarter = period / 4
+    window_start = bisect(zeros.copy(), zeros - quarter)
+    window_end = bisect(zeros.copy(), zeros + quarter)
+
+    epoch = lattice_epoch(t0)
+    to_time = lambda days: epoch + np.round(days * 86400).astype('timedelta64[s]')
+    result = np.empty(len(zeros), dtype=CROSSING_DTYPE)
+    result['time'] = to_time(zeros)
+    result['window_start'] = to_time(window_start)
+    result['window_end'] = to_time(window_end)
+    return result
+
+
+INDEX_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          '.dataset_cache', 'lattice_crossings.npz')
+
+
+class CrossingIndex:
+    """
+    Sorted, persisted table of boundary crossings for fast lookups.
+
+    The index is keyed on the calibration constants; it is loaded from
+    INDEX_FILE when the key matches and covers the requested dates, and
+    otherwise rebuilt (lazily, on first query) with find_boundary_crossings.
+    Queries are binary searches (np.searchsorted) over the crossing times.
+    """
+
+    def __init__(self, path=INDEX_FILE, t0=t0_day_of_year, period=lattice_period, lunar_period=moon_period,
+                 start_year=1900, end_year=2200):
+        self.path = path
+        self.t0 = t0
+        self.period = period
+        self.lunar_period = lunar_period
+        self.start = np.datetime64(f'{start_year}-01-01', 's')
+        self.end = np.datetime64(f'{end_year}-01-01', 's')
+        self._crossings = None
+
+    def key(self):
+        return {'t0_day_of_year': self.t0, 'lattice_period': self.period, 'moon_period': self.lunar_period,
+                'lunar_modulation': LUNAR_MODULATION, 'boundary_threshold': BOUNDARY_THRESHOLD,
+                'calibration_year': CALIBRATION_YEAR}
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                if json.loads(str(data['key'])) != self.key():
+                    return None
+                start, end = data['coverage'].astype('datetime64[s]')
+                if start > self.start or end < self.end:
+                    return None
+                self.start, self.end = start, end
+                crossings = np.empty(len(data['time']), dtype=CROSSING_DTYPE)
+                for field in CROSSING_DTYPE.names:
+                    crossings[field] = data[field].astype('datetime64[s]')
+                return crossings
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+    def _build(self):
+        print(f"Building boundary crossing index {self.start} to {self.end}...")
+        crossings = find_boundary_crossings(self.start, self.end, self.t0, self.period, self.lunar_period)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, key=json.dumps(self.key(), sort_keys=True),
+                 coverage=np.array([self.start, self.end]).astype(np.int64),
+                 **{field: crossings[field].astype(np.int64) for field in CROSSING_DTYPE.names})
+        os.replace(tmp, self.path)
+        return crossings
+
+    def _ensure(self, *times):
+        times = [_to_datetime64(t) for t in times]
+        if self._crossings is not None and all(self.start <= t < self.end for t in times):
+            return self._crossings
+        # Widen coverage to include the query, keeping a century of margin
+        for t in times:
+            if t < self.start:
+                self.start = t.astype('datetime64[Y]').astype('datetime64[s]') - np.timedelta64(36525, 'D')
+            if t >= self.end:
+                self.end = t.astype('datetime64[Y]').astype('datetime64[s]') + np.timedelta64(36525, 'D')
+        self._crossings = self._load()
+        if self._crossings is None:
+            self._crossings = self._build()
+        return self._crossings
+
+    def next_crossing(self, after):
+        """First crossing whose boundary zero is at or after `after`, or None."""
+        # Cover at least one full period past `after` so a crossing exists if Psi reaches the threshold at all
+        crossings = self._ensure(after, _to_datetime64(after) + np.timedelta64(int(self.period * 86400), 's'))
+        i = np.searchsorted(crossings['time'], _to_datetime64(after), side='left')
+        return crossings[i] if i < len(crossings) else None
+
+    def crossings_between(self, start, end):
+        """All crossings with their boundary zero in [start, end)."""
+        crossings = self._ensure(start, end)
+        lo, hi = np.searchsorted(crossings['time'], [_to_datetime64(start), _to_datetime64(end)], side='left')
+        return crossings[lo:hi]
+
+    def crossing_at(self, when):
+        """The crossing whose |Psi| < threshold window contains `when`, or None."""
+        crossings = self._ensure(when)
+        when = _to_datetime64(when)
+        # Windows are disjoint and ordered, so only the first window ending
+        # after `when` can contain it.
+        i = np.searchsorted(crossings['window_end'], when, side='right')
+        if i < len(crossings) and crossings['window_start'][i] <= when:
+            return crossings[i]
+        return None
+
+
 def predict_temporal_lattice_position():
     print("--- 3D TIME LATTICE PREDICTOR ---")
-    
-    # 1. Calibration Constants (Derived from Feb 20, 2026 Analysis)
-    t0_day_of_year = 40.0  # Peak anomaly date (Feb 9)
-    lattice_period = 29.33 # Confirmed Lattice Period
-    moon_period = 29.53    # Synodic Month
-    
+
     # Get today's date
     today = datetime.date.today()
     print(f"Current Date: {today}")
-    
+
     # Generate predictions for the next 60 days
     print("\nPredicting Temporal Stability for the next 60 days...")
     print(f"{'Date':<15} | {'Lattice Phase':<15} | {'Stability (Psi)':<15} | {'Status':<20}")
     print("-" * 75)
-    
-    predictions = []
-    
-    for i in range(60):
-        target_date = today + timedelta(days=i)
-        day_of_year = target_date.timetuple().tm_yday
-        
-        # Adjust day_of_year for year rollover if needed (simple approximation for now)
-        # Assuming we stay within the same year cycle for this short prediction
-        
-        # Calculate Lattice Phase (0 to 2pi)
-        # We use a cosine wave where Peak = Center of Cell (Stable)
-        # Zero crossing = Boundary (Unstable)
-        phase = 2 * np.pi * (day_of_year - t0_day_of_year) / lattice_period
-        
-        # Calculate Stability Factor (Psi)
-        # Psi = 1.0 (Deep in Cell, Max Stability)
-        # Psi = 0.0 (Boundary Crossing, Max Volatility)
-        # Psi = -1.0 (Deep in Anti-Cell, Max Stability)
-        psi = np.cos(phase)
-        
-        # Lunar Modulation (10% influence)
-        lunar_phase = 2 * np.pi * (day_of_year - t0_day_of_year) / moon_period
-        psi_modulated = psi * (1 + 0.1 * np.cos(lunar_phase))
-        
-        # Interpret Status
-        status = "STABLE"
-        if abs(psi_modulated) < 0.2:
-            status = "*** BOUNDARY CROSSING ***"
-        elif abs(psi_modulated) > 0.8:
-            status = "Deep Cell Stability"
-            
-        print(f"{target_date} | {phase%(2*np.pi):.2f} rad       | {psi_modulated:.4f}          | {status}")
-        
-        predictions.append({
-            'date': target_date,
-            'psi': psi_modulated,
-            'status': status
-        })
-
-    # Find next critical crossing
-    next_crossing = None
-    for p in predictions:
-        if "***" in p['status']:
-            next_crossing = p['date']
-            break
-            
-    if next_crossing:
-        print(f"\n[ALERT] Next Critical Temporal Boundary Crossing: {next_crossing}")
-        print("Expect heightened particle decay anomalies and gravitational lensing fluctuations.")
+
+    predictions = predict_lattice(today, today + timedelta(days=60))
+    lines = [f"{p['time'].astype('datetime64[D]')} | {p['phase']:.2f} rad       | {p['psi']:.4f}          | "
+             f"{STATUS_LABELS[p['status']]}" for p in predictions]
+    print("\n".join(lines))
+
+    # Find next critical crossing: a lookup in the persisted crossing index
+    now = np.datetime64(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None), 's')
+    crossing = CrossingIndex().next_crossing(now)
+    if crossing is None:
+        print("\nNo boundary crossing is predicted: |Psi| never falls below the boundary threshold.")
+        return
+    print(f"\n[ALERT] Next Critical Temporal Boundary Crossing: {crossing['time'].astype('datetime64[D]')}")
+    print(f"Boundary zero at {crossing['time']} UTC "
+          f"(window {crossing['window_start']} to {crossing['window_end']}).")
+    print("Expect heightened particle decay anomalies and gravitational lensing fluctuations.")
 
 if __name__ == '__main__':
     predict_temporal_lattice_position()
@@ -1,12 +1,14 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from dataset_cache import read_cached_csv
+from periodogram import REFERENCE_PERIODS, SIGNIFICANT_FAP, reference_power
+from plot_stage import plot_job, render_plots
 
 def correlate_with_lunar_phase():
     print("Loading CERN B-meson decay data...")
     cern_file = 'cern_b_meson_anomalies.csv'
     try:
-        df = pd.read_csv(cern_file)
+        df = read_cached_csv(cern_file)
     except FileNotFoundError:
         print(f"Error: {cern_file} not found.")
         return
@@ -14,9 +16,9 @@ def correlate_with_lunar_phase():
     # Calculate Temporal Flux
     df['temporal_flux'] = df['cp_asymmetry_avg'] - df['sm_baseline']
 
-    # 1. Define Lunar Phase (Simplified Synodic Month: 29.53 days)
+    # 1. Define Lunar Phase (Synodic Month: 29.53 days)
     # Assume Day 1 is near a New Moon (Phase 0)
-    lunar_period = 29.53059
+    lunar_period = REFERENCE_PERIODS['Synodic month']
     df['lunar_phase'] = (df['day_of_year'] % lunar_period) / lunar_period
 
     # 2. Identify Significant Spikes (Flux > 0.004)
@@ -27,6 +29,13 @@ def correlate_with_lunar_phase():
     print(f"\n--- LUNAR RESONANCE ANALYSIS ---")
     print(f"Number of extreme temporal spikes: {len(spikes)}")
 
+    # Whether the flux repeats at the synodic month at all, tested together with
+    # the other reference periods; the spike phases below only say where in the
+    # month they fall.
+    _, synodic_power, synodic_fap = reference_power(
+        df['day_of_year'].values, df['temporal_flux'].values)['Synodic month']
+    print(f"Synodic-month periodogram power: {synodic_power:.4f} (false-alarm probability {synodic_fap:.4f})")
+
     if len(spikes) > 0:
         # Calculate Phase Distribution
         # 0.0 = New Moon, 0.5 = Full Moon, 1.0 = New Moon
@@ -40,39 +49,45 @@ def correlate_with_lunar_phase():
         dist_from_full = np.abs(spikes['lunar_phase'] - 0.5).mean()
         print(f"Average distance from Full Moon: {dist_from_full:.3f}")
 
-        if dist_from_full < 0.15:
+        if dist_from_full < 0.15 and synodic_fap < SIGNIFICANT_FAP:
             print("\n  *** LUNAR ANCHOR VERIFIED ***")
             print("  Extreme particle anomalies are statistically clustered around the Full Moon phase.")
             print("  This confirms the Moon's role as a gravitational regulator for the 3D Time lattice.")
+        elif dist_from_full < 0.15:
+            print("\n  Spikes cluster near the Full Moon, but the flux shows no significant synodic periodicity.")
         else:
             print("\n  Spikes detected, but distribution across lunar phases is broad.")
 
     # 3. Visualization: Polar Plot of Spikes
-    plt.figure(figsize=(8, 8))
-    ax = plt.subplot(111, projection='polar')
-    
+    output_plot = "2025-11-17_analysis/euclid_plots/lunar_resonance_polar.png"
+    render_plots([plot_job(render_lunar_polar, output_plot, phase=df['lunar_phase'].values,
+                           flux=df['temporal_flux'].values, spike_phase=spikes['lunar_phase'].values,
+                           spike_flux=spikes['temporal_flux'].values)])
+    print(f"\nLunar resonance plot saved to {output_plot}")
+
+def render_lunar_polar(phase, flux, spike_phase, spike_flux):
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot(111, projection='polar')
+
     # Background: Full Lunar Cycle
     theta = np.linspace(0, 2*np.pi, 100)
     ax.plot(theta, [0.006]*100, color='gray', linestyle='--', alpha=0.3, label='Standard Model Limit')
 
     # Plot all days as small dots
-    ax.scatter(df['lunar_phase'] * 2 * np.pi, df['temporal_flux'], color='cyan', s=5, alpha=0.2, label='Daily Flux')
-    
+    ax.scatter(phase * 2 * np.pi, flux, color='cyan', s=5, alpha=0.2, label='Daily Flux')
+
     # Highlight Spikes
-    ax.scatter(spikes['lunar_phase'] * 2 * np.pi, spikes['temporal_flux'], color='gold', s=50, marker='*', label='Extreme Spikes')
+    ax.scatter(spike_phase * 2 * np.pi, spike_flux, color='gold', s=50, marker='*', label='Extreme Spikes')
 
     # Annotate phases
     ax.set_theta_zero_location('N')
     ax.set_theta_direction(-1)
     ax.set_xticks(np.linspace(0, 2*np.pi, 4, endpoint=False))
     ax.set_xticklabels(['New Moon (0.0)', 'First Quarter (0.25)', 'Full Moon (0.5)', 'Third Quarter (0.75)'])
-    
-    plt.title("Correlation of CERN Particle Anomalies with Lunar Phase\nEvidence for the 'Lunar Anchor' in the 3D Time Lattice")
-    plt.legend(loc='lower right')
-    
-    output_plot = "2025-11-17_analysis/euclid_plots/lunar_resonance_polar.png"
-    plt.savefig(output_plot)
-    print(f"\nLunar resonance plot saved to {output_plot}")
+
+    ax.set_title("Correlation of CERN Particle Anomalies with Lunar Phase\nEvidence for the 'Lunar Anchor' in the 3D Time Lattice")
+    ax.legend(loc='lower right')
+    return fig
 
 if __name__ == '__main__':
     correlate_with_lunar_phase()
@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# src/parallel.py
+#
+# Process-pool plumbing shared by the analyses. Large read-only inputs (arrays,
+# KD-trees, file paths) are handed to each worker once, through the pool
+# initializer, and task functions read them from worker_state, so tasks
+# themselves stay small. With one worker or a single task everything runs
+# in-process through the same functions.
+#
+# Monte-Carlo work is cut into batches whose sizes depend only on the problem
+# size, each seeded by its own child of one SeedSequence; a given seed then
+# reproduces the same realisations whatever the pool size.
+
+worker_state = {}
+
+
+def _init_worker(state, initializer=None):
+    worker_state.clear()
+    worker_state.update(state)
+    if initializer is not None:
+        initializer()
+
+
+def run_tasks(func, tasks, shared=None, n_workers=None, chunksize=1, initializer=None):
+    """
+    Maps func over tasks, with the shared inputs available as worker_state.
+
+    Args:
+        func (callable): Module-level function of one task.
+        tasks (iterable): Picklable task descriptors.
+        shared (dict, optional): Inputs common to every task.
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+        chunksize (int, optional): Tasks sent to a worker at a time; None
+                                   sends about four chunks per worker.
+        initializer (callable, optional): Extra per-worker setup, run in pool
+                                          workers only.
+
+    Returns:
+        list: func(task) for every task, in task order.
+    """
+    tasks = list(tasks)
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers == 1 or len(tasks) <= 1:
+        # Restore the caller's state afterwards, in case func runs inside another task
+        saved = dict(worker_state)
+        _init_worker(shared or {})
+        try:
+            return [func(task) for task in tasks]
+        finally:
+            _init_worker(saved)
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (4 * n_workers))
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)), initializer=_init_worker,
+                             initargs=(shared or {}, initializer)) as pool:
+        return list(pool.map(func, tasks, chunksize=chunksize))
+
+
+def batch_sizes(n_total, batch_size):
+    """n_total split into batches of batch_size plus a final remainder."""
+    sizes = [batch_size] * (n_total // batch_size)
+    if n_total % batch_size:
+        sizes.append(n_total % batch_size)
+    return sizes
+
+
+def spawn_seeds(seed, n):
+    """n independent child SeedSequences of one seed (each usable with default_rng)."""
+    return np.random.SeedSequence(seed).spawn(n)
+
+
+def seeded_batches(n_total, batch_size, seed):
+    """[(size, seed)] batches covering n_total realisations (see batch_sizes)."""
+    sizes = batch_sizes(n_total, batch_size)
+    return list(zip(sizes, spawn_seeds(seed, len(sizes))))
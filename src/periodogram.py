@@ -0,0 +1,196 @@
+import argparse
+import numpy as np
+from dataset_cache import read_cached_csv
+
+# src/periodogram.py
+#
+# Lomb-Scargle periodogram for the (possibly unevenly sampled) CERN asymmetry
+# timelines. Instead of testing one period at a time (365-day sine, 29.53-day
+# fold, 16-day interval), every candidate period is scanned in one pass. For a
+# fixed set of sample times the Lomb-Scargle basis (cos/sin of w(t - tau))
+# depends only on the frequency grid, so the power of many series at once -
+# the data plus every bootstrap resample - is a single matrix product per
+# frequency chunk. Scripts that only test the reference periods use
+# reference_power(), which evaluates just those frequencies against one
+# bootstrap null shared by all of them.
+
+# Periods (days) the project tests individually elsewhere
+REFERENCE_PERIODS = {
+    'Orbital (1 yr)': 365.25,
+    'Lattice': 29.33,
+    'Synodic month': 29.53059,
+    'Euclid lattice prediction': 16.0,
+}
+# False-alarm probability below which a period counts as detected
+SIGNIFICANT_FAP = 0.01
+
+# Upper bound on elements in one (frequencies x samples) basis block
+MAX_BLOCK_ELEMENTS = 4_000_000
+
+
+def frequency_grid(t, min_period=None, max_period=None, oversampling=10):
+    """
+    Evenly spaced frequency grid (cycles/day) for sample times t.
+
+    Defaults span from the total baseline down to twice the median sampling
+    step, oversampled so peaks are not missed between grid points.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    baseline = t.max() - t.min()
+    if max_period is None:
+        max_period = baseline
+    if min_period is None:
+        min_period = 2 * np.median(np.diff(np.sort(t)))
+    f_min, f_max = 1.0 / max_period, 1.0 / min_period
+    n = int(np.ceil(oversampling * baseline * (f_max - f_min))) + 1
+    return np.linspace(f_min, f_max, n)
+
+
+def _basis_blocks(t, frequencies):
+    """Yields (slice, cos basis, sin basis) for blocks of the frequency grid."""
+    block = max(1, MAX_BLOCK_ELEMENTS // len(t))
+    for lo in range(0, len(frequencies), block):
+        omega = 2 * np.pi * frequencies[lo:lo + block, None]
+        # Time offset tau that decouples the sine and cosine terms
+        tau = np.arctan2(np.sin(2 * omega * t).sum(axis=1, keepdims=True),
+                         np.cos(2 * omega * t).sum(axis=1, keepdims=True)) / (2 * omega)
+        arg = omega * (t - tau)
+        cos_basis, sin_basis = np.cos(arg), np.sin(arg)
+        # Fold the per-frequency normalisation into the basis
+        cos_basis /= np.sqrt((cos_basis ** 2).sum(axis=1, keepdims=True))
+        sin_basis /= np.sqrt((sin_basis ** 2).sum(axis=1, keepdims=True))
+        yield slice(lo, lo + block), cos_basis, sin_basis
+
+
+def _centered(y):
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    y = y - y.mean(axis=1, keepdims=True)
+    norm = np.einsum('ij,ij->i', y, y)[:, None]
+    norm[norm == 0] = np.inf
+    return y, norm
+
+
+def lomb_scargle(t, y, frequencies):
+    """
+    Normalized Lomb-Scargle power for one or many series sharing sample times.
+
+    Args:
+        t (np.ndarray): Sample times (days), shape (n,).
+        y (np.ndarray): Values, shape (n,) or (b, n) for b series.
+        frequencies (np.ndarray): Frequencies in cycles/day, shape (f,).
+
+    Returns:
+        np.ndarray: Power in [0, 1] (fraction of variance explained by a
+        sinusoid at each frequency), shape (f,) or (b, f).
+    """
+    t = np.asarray(t, dtype=np.float64)
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=np.float64))
+    y, norm = _centered(y)
+    power = np.empty((y.shape[0], len(frequencies)))
+    for sl, cos_basis, sin_basis in _basis_blocks(t, frequencies):
+        power[:, sl] = ((y @ cos_basis.T) ** 2 + (y @ sin_basis.T) ** 2) / norm
+    return power[0] if power.shape[0] == 1 else power
+
+
+def _bootstrap_resamples(y, n_bootstrap, seed):
+    """y resampled with replacement onto the original sample times, shape (n_bootstrap, n)."""
+    y = np.asarray(y, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    return y[rng.integers(0, len(y), size=(n_bootstrap, len(y)))]
+
+
+def bootstrap_max_power(t, y, frequencies, n_bootstrap=1000, seed=0):
+    """
+    Distribution of the maximum periodogram power under the no-signal null,
+    from resampling y with replacement onto the original sample times.
+
+    Each basis block is computed once and applied to all resamples, so the
+    cost is one (n_bootstrap x n) @ (n x block) product per block.
+
+    Returns:
+        np.ndarray: Max power over the grid for each resample, shape (n_bootstrap,).
+    """
+    t = np.asarray(t, dtype=np.float64)
+    resampled, norm = _centered(_bootstrap_resamples(y, n_bootstrap, seed))
+    max_power = np.zeros(n_bootstrap)
+    for _, cos_basis, sin_basis in _basis_blocks(t, np.asarray(frequencies, dtype=np.float64)):
+        block_power = ((resampled @ cos_basis.T) ** 2 + (resampled @ sin_basis.T) ** 2) / norm
+        np.maximum(max_power, block_power.max(axis=1), out=max_power)
+    return max_power
+
+
+def false_alarm_probability(power, null_max_power):
+    """Fraction of null maxima at least as large as each power value."""
+    null_sorted = np.sort(np.asarray(null_max_power))
+    n_above = len(null_sorted) - np.searchsorted(null_sorted, np.asarray(power), side='left')
+    return (n_above + 1) / (len(null_sorted) + 1)
+
+
+def reference_power(t, y, reference_periods=REFERENCE_PERIODS, n_bootstrap=1000, seed=0):
+    """
+    Power at the reference periods only, each with a false-alarm probability
+    from one bootstrap null: the maximum power over all reference periods per
+    resample, so testing several periods at once is accounted for.
+
+    Returns:
+        dict: {name: (period, power, fap)}
+    """
+    periods = np.array(list(reference_periods.values()), dtype=np.float64)
+    power = np.atleast_1d(lomb_scargle(t, y, 1 / periods))
+    null = np.atleast_2d(lomb_scargle(t, _bootstrap_resamples(y, n_bootstrap, seed), 1 / periods)).max(axis=1)
+    return {name: (period, p, fap) for name, period, p, fap in
+            zip(reference_periods, periods, power, false_alarm_probability(power, null))}
+
+
+def analyze_periodicities(t, y, min_period=None, max_period=None, n_bootstrap=1000, n_peaks=5,
+                          reference_periods=REFERENCE_PERIODS):
+    """
+    Computes the spectrum once and reports the strongest periods, with
+    false-alarm probabilities against the maximum over the whole grid, and
+    the power at each reference period (see reference_power).
+
+    Returns:
+        dict with 'frequency', 'power', 'peaks' [(period, power, fap)] and
+        'reference' {name: (period, power, fap)}.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    frequencies = frequency_grid(t, min_period, max_period)
+    power = lomb_scargle(t, y, frequencies)
+    null = bootstrap_max_power(t, y, frequencies, n_bootstrap)
+
+    # Local maxima of the spectrum, strongest first
+    is_peak = np.r_[False, (power[1:-1] > power[:-2]) & (power[1:-1] >= power[2:]), False]
+    peak_idx = np.flatnonzero(is_peak)
+    peak_idx = peak_idx[np.argsort(power[peak_idx])[::-1][:n_peaks]]
+    peaks = [(1 / frequencies[i], power[i], fap) for i, fap in
+             zip(peak_idx, false_alarm_probability(power[peak_idx], null))]
+
+    reference = reference_power(t, y, reference_periods, n_bootstrap)
+    return {'frequency': frequencies, 'power': power, 'peaks': peaks, 'reference': reference}
+
+
+def print_periodicity_report(result):
+    print(f"Scanned {len(result['frequency'])} candidate periods.")
+    print("Strongest periods:")
+    for period, power, fap in result['peaks']:
+        print(f"  {period:8.2f} days | power {power:.4f} | false-alarm probability {fap:.4f}")
+    print("Reference periods:")
+    for name, (period, power, fap) in result['reference'].items():
+        print(f"  {name:<26} {period:8.2f} days | power {power:.4f} | false-alarm probability {fap:.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Lomb-Scargle periodogram of the CERN CP asymmetry timeline.")
+    parser.add_argument("--data_file", type=str, default='cern_b_meson_anomalies.csv',
+                        help="CSV with 'day_of_year' and 'cp_asymmetry_avg' (and optionally 'sm_baseline').")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Number of bootstrap resamples for FAPs.")
+    args = parser.parse_args()
+
+    df = read_cached_csv(args.data_file)
+    # Analyse the residual from the SM baseline when available
+    values = df['cp_asymmetry_avg']
+    if 'sm_baseline' in df.columns and df['sm_baseline'].notna().all():
+        values = values - df['sm_baseline']
+    print(f"--- PERIODOGRAM: {args.data_file} ---")
+    print_periodicity_report(analyze_periodicities(df['day_of_year'].values, values.values,
+                                                   n_bootstrap=args.bootstrap))
@@ -0,0 +1,119 @@
+import os
+import sys
+import hashlib
+import inspect
+import numpy as np
+from PIL import Image
+from parallel import run_tasks
+
+# src/plot_stage.py
+#
+# Figure rendering as a separate stage. An analysis computes its statistics,
+# then describes each figure as a job: a module-level renderer that turns
+# plot-ready arrays into a matplotlib Figure (built with the object-oriented
+# API, never registered with pyplot), the output path and those arrays.
+# render_plots() hashes every job (renderer module source + data), skips PNGs
+# whose embedded hash already matches, and renders the rest concurrently on a
+# process pool with the Agg backend. The hash is stored as a PNG text chunk
+# of the output itself, so there is no side file to keep in sync.
+
+HASH_KEY = 'plot_sha256'
+
+
+def plot_job(renderer, output_file, savefig_kwargs=None, **data):
+    """
+    A figure to render: renderer(**data) must return a matplotlib Figure.
+
+    The renderer must be a module-level function (so it can be sent to a
+    worker process) and data should hold arrays, numbers, strings and
+    containers of those.
+    """
+    return {'renderer': renderer, 'output_file': output_file, 'savefig_kwargs': savefig_kwargs or {}, 'data': data}
+
+
+def _update_hash(digest, value):
+    """Feeds a value into the digest, recursing into containers and plain objects."""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        digest.update(f'ndarray{value.dtype.str}{value.shape}'.encode())
+        digest.update(value.tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif isinstance(value, dict):
+        digest.update(f'dict{len(value)}'.encode())
+        for key in sorted(value, key=str):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update_hash(digest, item)
+    elif hasattr(value, '__dict__') and not callable(value):
+        digest.update(type(value).__qualname__.encode())
+        _update_hash(digest, vars(value))
+    else:
+        digest.update(repr(value).encode())
+
+
+def job_hash(job):
+    """
+    sha256 of the renderer's name and module source, the savefig options and
+    the data. The whole module is hashed so edits to helpers and constants the
+    renderer uses there also re-render; helpers imported from other modules
+    are not tracked.
+    """
+    digest = hashlib.sha256()
+    renderer = job['renderer']
+    digest.update(f'{renderer.__module__}.{renderer.__qualname__}'.encode())
+    digest.update(inspect.getsource(sys.modules[renderer.__module__]).encode())
+    _update_hash(digest, job['savefig_kwargs'])
+    _update_hash(digest, job['data'])
+    return digest.hexdigest()
+
+
+def stored_hash(path):
+    """Hash embedded in an existing PNG by render_plots, or None."""
+    try:
+        with Image.open(path) as image:
+            return image.text.get(HASH_KEY) if hasattr(image, 'text') else None
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker():
+    # Figures built without pyplot need no GUI backend; make sure workers never load one
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render(task):
+    job, digest = task
+    fig = job['renderer'](**job['data'])
+    directory = os.path.dirname(job['output_file'])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(job['output_file'], metadata={HASH_KEY: digest}, **job['savefig_kwargs'])
+    # Drop the figure's artists now rather than at the next garbage collection
+    fig.clear()
+    return job['output_file']
+
+
+def render_plots(jobs, n_workers=None, force=False):
+    """
+    Renders the jobs whose output is missing or was made from other inputs.
+
+    Args:
+        jobs (list): From plot_job().
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to render in-process.
+        force (bool): Re-render even when the stored hash matches.
+
+    Returns:
+        (rendered, skipped): Output paths of each kind.
+    """
+    tasks, skipped = [], []
+    for job in jobs:
+        digest = job_hash(job)
+        if not force and stored_hash(job['output_file']) == digest:
+            skipped.append(job['output_file'])
+        else:
+            tasks.append((job, digest))
+    return run_tasks(_render, tasks, n_workers=n_workers, initializer=_init_worker), skipped
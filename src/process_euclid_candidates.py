@@ -1,39 +1,84 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 import os
+import argparse
+from euclid_catalogue import iter_euclid_catalogue
+from sky_maps import (SkyMapAccumulator, DEFAULT_PIXEL_DEG, MAP_COLUMNS, sky_map_figure, shear_field_figure,
+                      update_sky_maps)
+from streaming_summary import summarize_catalogue, update_catalogue_summary, select_tails
+from raster_render import PointRaster, point_extent
+from plot_stage import plot_job, render_plots
 
-def process_candidates(file_path="euclid_lensing_candidates.csv"):
+def render_histogram(counts, edges, title, xlabel, color, figsize, thresholds=()):
+    """Binned distribution with optional dashed (value, color, label) threshold lines."""
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot()
+    ax.stairs(counts, edges, fill=True, color=color, edgecolor='black')
+    for value, line_color, label in thresholds:
+        ax.axvline(value, color=line_color, linestyle='dashed', linewidth=1, label=label)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Number of Objects')
+    if thresholds:
+        ax.legend()
+    ax.grid(axis='y', alpha=0.75)
+    return fig
+
+
+def render_spatial_distribution(raster):
+    fig = Figure(figsize=(12, 8))
+    ax = fig.add_subplot()
+    fig.colorbar(raster.draw(ax, cmap='viridis', s=5, alpha=0.5), ax=ax, label='Ellipticity')
+    ax.set_title('Spatial Distribution of Candidates (Color by Ellipticity)')
+    ax.set_xlabel('Right Ascension (degrees)')
+    ax.set_ylabel('Declination (degrees)')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    return fig
+
+
+def process_candidates(file_path="euclid_lensing_candidates.csv", n_workers=None, incremental=False):
     """
-    Loads the Euclid lensing candidates, performs initial exploration,
-    and identifies potential morphological anomalies.
+    Summarises the Euclid lensing candidates in one streaming pass, selects
+    ellipticity outliers in a second pass, and plots the distributions.
+
+    With incremental=True the summary and sky maps are merged from per-tile
+    results stored with the columnar cache, re-reading only the sky tiles that
+    changed since the last incremental run.
     """
-    print(f"Loading data from {file_path}...")
+    print(f"Summarising data from {file_path}...")
     try:
-        df = pd.read_csv(file_path)
-        print("Data loaded successfully.")
+        if incremental:
+            summary, recomputed = update_catalogue_summary(file_path, n_workers=n_workers)
+            if recomputed is not None:
+                print(f"Re-summarised {len(recomputed)} changed sky tiles: {recomputed}")
+        else:
+            summary = summarize_catalogue(file_path, n_workers=n_workers)
+        print("Data summarised successfully.")
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
         return
 
     print("\n--- Initial Data Exploration ---")
-    print("DataFrame Info:")
-    df.info()
+    print("Catalogue Info:")
+    summary.info()
     print("\nFirst 5 rows:")
-    print(df.head())
-    print("\nDescriptive Statistics for numerical columns:")
-    print(df.describe())
+    # Straight from the file: cached reads come in sky-tile order
+    print(pd.read_csv(file_path, nrows=5))
+    print("\nDescriptive Statistics for numerical columns (quartiles approximate):")
+    print(summary.describe())
 
     plots_dir = "2025-11-17_analysis/euclid_plots"
     os.makedirs(plots_dir, exist_ok=True)
 
     print("\n--- Anomaly Detection: Ellipticity Outliers ---")
     # Ellipticity ranges from 0 (circular) to 1 (highly elongated)
-    # We are looking for objects with unusually high or low ellipticity.
+    # We are looking for objects with unusually high or low ellipticity:
+    # top 5% and bottom 5% (very circular objects), selected in one more pass.
+    (low_ellipticity_threshold, low_ellipticity_candidates,
+     high_ellipticity_threshold, high_ellipticity_candidates) = select_tails(file_path, summary, 'ellipticity',
+                                                                             0.05, 0.95)
 
-    # High Ellipticity (top 5%)
-    high_ellipticity_threshold = df['ellipticity'].quantile(0.95)
-    high_ellipticity_candidates = df[df['ellipticity'] > high_ellipticity_threshold]
     print(f"High Ellipticity threshold (top 5%): > {high_ellipticity_threshold:.3f}")
     print(f"Found {len(high_ellipticity_candidates)} candidates with high ellipticity.")
     if not high_ellipticity_candidates.empty:
@@ -41,10 +86,6 @@ def process_candidates(file_path="euclid_lensing_candidates.csv"):
         print(high_ellipticity_candidates.head())
         high_ellipticity_candidates.to_csv(os.path.join(plots_dir, "high_ellipticity_candidates.csv"), index=False)
 
-
-    # Low Ellipticity (bottom 5%) - these would be very circular objects
-    low_ellipticity_threshold = df['ellipticity'].quantile(0.05)
-    low_ellipticity_candidates = df[df['ellipticity'] < low_ellipticity_threshold]
     print(f"\nLow Ellipticity threshold (bottom 5%): < {low_ellipticity_threshold:.3f}")
     print(f"Found {len(low_ellipticity_candidates)} candidates with low ellipticity.")
     if not low_ellipticity_candidates.empty:
@@ -53,43 +94,58 @@ def process_candidates(file_path="euclid_lensing_candidates.csv"):
         low_ellipticity_candidates.to_csv(os.path.join(plots_dir, "low_ellipticity_candidates.csv"), index=False)
 
 
+    # Figures are described here and rendered together by the plot stage
+    plot_jobs = []
+
     # Visualization of Ellipticity Distribution
-    plt.figure(figsize=(10, 6))
-    plt.hist(df['ellipticity'].dropna(), bins=50, color='skyblue', edgecolor='black')
-    plt.axvline(high_ellipticity_threshold, color='red', linestyle='dashed', linewidth=1, label=f'High Ellipticity Threshold ({high_ellipticity_threshold:.3f})')
-    plt.axvline(low_ellipticity_threshold, color='blue', linestyle='dashed', linewidth=1, label=f'Low Ellipticity Threshold ({low_ellipticity_threshold:.3f})')
-    plt.title('Distribution of Ellipticity')
-    plt.xlabel('Ellipticity')
-    plt.ylabel('Number of Objects')
-    plt.legend()
-    plt.grid(axis='y', alpha=0.75)
-    plt.savefig(os.path.join(plots_dir, 'ellipticity_distribution.png'))
-    plt.close() # Close the plot to free memory
+    counts, edges = summary.columns['ellipticity'].binned(50)
+    thresholds = [(high_ellipticity_threshold, 'red', f'High Ellipticity Threshold ({high_ellipticity_threshold:.3f})'),
+                  (low_ellipticity_threshold, 'blue', f'Low Ellipticity Threshold ({low_ellipticity_threshold:.3f})')]
+    plot_jobs.append(plot_job(render_histogram, os.path.join(plots_dir, 'ellipticity_distribution.png'),
+                              counts=counts, edges=edges, title='Distribution of Ellipticity', xlabel='Ellipticity',
+                              color='skyblue', figsize=(10, 6), thresholds=thresholds))
 
     print("\n--- Anomaly Detection: Point-like Probability Analysis ---")
     # For now, let's just visualize its distribution
-    plt.figure(figsize=(8, 5))
-    df['point_like_prob'].dropna().hist(bins=30, color='lightgreen', edgecolor='black')
-    plt.title('Point-like Probability Distribution')
-    plt.xlabel('Point-like Probability')
-    plt.ylabel('Number of Objects')
-    plt.grid(axis='y', alpha=0.75)
-    plt.savefig(os.path.join(plots_dir, 'point_like_prob_distribution.png'))
-    plt.close()
+    counts, edges = summary.columns['point_like_prob'].binned(30)
+    plot_jobs.append(plot_job(render_histogram, os.path.join(plots_dir, 'point_like_prob_distribution.png'),
+                              counts=counts, edges=edges, title='Point-like Probability Distribution',
+                              xlabel='Point-like Probability', color='lightgreen', figsize=(8, 5)))
 
     print("\n--- Spatial Distribution (RA, Dec) ---")
-    plt.figure(figsize=(12, 8))
-    plt.scatter(df['right_ascension'], df['declination'], s=5, alpha=0.5, c=df['ellipticity'], cmap='viridis')
-    plt.colorbar(label='Ellipticity')
-    plt.title('Spatial Distribution of Candidates (Color by Ellipticity)')
-    plt.xlabel('Right Ascension (degrees)')
-    plt.ylabel('Declination (degrees)')
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.savefig(os.path.join(plots_dir, 'spatial_distribution.png'))
-    plt.close()
+    # One more streaming pass feeds both the spatial plot (drawn per object for
+    # small catalogues, as an aggregated image for large ones) and the sky maps
+    # (unless those come from stored per-tile sums)
+    ra_stats, dec_stats = summary.columns['right_ascension'], summary.columns['declination']
+    spatial = PointRaster(point_extent([ra_stats.min, ra_stats.max], [dec_stats.min, dec_stats.max]))
+    sky_maps = update_sky_maps(file_path, DEFAULT_PIXEL_DEG)[0] if incremental else SkyMapAccumulator(DEFAULT_PIXEL_DEG)
+    for chunk in iter_euclid_catalogue(file_path, columns=MAP_COLUMNS):
+        spatial.add(chunk['right_ascension'].values, chunk['declination'].values, chunk['ellipticity'].values)
+        if not incremental:
+            sky_maps.add(chunk['right_ascension'].values, chunk['declination'].values, chunk['ellipticity'].values,
+                         chunk['position_angle'].values)
+    plot_jobs.append(plot_job(render_spatial_distribution, os.path.join(plots_dir, 'spatial_distribution.png'),
+                              raster=spatial))
+
+    print("\n--- Sky Maps (equal-area pixels) ---")
+    sky_maps.save(os.path.join(plots_dir, 'euclid_sky_maps.npz'))
+    print(f"Binned {spatial.n_points} objects into {np.count_nonzero(sky_maps.sums['count'])} "
+          f"{DEFAULT_PIXEL_DEG} deg pixels.")
+    for quantity in ('count', 'mean_ellipticity', 'pa_coherence'):
+        plot_jobs.append(plot_job(sky_map_figure, os.path.join(plots_dir, f'sky_map_{quantity}.png'), {'dpi': 150},
+                                  accumulator=sky_maps, quantity=quantity))
+    plot_jobs.append(plot_job(shear_field_figure, os.path.join(plots_dir, 'sky_map_shear.png'), {'dpi': 150},
+                              accumulator=sky_maps))
 
+    rendered, skipped = render_plots(plot_jobs, n_workers=n_workers)
+    print(f"\nRendered {len(rendered)} plots ({len(skipped)} unchanged, skipped).")
     print(f"\nPlots and candidate lists saved to the '{plots_dir}' directory.")
 
 
 if __name__ == "__main__":
-    process_candidates()
+    parser = argparse.ArgumentParser(description="Summarise, select and plot the Euclid lensing candidates.")
+    parser.add_argument("--data_file", type=str, default="euclid_lensing_candidates.csv")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse stored per-tile summaries and sky maps; re-read only changed sky tiles.")
+    args = parser.parse_args()
+    process_candidates(args.data_file, incremental=args.incremental)
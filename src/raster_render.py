@@ -0,0 +1,168 @@
+import numpy as np
+import matplotlib.colors as mcolors
+
+# src/raster_render.py
+#
+# Rendering for point sets too large to hand to matplotlib one marker at a
+# time. Points are aggregated into a fixed-resolution grid with np.bincount
+# (counts, mean value or mean RGBA colour per cell) and drawn as one image;
+# orientation fields are averaged per coarser cell as spin-2 quantities
+# (mean of m * exp(2i angle)), so a headless stick and its 180-degree twin
+# reinforce rather than cancel. Inputs up to RASTER_THRESHOLD points are
+# still drawn per point, exactly as before. Accumulation works chunk by
+# chunk, so a catalogue can be rasterised while it is streamed.
+
+RASTER_THRESHOLD = 50_000
+# (rows, columns) of the image grid and of the averaged orientation field
+DEFAULT_RASTER_SHAPE = (400, 600)
+DEFAULT_FIELD_SHAPE = (40, 60)
+
+
+def point_extent(x, y, pad=0.02):
+    """(x_min, x_max, y_min, y_max) of the points, padded by a fraction of the span."""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if not len(x):
+        return (0.0, 1.0, 0.0, 1.0)
+    x_pad = max(x.max() - x.min(), 1e-9) * pad
+    y_pad = max(y.max() - y.min(), 1e-9) * pad
+    return (x.min() - x_pad, x.max() + x_pad, y.min() - y_pad, y.max() + y_pad)
+
+
+def grid_cells(x, y, extent, shape):
+    """Flat cell index (row * n_cols + col) per point, -1 outside the extent."""
+    x0, x1, y0, y1 = extent
+    n_rows, n_cols = shape
+    col = np.floor((np.asarray(x, dtype=np.float64) - x0) / (x1 - x0) * n_cols).astype(np.int64)
+    row = np.floor((np.asarray(y, dtype=np.float64) - y0) / (y1 - y0) * n_rows).astype(np.int64)
+    inside = (col >= 0) & (col < n_cols) & (row >= 0) & (row < n_rows)
+    return np.where(inside, row * n_cols + col, -1)
+
+
+class PointRaster:
+    """
+    Per-cell count and value sums of a stream of points, keeping the points
+    themselves while there are at most max_points of them.
+
+    Values may be None (density only), one number per point (mean value per
+    cell) or one RGBA colour per point (mean colour per cell).
+    """
+
+    def __init__(self, extent, shape=DEFAULT_RASTER_SHAPE, max_points=RASTER_THRESHOLD):
+        self.extent = extent
+        self.shape = shape
+        self.max_points = max_points
+        self.count = np.zeros(shape[0] * shape[1])
+        self.sums = None
+        self.n_points = 0
+        self.points = []
+
+    def add(self, x, y, values=None):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        self.n_points += len(x)
+        if self.points is not None:
+            self.points.append((x, y, values))
+            if self.n_points > self.max_points:
+                self.points = None
+
+        cells = grid_cells(x, y, self.extent, self.shape)
+        inside = cells >= 0
+        cells = cells[inside]
+        self.count += np.bincount(cells, minlength=len(self.count))
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64)[inside]
+            columns = values.reshape(len(values), -1).T
+            if self.sums is None:
+                self.sums = np.zeros((len(columns), len(self.count)))
+            for k, column in enumerate(columns):
+                self.sums[k] += np.bincount(cells, weights=column, minlength=len(self.count))
+        return self
+
+    def _edges(self):
+        x0, x1, y0, y1 = self.extent
+        return np.linspace(x0, x1, self.shape[1] + 1), np.linspace(y0, y1, self.shape[0] + 1)
+
+    def draw(self, ax, cmap=None, alpha=None, **scatter_kwargs):
+        """
+        Draws the points (scatter) or, above max_points, the aggregated image.
+
+        Returns:
+            The artist, for use with colorbar().
+        """
+        if self.points is not None:
+            x = np.concatenate([p[0] for p in self.points]) if self.points else np.empty(0)
+            y = np.concatenate([p[1] for p in self.points]) if self.points else np.empty(0)
+            values = None
+            if self.points and self.points[0][2] is not None:
+                values = np.concatenate([np.asarray(p[2]) for p in self.points])
+            if cmap is not None:
+                scatter_kwargs['cmap'] = cmap
+            return ax.scatter(x, y, c=values, alpha=alpha, **scatter_kwargs)
+
+        occupied = self.count > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = None if self.sums is None else self.sums / self.count
+        x_edges, y_edges = self._edges()
+        if means is not None and len(means) in (3, 4):
+            # Mean colour per cell; empty cells stay transparent
+            rgba = np.zeros((len(self.count), 4))
+            rgba[:, :len(means)] = np.nan_to_num(means.T)
+            if len(means) == 3:
+                rgba[:, 3] = 1.0
+            rgba[:, 3] *= occupied * (1.0 if alpha is None else alpha)
+            return ax.imshow(rgba.reshape(*self.shape, 4), extent=self.extent, origin='lower', aspect='auto',
+                             interpolation='nearest')
+        if means is None:
+            image = np.ma.masked_where(~occupied, self.count).reshape(self.shape)
+            return ax.pcolormesh(x_edges, y_edges, image, cmap=cmap, alpha=alpha, norm=mcolors.LogNorm(),
+                                 shading='flat')
+        image = np.ma.masked_where(~occupied, means[0]).reshape(self.shape)
+        return ax.pcolormesh(x_edges, y_edges, image, cmap=cmap, alpha=alpha, shading='flat')
+
+
+def plot_points(ax, x, y, values=None, extent=None, shape=DEFAULT_RASTER_SHAPE, max_points=RASTER_THRESHOLD,
+                **draw_kwargs):
+    """Scatter for small inputs, aggregated image for large ones (see PointRaster)."""
+    if extent is None:
+        extent = point_extent(x, y)
+    return PointRaster(extent, shape, max_points).add(x, y, values).draw(ax, **draw_kwargs)
+
+
+def plot_orientation_field(ax, x, y, angle_rad, magnitude=1.0, extent=None, shape=DEFAULT_FIELD_SHAPE,
+                           max_points=RASTER_THRESHOLD, **quiver_kwargs):
+    """
+    Headless sticks of the given length and angle (from the +x axis).
+
+    Up to max_points points are drawn individually. Larger inputs are
+    averaged per grid cell as spin-2 quantities: one stick per occupied cell
+    at the members' mean position, with angle half the argument of
+    <m exp(2i angle)> and length its modulus (so randomly oriented cells
+    get short sticks); unless a scale is given, the longest spans one cell.
+
+    Returns:
+        The Quiver artist.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    angle = np.asarray(angle_rad, dtype=np.float64)
+    magnitude = np.broadcast_to(np.asarray(magnitude, dtype=np.float64), x.shape)
+    if len(x) <= max_points:
+        return ax.quiver(x, y, magnitude * np.cos(angle), magnitude * np.sin(angle), **quiver_kwargs)
+
+    if extent is None:
+        extent = point_extent(x, y)
+    cells = grid_cells(x, y, extent, shape)
+    inside = cells >= 0
+    cells, x, y, angle, magnitude = cells[inside], x[inside], y[inside], angle[inside], magnitude[inside]
+    n_cells = shape[0] * shape[1]
+    count = np.bincount(cells, minlength=n_cells)
+    occupied = count > 0
+    sums = [np.bincount(cells, weights=w, minlength=n_cells)[occupied]
+            for w in (x, y, magnitude * np.cos(2 * angle), magnitude * np.sin(2 * angle))]
+    n = count[occupied]
+    mean_x, mean_y, spin_cos, spin_sin = (s / n for s in sums)
+    length = np.hypot(spin_cos, spin_sin)
+    mean_angle = 0.5 * np.arctan2(spin_sin, spin_cos)
+    if 'scale' not in quiver_kwargs:
+        # Without an explicit scale, the longest stick spans one cell
+        quiver_kwargs.update(angles='xy', scale_units='xy',
+                             scale=max(length.max(initial=0), 1e-12) * shape[1] / (extent[1] - extent[0]))
+    return ax.quiver(mean_x, mean_y, length * np.cos(mean_angle), length * np.sin(mean_angle), **quiver_kwargs)
@@ -0,0 +1,158 @@
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sky_index import radec_to_unit_vectors, chord_to_deg, deg_to_chord, direction_angle
+from shear_statistics import tangential_cross_shear
+from euclid_catalogue import load_euclid_catalogue
+from dataset_cache import read_cached_csv
+from parallel import worker_state, run_tasks
+
+# src/shear_profiles.py
+#
+# Radial tangential/cross shear profiles of Euclid sources around many
+# candidate centres at once (cluster centroids, JWST positions, ...). The
+# sources are indexed once in a KD-tree on unit vectors; centres are split into
+# chunks sized by their neighbour counts, and each chunk finds all
+# (centre, source) pairs within the outermost bin in one sparse distance query.
+# Per-bin sums are accumulated with np.bincount over (centre, bin) keys, so a
+# chunk returns small (centres x bins) arrays and chunks run independently on
+# a process pool.
+
+# Default radial bins (deg): 0.6 arcmin to 1 deg, logarithmic
+DEFAULT_BIN_EDGES = np.geomspace(0.01, 1.0, 11)
+# Upper bound on (centre, source) pairs handled in one chunk
+MAX_CHUNK_PAIRS = 5_000_000
+
+
+def _profile_chunk(task):
+    """Per-(centre, bin) pair counts and shear sums for one chunk of centres."""
+    centre_ra, centre_dec = task
+    bin_edges = worker_state['bin_edges']
+    n_bins = len(bin_edges) - 1
+    n_keys = len(centre_ra) * n_bins
+
+    centre_tree = cKDTree(radec_to_unit_vectors(centre_ra, centre_dec))
+    pairs = centre_tree.sparse_distance_matrix(worker_state['tree'], float(deg_to_chord(bin_edges[-1])),
+                                               output_type='ndarray')
+    sep = chord_to_deg(pairs['v'])
+    radial_bin = np.searchsorted(bin_edges, sep, side='right') - 1
+    keep = (radial_bin >= 0) & (radial_bin < n_bins)
+    c, s, radial_bin, sep = pairs['i'][keep], pairs['j'][keep], radial_bin[keep], sep[keep]
+
+    phi = direction_angle(centre_ra[c], centre_dec[c], worker_state['ra'][s], worker_state['dec'][s])
+    gt, gx = tangential_cross_shear(worker_state['ellipticity'][s], worker_state['theta'][s], phi)
+    keys = c * n_bins + radial_bin
+    sums = [np.bincount(keys, weights=w, minlength=n_keys).reshape(-1, n_bins) for w in (gt, gx, gt * gt, sep)]
+    return (np.bincount(keys, minlength=n_keys).reshape(-1, n_bins), *sums)
+
+
+def _chunk_centres(pair_counts, max_pairs=MAX_CHUNK_PAIRS):
+    """Splits centre indices into consecutive chunks of at most max_pairs pairs."""
+    bounds = [0]
+    total = 0
+    for i, n in enumerate(pair_counts):
+        if total and total + n > max_pairs:
+            bounds.append(i)
+            total = 0
+        total += n
+    bounds.append(len(pair_counts))
+    return [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def shear_profiles(centre_ra, centre_dec, ra, dec, ellipticity, position_angle_deg, bin_edges_deg=DEFAULT_BIN_EDGES,
+                   n_workers=None, tree=None):
+    """
+    Tangential and cross shear profiles around every centre.
+
+    Args:
+        centre_ra, centre_dec (np.ndarray): Centres in degrees, shape (m,).
+        ra, dec (np.ndarray): Source positions in degrees, shape (n,).
+        ellipticity, position_angle_deg (np.ndarray): Source shapes, shape (n,).
+        bin_edges_deg (np.ndarray): Radial bin edges in degrees, shape (b + 1,).
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+        tree (cKDTree, optional): Prebuilt index of the source unit vectors.
+
+    Returns:
+        dict of (m, b) arrays: 'n_pairs', 'gt', 'gx' (mean shear), 'gt_err'
+        (standard error of gt) and 'mean_sep_deg'; plus 'bin_edges_deg' and
+        'stacked', the same quantities (shape (b,)) pooled over all centres.
+    """
+    centre_ra = np.asarray(centre_ra, dtype=np.float64)
+    centre_dec = np.asarray(centre_dec, dtype=np.float64)
+    bin_edges = np.asarray(bin_edges_deg, dtype=np.float64)
+    if tree is None:
+        tree = cKDTree(radec_to_unit_vectors(ra, dec))
+    source_state = {'tree': tree, 'ra': np.asarray(ra, dtype=np.float64), 'dec': np.asarray(dec, dtype=np.float64),
+                    'ellipticity': np.asarray(ellipticity, dtype=np.float64),
+                    'theta': np.radians(np.asarray(position_angle_deg, dtype=np.float64)), 'bin_edges': bin_edges}
+
+    # Size chunks by how many sources each centre will pair with
+    pair_counts = tree.query_ball_point(radec_to_unit_vectors(centre_ra, centre_dec), deg_to_chord(bin_edges[-1]),
+                                        return_length=True)
+    tasks = [(centre_ra[lo:hi], centre_dec[lo:hi]) for lo, hi in _chunk_centres(pair_counts)]
+    results = run_tasks(_profile_chunk, tasks, source_state, n_workers)
+
+    n_bins = len(bin_edges) - 1
+    sums = [np.concatenate([r[k] for r in results]) if results else np.zeros((0, n_bins)) for k in range(5)]
+
+    def summarise(n, gt, gx, gt2, sep):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_gt = gt / n
+            variance = np.maximum(gt2 / n - mean_gt ** 2, 0)
+            return {'n_pairs': n, 'gt': mean_gt, 'gx': gx / n, 'gt_err': np.sqrt(variance / (n - 1)),
+                    'mean_sep_deg': sep / n}
+
+    profiles = summarise(*sums)
+    profiles['bin_edges_deg'] = bin_edges
+    profiles['stacked'] = summarise(*[s.sum(axis=0) for s in sums])
+    return profiles
+
+
+def profiles_to_frame(profiles, centre_ids=None):
+    """Long-format table: one row per (centre, radial bin)."""
+    n_centres, n_bins = profiles['n_pairs'].shape
+    edges = profiles['bin_edges_deg']
+    if centre_ids is None:
+        centre_ids = np.arange(n_centres)
+    return pd.DataFrame({
+        'centre': np.repeat(centre_ids, n_bins),
+        'r_min_deg': np.tile(edges[:-1], n_centres),
+        'r_max_deg': np.tile(edges[1:], n_centres),
+        **{k: profiles[k].ravel() for k in ('n_pairs', 'mean_sep_deg', 'gt', 'gt_err', 'gx')},
+    })
+
+
+def print_stacked_profile(profiles):
+    stacked = profiles['stacked']
+    edges = profiles['bin_edges_deg']
+    print(f"{'Radius (deg)':<18} | {'Pairs':>9} | {'Tangential g_t':>22} | {'Cross g_x':>10}")
+    for k in range(len(edges) - 1):
+        print(f"{edges[k]:7.3f} - {edges[k + 1]:7.3f} | {int(stacked['n_pairs'][k]):9d} | "
+              f"{stacked['gt'][k]:+9.4f} +/- {stacked['gt_err'][k]:.4f} | {stacked['gx'][k]:+10.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stacked tangential/cross shear profiles around candidate centres.")
+    parser.add_argument("--catalogue", type=str, default='euclid_lensing_candidates.csv',
+                        help="Euclid source catalogue.")
+    parser.add_argument("--centres", type=str, default='jwst_early_universe_candidates.csv',
+                        help="CSV of centres with 'ra' and 'dec' columns.")
+    parser.add_argument("--max_radius", type=float, default=1.0, help="Outer radius in degrees.")
+    parser.add_argument("--n_bins", type=int, default=10, help="Number of logarithmic radial bins.")
+    parser.add_argument("--output", type=str, default='shear_profiles.csv', help="Per-centre profile table.")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size.")
+    args = parser.parse_args()
+
+    sources = load_euclid_catalogue(args.catalogue, columns=['right_ascension', 'declination', 'ellipticity',
+                                                             'position_angle'])
+    centres = read_cached_csv(args.centres)
+    edges = np.geomspace(args.max_radius / 100, args.max_radius, args.n_bins + 1)
+    print(f"--- SHEAR PROFILES: {len(centres)} centres, {len(sources)} sources ---")
+    result = shear_profiles(centres['ra'].values, centres['dec'].values, sources['right_ascension'].values,
+                            sources['declination'].values, sources['ellipticity'].values,
+                            sources['position_angle'].values, edges, n_workers=args.workers)
+    print_stacked_profile(result)
+    profiles_to_frame(result).to_csv(args.output, index=False)
+    print(f"Saved per-centre profiles to {args.output}")
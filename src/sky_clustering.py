@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from sklearn.cluster import DBSCAN
+from sky_index import radec_to_unit_vectors, deg_to_chord, sky_tile_ids, sky_tile_bounding_circles
+from parallel import worker_state, run_tasks
+
+# src/sky_clustering.py
+#
+# DBSCAN on the celestial sphere. Neighbourhoods use the haversine metric on a
+# ball tree, so eps is a true angular separation at every declination and
+# across RA = 0/360.
+#
+# For catalogues too big for one process, dbscan_sky_tiled() clusters each
+# sky tile (sky_index.sky_tile_ids) together with every source within
+# 2 * eps of it. That margin makes the core/non-core status exact for all
+# sources within eps of the tile, so two core sources closer than eps always
+# share a local cluster in the tile that owns either one. Local clusters that
+# share a core source are then merged across tiles with one connected-components
+# pass, which gives the same clusters as a single global DBSCAN (border points
+# touching several clusters may be assigned differently, as in DBSCAN itself).
+
+# Above this many sources analyze_euclid switches to tile-wise clustering
+TILED_CLUSTERING_THRESHOLD = 1_000_000
+
+
+def dbscan_sky(ra_deg, dec_deg, eps_deg, min_samples=5):
+    """
+    DBSCAN with angular eps on a haversine ball tree.
+
+    Returns:
+        (labels, is_core): Cluster label per source (-1 = noise) and a
+        boolean core-sample mask.
+    """
+    latlon = np.radians(np.column_stack((np.asarray(dec_deg, dtype=np.float64),
+                                         np.asarray(ra_deg, dtype=np.float64))))
+    if not len(latlon):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    db = DBSCAN(eps=np.radians(eps_deg), min_samples=min_samples, metric='haversine',
+                algorithm='ball_tree').fit(latlon)
+    is_core = np.zeros(len(latlon), dtype=bool)
+    is_core[db.core_sample_indices_] = True
+    return db.labels_.astype(np.int64), is_core
+
+
+def _cluster_tile(task):
+    """Clusters one tile with its margin; returns labels of owned and core sources."""
+    owned, region = task
+    labels, is_core = dbscan_sky(worker_state['ra'][region], worker_state['dec'][region],
+                                 worker_state['eps_deg'], worker_state['min_samples'])
+    owned_labels = labels[np.searchsorted(region, owned)]
+    core = is_core & (labels >= 0)
+    return owned_labels, region[core], labels[core]
+
+
+def dbscan_sky_tiled(ra_deg, dec_deg, eps_deg, min_samples=5, tile_deg=10.0, n_workers=None):
+    """
+    Tile-wise DBSCAN with cross-tile merging.
+
+    Args:
+        ra_deg, dec_deg (np.ndarray): Positions in degrees.
+        eps_deg (float): Neighbourhood radius in degrees.
+        min_samples (int): DBSCAN core threshold (including the source itself).
+        tile_deg (float): Tile size; should be well above eps_deg.
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+
+    Returns:
+        np.ndarray: Cluster label per source (-1 = noise), numbered 0..k-1 in
+        order of each cluster's first source.
+    """
+    ra_deg = np.asarray(ra_deg, dtype=np.float64)
+    dec_deg = np.asarray(dec_deg, dtype=np.float64)
+    n = len(ra_deg)
+    if not n:
+        return np.empty(0, dtype=np.int64)
+
+    tiles = sky_tile_ids(ra_deg, dec_deg, tile_deg)
+    order = np.argsort(tiles, kind='stable')
+    tile_ids, starts = np.unique(tiles[order], return_index=True)
+    owned = [np.sort(g) for g in np.split(order, starts[1:])]
+
+    centres, tile_radius = sky_tile_bounding_circles(tile_ids, tile_deg)
+    reach = deg_to_chord(np.minimum(tile_radius + 2 * eps_deg, 180.0)) * (1 + 1e-9)
+    regions = cKDTree(radec_to_unit_vectors(ra_deg, dec_deg)).query_ball_point(centres, reach)
+    tasks = [(o, np.sort(np.asarray(r, dtype=np.int64))) for o, r in zip(owned, regions)]
+
+    shared = {'ra': ra_deg, 'dec': dec_deg, 'eps_deg': eps_deg, 'min_samples': min_samples}
+    results = run_tasks(_cluster_tile, tasks, shared, n_workers)
+
+    # Give every (tile, local cluster) a global node id
+    node_offsets = np.r_[0, np.cumsum([max(r[0].max(initial=-1), r[2].max(initial=-1)) + 1 for r in results])]
+    labels = np.full(n, -1, dtype=np.int64)
+    core_points, core_nodes = [], []
+    for (owned_labels, core_idx, core_labels), o, offset in zip(results, owned, node_offsets):
+        labels[o] = np.where(owned_labels >= 0, owned_labels + offset, -1)
+        core_points.append(core_idx)
+        core_nodes.append(core_labels + offset)
+    core_points, core_nodes = np.concatenate(core_points), np.concatenate(core_nodes)
+
+    # Local clusters sharing a core source are one cluster
+    by_point = np.argsort(core_points, kind='stable')
+    core_points, core_nodes = core_points[by_point], core_nodes[by_point]
+    same = core_points[1:] == core_points[:-1]
+    graph = coo_matrix((np.ones(same.sum(), dtype=np.int8), (core_nodes[:-1][same], core_nodes[1:][same])),
+                       shape=(node_offsets[-1], node_offsets[-1]))
+    _, component = connected_components(graph, directed=False)
+
+    clustered = labels >= 0
+    merged = component[labels[clustered]]
+    # Renumber by first appearance for stable, contiguous labels
+    _, first, inverse = np.unique(merged, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    labels[clustered] = rank[inverse]
+    return labels
+
+
+def cluster_sky(ra_deg, dec_deg, eps_deg, min_samples=5, tile_deg=10.0, n_workers=None):
+    """DBSCAN on the sphere, tile-wise above TILED_CLUSTERING_THRESHOLD sources."""
+    if len(ra_deg) > TILED_CLUSTERING_THRESHOLD:
+        return dbscan_sky_tiled(ra_deg, dec_deg, eps_deg, min_samples, tile_deg, n_workers)
+    return dbscan_sky(ra_deg, dec_deg, eps_deg, min_samples)[0]
+
+
+def cluster_summary(df, labels, ra_column='right_ascension', dec_column='declination', mean_columns=()):
+    """
+    Per-cluster statistics in one grouped pass.
+
+    Returns:
+        pd.DataFrame indexed by cluster label (noise excluded) with n_members,
+        centroid ra/dec (normalised mean unit vector), angular radius (largest
+        member distance from the centroid, deg) and the mean of each column
+        in mean_columns.
+    """
+    labels = np.asarray(labels)
+    xyz = radec_to_unit_vectors(df[ra_column].values, df[dec_column].values)
+    work = pd.DataFrame({'cluster': labels, 'x': xyz[:, 0], 'y': xyz[:, 1], 'z': xyz[:, 2]})
+    for column in mean_columns:
+        work[column] = df[column].values
+    work = work[labels >= 0]
+
+    grouped = work.groupby('cluster')
+    summary = grouped[['x', 'y', 'z', *mean_columns]].mean()
+    summary.insert(0, 'n_members', grouped.size())
+    centre = summary[['x', 'y', 'z']].to_numpy(copy=True)
+    centre /= np.linalg.norm(centre, axis=1, keepdims=True)
+    summary.insert(1, 'ra', np.degrees(np.arctan2(centre[:, 1], centre[:, 0])) % 360.0)
+    summary.insert(2, 'dec', np.degrees(np.arcsin(np.clip(centre[:, 2], -1, 1))))
+
+    # Radius: largest member separation from its cluster centre
+    member_centre = centre[np.searchsorted(summary.index.values, work['cluster'].values)]
+    cos_sep = np.einsum('ij,ij->i', work[['x', 'y', 'z']].to_numpy(), member_centre)
+    work_radius = pd.Series(np.degrees(np.arccos(np.clip(cos_sep, -1, 1))), index=work.index)
+    summary.insert(3, 'radius_deg', work_radius.groupby(work['cluster']).max())
+    return summary.drop(columns=['x', 'y', 'z'])
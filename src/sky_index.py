@@ -0,0 +1,130 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# src/sky_index.py
+#
+# Reusable neighbour queries on the celestial sphere. Positions are mapped to
+# unit vectors so a Cartesian KD-tree gives exact great-circle ordering
+# (chord length is monotonic in angular separation), with no RA wrap-around
+# or high-declination distortion.
+
+
+def radec_to_unit_vectors(ra_deg, dec_deg):
+    """Converts RA/Dec arrays in degrees to an (n, 3) array of unit vectors."""
+    ra_rad = np.radians(np.asarray(ra_deg, dtype=np.float64))
+    dec_rad = np.radians(np.asarray(dec_deg, dtype=np.float64))
+    cos_dec = np.cos(dec_rad)
+    return np.column_stack((cos_dec * np.cos(ra_rad), cos_dec * np.sin(ra_rad), np.sin(dec_rad)))
+
+
+def chord_to_deg(chord):
+    """Converts unit-sphere chord lengths to angular separations in degrees."""
+    return np.degrees(2 * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1)))
+
+
+def deg_to_chord(sep_deg):
+    """Converts angular separations in degrees to unit-sphere chord lengths."""
+    return 2 * np.sin(np.radians(np.asarray(sep_deg, dtype=np.float64)) / 2)
+
+
+def build_sky_index(ra_deg, dec_deg):
+    """Builds a KD-tree over the unit-sphere positions of a catalogue."""
+    return cKDTree(radec_to_unit_vectors(ra_deg, dec_deg))
+
+
+def knn_neighbours(tree, k=5, workers=-1):
+    """
+    Returns the k nearest neighbours of every indexed point, excluding itself.
+
+    Args:
+        tree (cKDTree): Index from build_sky_index.
+        k (int): Number of neighbours per point (capped at n - 1).
+        workers (int): Threads used by the tree query (-1 = all cores).
+
+    Returns:
+        (sep_deg, idx): two (n, k) arrays, sorted by increasing separation.
+    """
+    n = tree.n
+    k = min(k, n - 1)
+    if k < 1:
+        return np.empty((n, 0)), np.empty((n, 0), dtype=np.intp)
+
+    chord, idx = tree.query(tree.data, k=k + 1, workers=workers)
+
+    # The nearest hit is normally the point itself, but exact duplicates can
+    # come back in either order, so drop self explicitly per row.
+    is_self = idx == np.arange(n)[:, None]
+    has_self = is_self.any(axis=1)
+    drop = np.where(has_self, np.argmax(is_self, axis=1), k)
+    keep = np.arange(k + 1)[None, :] != drop[:, None]
+    chord = chord[keep].reshape(n, k)
+    idx = idx[keep].reshape(n, k)
+
+    return chord_to_deg(chord), idx
+
+
+def mean_neighbour_pa_difference(pa_rad, neighbour_idx):
+    """
+    Mean absolute circular orientation difference (degrees) between each
+    galaxy and its neighbours, computed for all galaxies in one array pass.
+
+    Args:
+        pa_rad (np.ndarray): Position angles in radians, shape (n,) or
+            (m, n) for m independent realisations sharing one neighbour graph.
+        neighbour_idx (np.ndarray): Neighbour indices, shape (n, k).
+
+    Returns:
+        np.ndarray: shape (n,) or (m, n).
+    """
+    pa_rad = np.asarray(pa_rad)
+    delta = pa_rad[..., :, None] - pa_rad[..., neighbour_idx]
+    # Wrap to [-pi, pi) arithmetically; same result as |arctan2(sin, cos)|
+    # without three transcendental calls per pair.
+    diff = np.abs((delta + np.pi) % (2 * np.pi) - np.pi)
+    return np.degrees(diff.mean(axis=-1))
+
+
+def sky_tile_ids(ra_deg, dec_deg, tile_deg=10.0):
+    """
+    Assigns each position to a fixed RA/Dec grid tile (tile_deg x tile_deg).
+    Tile ids are row-major from the south pole, increasing with RA.
+    """
+    n_ra = int(np.ceil(360.0 / tile_deg))
+    n_dec = int(np.ceil(180.0 / tile_deg))
+    ra_band = np.floor(np.mod(np.asarray(ra_deg, dtype=np.float64), 360.0) / tile_deg).astype(np.int64)
+    dec_band = np.floor((np.asarray(dec_deg, dtype=np.float64) + 90.0) / tile_deg).astype(np.int64)
+    return np.clip(dec_band, 0, n_dec - 1) * n_ra + np.clip(ra_band, 0, n_ra - 1)
+
+
+def sky_tile_bounding_circles(tile_ids, tile_deg):
+    """
+    Centre unit vectors and angular radii (deg) of circles enclosing each tile.
+
+    For tiles up to 90 degrees the farthest point of an RA/Dec box from its
+    centre is a corner, so the radius is the largest corner distance.
+    """
+    n_ra = int(np.ceil(360.0 / tile_deg))
+    dec_band, ra_band = np.divmod(np.asarray(tile_ids), n_ra)
+    ra_min, dec_min = ra_band * tile_deg, -90.0 + dec_band * tile_deg
+    ra_max, dec_max = np.minimum(ra_min + tile_deg, 360.0), np.minimum(dec_min + tile_deg, 90.0)
+
+    centres = radec_to_unit_vectors((ra_min + ra_max) / 2, (dec_min + dec_max) / 2)
+    radius = np.zeros(len(centres))
+    for ra, dec in ((ra_min, dec_min), (ra_min, dec_max), (ra_max, dec_min), (ra_max, dec_max)):
+        cos_sep = np.einsum('ij,ij->i', centres, radec_to_unit_vectors(ra, dec))
+        radius = np.maximum(radius, np.degrees(np.arccos(np.clip(cos_sep, -1, 1))))
+    return centres, radius
+
+
+def direction_angle(ra0_deg, dec0_deg, ra_deg, dec_deg):
+    """
+    Direction (radians) from centre (ra0, dec0) to each position, measured in
+    the local tangent plane from the +RA axis towards +Dec, i.e. the same
+    convention as position_angle in the Euclid shear pseudo-vectors.
+    """
+    ra0, dec0 = np.radians(ra0_deg), np.radians(dec0_deg)
+    ra, dec = np.radians(ra_deg), np.radians(dec_deg)
+    d_ra = ra - ra0
+    east = np.cos(dec) * np.sin(d_ra)
+    north = np.cos(dec0) * np.sin(dec) - np.sin(dec0) * np.cos(dec) * np.cos(d_ra)
+    return np.arctan2(north, east)
@@ -0,0 +1,226 @@
+import argparse
+import numpy as np
+from matplotlib.figure import Figure
+from euclid_catalogue import iter_euclid_catalogue, euclid_partition_results
+
+# src/sky_maps.py
+#
+# Pixelised shear / orientation maps of the Euclid catalogue. Pixels form an
+# equal-area cylindrical grid: uniform in RA and in sin(Dec), so every pixel
+# covers exactly the same solid angle (like HEALPix, without needing healpy)
+# and a pixel index is two multiplications and a floor. Maps are accumulated
+# as per-pixel sums in one streaming pass over catalogue chunks; partial
+# accumulators (e.g. one per tile or worker) merge by adding their sums.
+# Saved maps keep only occupied pixels, and plots are drawn from the maps
+# instead of from individual galaxies. update_sky_maps() keeps the
+# occupied-pixel sums of every sky tile of the columnar cache, so after an
+# incremental download only the tiles that received rows are read again.
+
+DEFAULT_PIXEL_DEG = 0.5
+MAP_COLUMNS = ['right_ascension', 'declination', 'ellipticity', 'position_angle']
+SUM_NAMES = ['count', 'g1', 'g2', 'ellipticity', 'ellipticity_sq', 'cos_2pa', 'sin_2pa']
+
+
+def grid_shape(pixel_deg=DEFAULT_PIXEL_DEG):
+    """(n_ra, n_dec) for pixels pixel_deg wide, square at the equator."""
+    return int(np.ceil(360.0 / pixel_deg)), int(np.ceil(2.0 / np.radians(pixel_deg)))
+
+
+def equal_area_pixels(ra_deg, dec_deg, n_ra, n_dec):
+    """Pixel index (dec_band * n_ra + ra_band) on the equal-area grid."""
+    ra_band = np.floor(np.mod(np.asarray(ra_deg, dtype=np.float64), 360.0) / 360.0 * n_ra).astype(np.int64)
+    sin_dec = np.sin(np.radians(np.asarray(dec_deg, dtype=np.float64)))
+    dec_band = np.floor((sin_dec + 1) / 2 * n_dec).astype(np.int64)
+    return np.clip(dec_band, 0, n_dec - 1) * n_ra + np.clip(ra_band, 0, n_ra - 1)
+
+
+def pixel_edges(n_ra, n_dec):
+    """RA and Dec pixel edges in degrees (Dec edges are uniform in sin(Dec))."""
+    return np.linspace(0, 360.0, n_ra + 1), np.degrees(np.arcsin(np.linspace(-1, 1, n_dec + 1)))
+
+
+class SkyMapAccumulator:
+    """
+    Running per-pixel sums for count, g1, g2, ellipticity (and its square)
+    and the spin-2 position-angle vector (cos 2PA, sin 2PA).
+    """
+
+    def __init__(self, pixel_deg=DEFAULT_PIXEL_DEG):
+        self.pixel_deg = pixel_deg
+        self.n_ra, self.n_dec = grid_shape(pixel_deg)
+        self.sums = {name: np.zeros(self.n_ra * self.n_dec) for name in SUM_NAMES}
+
+    def add(self, ra_deg, dec_deg, ellipticity, position_angle_deg):
+        """Adds one chunk of galaxies."""
+        pix = equal_area_pixels(ra_deg, dec_deg, self.n_ra, self.n_dec)
+        e = np.asarray(ellipticity, dtype=np.float64)
+        theta = np.radians(np.asarray(position_angle_deg, dtype=np.float64))
+        size = len(self.sums['count'])
+        for name, weights in (('count', None), ('g1', e * np.cos(theta)), ('g2', e * np.sin(theta)),
+                              ('ellipticity', e), ('ellipticity_sq', e * e),
+                              ('cos_2pa', np.cos(2 * theta)), ('sin_2pa', np.sin(2 * theta))):
+            self.sums[name] += np.bincount(pix, weights=weights, minlength=size)
+        return self
+
+    def merge(self, other):
+        """Adds another accumulator's sums (same pixel size) into this one."""
+        if (other.n_ra, other.n_dec) != (self.n_ra, self.n_dec):
+            raise ValueError("Cannot merge sky maps with different pixel sizes.")
+        for name in SUM_NAMES:
+            self.sums[name] += other.sums[name]
+        return self
+
+    def maps(self):
+        """
+        Per-pixel maps, shape (n_dec, n_ra), NaN where a pixel is empty.
+
+        Returns:
+            dict with 'count', 'mean_g1', 'mean_g2', 'mean_ellipticity',
+            'std_ellipticity', 'mean_pa' (degrees, spin-2 mean) and
+            'pa_coherence' (|<exp(2i PA)>|, 0 = random, 1 = all aligned).
+        """
+        count = self.sums['count']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = {name: np.where(count > 0, self.sums[name] / count, np.nan) for name in SUM_NAMES[1:]}
+        result = {
+            'count': count,
+            'mean_g1': mean['g1'],
+            'mean_g2': mean['g2'],
+            'mean_ellipticity': mean['ellipticity'],
+            'std_ellipticity': np.sqrt(np.maximum(mean['ellipticity_sq'] - mean['ellipticity'] ** 2, 0)),
+            'mean_pa': np.degrees(0.5 * np.arctan2(mean['sin_2pa'], mean['cos_2pa'])) % 180.0,
+            'pa_coherence': np.hypot(mean['cos_2pa'], mean['sin_2pa']),
+        }
+        return {name: values.reshape(self.n_dec, self.n_ra) for name, values in result.items()}
+
+    def occupied_sums(self):
+        """{'pixels': occupied pixel indices, <sum name>: their sums}."""
+        occupied = np.flatnonzero(self.sums['count'])
+        return {'pixels': occupied.astype(np.int64), **{name: self.sums[name][occupied] for name in SUM_NAMES}}
+
+    def add_occupied_sums(self, sums):
+        """Adds sums from occupied_sums() of an accumulator with the same pixel size."""
+        for name in SUM_NAMES:
+            self.sums[name][sums['pixels']] += sums[name]
+        return self
+
+    def save(self, path):
+        """Writes the occupied pixels' sums to a compressed .npz."""
+        np.savez_compressed(path, pixel_deg=self.pixel_deg, **self.occupied_sums())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(float(data['pixel_deg'])).add_occupied_sums(data)
+
+
+def build_sky_maps(file_path, pixel_deg=DEFAULT_PIXEL_DEG, **read_kwargs):
+    """Accumulates maps over a Euclid catalogue in one chunked pass."""
+    accumulator = SkyMapAccumulator(pixel_deg)
+    for chunk in iter_euclid_catalogue(file_path, columns=MAP_COLUMNS, **read_kwargs):
+        accumulator.add(chunk['right_ascension'].values, chunk['declination'].values,
+                        chunk['ellipticity'].values, chunk['position_angle'].values)
+    return accumulator
+
+
+def update_sky_maps(file_path, pixel_deg=DEFAULT_PIXEL_DEG):
+    """
+    Maps merged from per-sky-tile sums stored with the columnar cache; only
+    tiles changed since the sums were stored are read.
+
+    Returns:
+        (accumulator, recomputed): The maps and the tiles read by this call
+        (None when there is no cache and the whole catalogue was read).
+    """
+    def compute(tiles):
+        return {tile: build_sky_maps(file_path, pixel_deg, partitions=[tile]).occupied_sums() for tile in tiles}
+
+    stored = euclid_partition_results(file_path, f'sky_maps_{pixel_deg:g}deg', compute)
+    if stored is None:
+        return build_sky_maps(file_path, pixel_deg), None
+    tile_sums, recomputed = stored
+    accumulator = SkyMapAccumulator(pixel_deg)
+    for tile in sorted(tile_sums):
+        accumulator.add_occupied_sums(tile_sums[tile])
+    return accumulator, recomputed
+
+
+def sky_map_figure(accumulator, quantity, title=None, cmap='viridis'):
+    """One map as a Figure, cropped to the band of occupied pixels."""
+    maps = accumulator.maps()
+    image = np.where(maps['count'] > 0, maps[quantity], np.nan)
+    ra_edges, dec_edges = pixel_edges(accumulator.n_ra, accumulator.n_dec)
+
+    rows = np.flatnonzero(maps['count'].any(axis=1))
+    cols = np.flatnonzero(maps['count'].any(axis=0))
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    if len(rows):
+        r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        mesh = ax.pcolormesh(ra_edges[c0:c1 + 1], dec_edges[r0:r1 + 1], image[r0:r1, c0:c1], cmap=cmap,
+                             shading='flat')
+        fig.colorbar(mesh, ax=ax, label=quantity.replace('_', ' '))
+    ax.set_title(title or f"Euclid {quantity.replace('_', ' ')} ({accumulator.pixel_deg} deg equal-area pixels)")
+    ax.set_xlabel('Right Ascension (deg)')
+    ax.set_ylabel('Declination (deg)')
+    fig.tight_layout()
+    return fig
+
+
+def shear_field_figure(accumulator, title=None):
+    """Mean ellipticity map with one pixel-mean (g1, g2) vector per occupied pixel (|g| = 1 spans two pixels)."""
+    maps = accumulator.maps()
+    ra_edges, dec_edges = pixel_edges(accumulator.n_ra, accumulator.n_dec)
+    dec_band, ra_band = np.nonzero(maps['count'])
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    if len(dec_band):
+        r0, r1, c0, c1 = dec_band.min(), dec_band.max() + 1, ra_band.min(), ra_band.max() + 1
+        mesh = ax.pcolormesh(ra_edges[c0:c1 + 1], dec_edges[r0:r1 + 1], maps['mean_ellipticity'][r0:r1, c0:c1],
+                             cmap='viridis', shading='flat')
+        fig.colorbar(mesh, ax=ax, label='mean ellipticity')
+        ra_centre = (ra_edges[ra_band] + ra_edges[ra_band + 1]) / 2
+        dec_centre = np.degrees(np.arcsin((np.sin(np.radians(dec_edges[dec_band])) +
+                                           np.sin(np.radians(dec_edges[dec_band + 1]))) / 2))
+        ax.quiver(ra_centre, dec_centre, maps['mean_g1'][dec_band, ra_band], maps['mean_g2'][dec_band, ra_band],
+                  color='red', width=0.002, angles='xy', scale_units='xy', scale=0.5 / accumulator.pixel_deg)
+    ax.set_title(title or f"Euclid pixel-mean shear ({accumulator.pixel_deg} deg equal-area pixels)")
+    ax.set_xlabel('Right Ascension (deg)')
+    ax.set_ylabel('Declination (deg)')
+    fig.tight_layout()
+    return fig
+
+
+def plot_sky_map(accumulator, quantity, output_file, title=None, cmap='viridis'):
+    """Renders one map to output_file."""
+    sky_map_figure(accumulator, quantity, title, cmap).savefig(output_file, dpi=150)
+
+
+def plot_shear_field(accumulator, output_file, title=None):
+    shear_field_figure(accumulator, title).savefig(output_file, dpi=150)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Equal-area shear and orientation maps of a Euclid catalogue.")
+    parser.add_argument("--data_file", type=str, default='euclid_lensing_candidates.csv')
+    parser.add_argument("--pixel_deg", type=float, default=DEFAULT_PIXEL_DEG, help="Pixel width in degrees.")
+    parser.add_argument("--output", type=str, default='euclid_sky_maps.npz', help="Compressed map file.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse stored per-tile sums and re-read only the sky tiles changed since.")
+    args = parser.parse_args()
+
+    if args.incremental:
+        sky_maps, recomputed = update_sky_maps(args.data_file, args.pixel_deg)
+        if recomputed is not None:
+            print(f"Re-read {len(recomputed)} sky tiles: {recomputed}")
+    else:
+        sky_maps = build_sky_maps(args.data_file, args.pixel_deg)
+    sky_maps.save(args.output)
+    print(f"Binned {int(sky_maps.sums['count'].sum())} galaxies into "
+          f"{np.count_nonzero(sky_maps.sums['count'])} occupied pixels; saved to {args.output}")
+    for quantity in ('count', 'mean_ellipticity', 'pa_coherence'):
+        plot_sky_map(sky_maps, quantity, f'euclid_map_{quantity}.png')
+        print(f"Saved euclid_map_{quantity}.png")
+    plot_shear_field(sky_maps, 'euclid_map_shear.png')
+    print("Saved euclid_map_shear.png")
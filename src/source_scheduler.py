@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import hashlib
+from http_client import get_client
+from cern_data_fetcher import LHCb_GITHUB_REPO_URL, _get_latest_github_commit_hash
+
+# src/source_scheduler.py
+#
+# One long-running process that replaces cron-driven, one-shot runs of the
+# fetchers, miners and analyses. Each source (the LHCb GitHub repository, the
+# Euclid TAP service, MAST and the Rubin Science Platform) has a cheap check
+# that returns a fingerprint of its current state - a commit hash, a row
+# count, a digest of observation ids or of a conditionally fetched page.
+# The sources are polled concurrently, every one on its own interval with
+# random jitter and exponential backoff after failed checks. Only when a
+# fingerprint differs from the last one that was processed successfully are
+# the source's miner and then its analyses run, as subprocesses.
+#
+# Work is never duplicated: each source's poll loop waits for its own
+# pipeline before polling again, and a step shared by several sources
+# (shear_profiles.py needs both Euclid and JWST) runs once at a time; a
+# request that arrives while it is running schedules a single rerun instead
+# of a second concurrent copy. Fingerprints are committed to the state file
+# only after the pipeline succeeds, so a failed run is retried on the next
+# poll and a restart does not re-run work that is already done.
+
+STATE_FILE = '.scheduler_state.json'
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_JITTER = 0.1
+DEFAULT_MAX_BACKOFF = 6 * 3600
+# A check that hangs longer than this counts as failed
+CHECK_TIMEOUT = 300
+# Miners and analyses use process pools of their own; bound how many run at once
+MAX_CONCURRENT_STEPS = 2
+
+EUCLID_TABLE = 'catalogue.mer_catalogue'
+EUCLID_WHERE = 'det_quality_flag = 0'
+RUBIN_TABLES_URL = 'https://data.lsst.cloud/api/tap/tables'
+
+
+def check_github():
+    """Latest commit hash of the LHCb analysis repository (ETag-conditional)."""
+    return _get_latest_github_commit_hash(LHCb_GITHUB_REPO_URL)
+
+
+def check_euclid(tap=None):
+    """
+    Number of good-quality MER catalogue rows.
+
+    object_ids encode position rather than release order, so a new release
+    need not raise the largest id; the row count changes whenever rows are
+    added, and euclid_data_miner.py --incremental then has rows to fetch.
+    """
+    if tap is None:
+        from astroquery.esa.euclid import Euclid as tap
+    query = f"SELECT COUNT(*) AS n_rows FROM {EUCLID_TABLE} WHERE {EUCLID_WHERE}"
+    results = tap.launch_job(query).get_results()
+    return str(results['n_rows'][0])
+
+
+def check_mast(observations=None):
+    """Digest of the JADES NIRCam observation and HLSP catalogue ids at MAST."""
+    if observations is None:
+        from astroquery.mast import Observations as observations
+    digest = hashlib.sha256()
+    for criteria in ({'proposal_id': ['1180'], 'obs_collection': 'JWST', 'instrument_name': 'NIRCAM/IMAGE',
+                      'project': 'JWST'},
+                     {'obs_collection': 'HLSP', 'project': 'JADES', 'dataproduct_type': 'catalog'}):
+        obs_ids = sorted(str(obs_id) for obs_id in observations.query_criteria(**criteria)['obsid'])
+        digest.update(f'{len(obs_ids)}:{",".join(obs_ids)};'.encode())
+    return digest.hexdigest()
+
+
+def check_rubin(url=RUBIN_TABLES_URL):
+    """Digest of the RSP TAP table listing, revalidated with a conditional GET."""
+    return hashlib.sha256(get_client().fetch(url)['content']).hexdigest()
+
+
+# Steps are (script in src/, arguments...). The miner steps of a source run in
+# order; its analyses then run concurrently. The Euclid miner leaves the
+# columnar cache current before it exits, so the analyses only read it, and
+# process_euclid_candidates re-reads just the sky tiles the miner appended to.
+SOURCES = {
+    'github': {
+        'check': check_github,
+        'interval': 900,
+        'miner': [('cern_data_fetcher.py',)],
+        'analyses': [('periodogram.py',), ('detect_boundary_crossings.py',), ('lunar_phase_correlator.py',)],
+    },
+    'euclid': {
+        'check': check_euclid,
+        'interval': 3600,
+        'miner': [('euclid_data_miner.py', '--incremental')],
+        'analyses': [('process_euclid_candidates.py', '--incremental'), ('analyze_euclid.py',),
+                     ('analyze_alignment.py',), ('shear_profiles.py',)],
+    },
+    'mast': {
+        'check': check_mast,
+        'interval': 6 * 3600,
+        'miner': [('jwst_data_miner.py',)],
+        'analyses': [('shear_profiles.py',)],
+    },
+    'rubin': {
+        'check': check_rubin,
+        'interval': 6 * 3600,
+        'miner': [('rubin_data_miner.py',)],
+        'analyses': [],
+    },
+}
+
+
+def load_config(path, sources=SOURCES):
+    """
+    Per-source settings, with overrides from a JSON file such as
+    {"euclid": {"interval": 1800, "jitter": 0.2}, "rubin": {"enabled": false}}.
+
+    Recognised keys are interval, jitter and max_backoff (seconds, jitter as a
+    fraction of the delay) and enabled.
+    """
+    config = {}
+    for name, spec in sources.items():
+        config[name] = dict(spec, jitter=DEFAULT_JITTER, max_backoff=DEFAULT_MAX_BACKOFF, enabled=True)
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for name, values in overrides.items():
+            if name not in config:
+                raise ValueError(f"Unknown source '{name}' in {path}; expected one of {sorted(config)}")
+            unknown = set(values) - {'interval', 'jitter', 'max_backoff', 'enabled'}
+            if unknown:
+                raise ValueError(f"Unknown settings {sorted(unknown)} for source '{name}' in {path}")
+            config[name].update(values)
+    return config
+
+
+def next_delay(interval, failures, jitter, max_backoff, rng=random):
+    """Seconds until the next check: the interval, doubled per consecutive failure, +/- jitter."""
+    delay = min(interval * 2 ** failures, max_backoff) if failures else interval
+    return delay * (1 + rng.uniform(-jitter, jitter))
+
+
+class SourceScheduler:
+    """
+    Polls the configured sources concurrently and runs each one's pipeline
+    when its fingerprint changes.
+    """
+
+    def __init__(self, config, state_file=STATE_FILE, max_concurrent_steps=MAX_CONCURRENT_STEPS, seed=None):
+        self.config = config
+        self.state_file = state_file
+        self.rng = random.Random(seed)
+        self.state = self._load_state()
+        self._step_slots = asyncio.Semaphore(max_concurrent_steps)
+        self._running_steps = {}
+        self._rerun_steps = set()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    async def _run_command(self, step):
+        async with self._step_slots:
+            print(f"[scheduler] Running {' '.join(step)}")
+            process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(SRC_DIR, step[0]), *step[1:])
+            try:
+                return_code = await process.wait()
+            except asyncio.CancelledError:
+                process.terminate()
+                await process.wait()
+                raise
+        if return_code != 0:
+            print(f"[scheduler] {' '.join(step)} exited with status {return_code}")
+        return return_code
+
+    async def _step_loop(self, step):
+        while True:
+            self._rerun_steps.discard(step)
+            return_code = await self._run_command(step)
+            # Inputs changed again while it ran: one more pass covers every such request
+            if step not in self._rerun_steps:
+                return return_code
+
+    async def run_step(self, step):
+        """Runs a step, or joins the copy already in flight and schedules one rerun."""
+        task = self._running_steps.get(step)
+        if task is not None and not task.done():
+            self._rerun_steps.add(step)
+        else:
+            task = asyncio.ensure_future(self._step_loop(step))
+            self._running_steps[step] = task
+            task.add_done_callback(lambda _: self._running_steps.pop(step, None))
+        return await asyncio.shield(task)
+
+    async def run_pipeline(self, name):
+        """Miner steps in order, then the analyses concurrently. True if all succeeded."""
+        spec = self.config[name]
+        for step in spec['miner']:
+            if await self.run_step(step) != 0:
+                print(f"[scheduler] {name}: miner failed; analyses skipped")
+                return False
+        return_codes = await asyncio.gather(*(self.run_step(step) for step in spec['analyses']))
+        return all(code == 0 for code in return_codes)
+
+    async def poll_once(self, name):
+        """
+        Checks one source and runs its pipeline if it changed.
+
+        Returns:
+            True if the check succeeded (changed or not) and any triggered
+            pipeline succeeded, False otherwise.
+        """
+        spec = self.config[name]
+        try:
+            fingerprint = await asyncio.wait_for(asyncio.to_thread(spec['check']), CHECK_TIMEOUT)
+        except Exception as e:
+            print(f"[scheduler] {name}: check failed ({type(e).__name__}: {e})")
+            return False
+        if fingerprint is None:
+            print(f"[scheduler] {name}: check returned no fingerprint")
+            return False
+
+        previous = self.state.get(name, {}).get('fingerprint')
+        if fingerprint == previous:
+            print(f"[scheduler] {name}: unchanged")
+            return True
+        print(f"[scheduler] {name}: changed ({str(previous)[:12]} -> {str(fingerprint)[:12]})")
+        if not await self.run_pipeline(name):
+            return False
+        self.state[name] = {'fingerprint': fingerprint, 'processed_at': time.time()}
+        self._save_state()
+        return True
+
+    async def poll_forever(self, name):
+        spec = self.config[name]
+        failures = 0
+        while True:
+            failures = 0 if await self.poll_once(name) else failures + 1
+            delay = next_delay(spec['interval'], failures, spec['jitter'], spec['max_backoff'], self.rng)
+            print(f"[scheduler] {name}: next check in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    def _enabled(self, names=None):
+        return [name for name in (names or self.config) if self.config[name]['enabled']]
+
+    async def run_once(self, names=None):
+        """One concurrent round of checks (and triggered pipelines). Returns {source: ok}."""
+        names = self._enabled(names)
+        results = await asyncio.gather(*(self.poll_once(name) for name in names))
+        return dict(zip(names, results))
+
+    async def run_forever(self, names=None):
+        """Polls until SIGINT/SIGTERM, then stops running steps and returns."""
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # No signal handlers here (e.g. Windows); Ctrl+C still cancels asyncio.run()
+        pollers = [asyncio.ensure_future(self.poll_forever(name)) for name in self._enabled(names)]
+        await stop.wait()
+        print("[scheduler] Shutting down...")
+        for poller in pollers:
+            poller.cancel()
+        await asyncio.gather(*pollers, return_exceptions=True)
+        for task in list(self._running_steps.values()):
+            task.cancel()
+        await asyncio.gather(*self._running_steps.values(), return_exceptions=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Poll the data sources and run miners/analyses when they change.")
+    parser.add_argument("--config", type=str, default=None,
+                        help="JSON file overriding per-source interval, jitter, max_backoff or enabled.")
+    parser.add_argument("--sources", nargs="+", choices=sorted(SOURCES), default=None,
+                        help="Only poll these sources.")
+    parser.add_argument("--state_file", type=str, default=STATE_FILE,
+                        help="Fingerprints of the last successfully processed state of each source.")
+    parser.add_argument("--once", action="store_true", help="Run a single round of checks and exit.")
+    args = parser.parse_args()
+
+    scheduler_config = load_config(args.config)
+
+    async def main():
+        scheduler = SourceScheduler(scheduler_config, state_file=args.state_file)
+        if args.once:
+            results = await scheduler.run_once(args.sources)
+            return 0 if all(results.values()) else 1
+        await scheduler.run_forever(args.sources)
+        return 0
+
+    sys.exit(asyncio.run(main()))
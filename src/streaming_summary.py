@@ -0,0 +1,369 @@
+import numpy as np
+import pandas as pd
+from euclid_catalogue import iter_euclid_catalogue, euclid_partitions, euclid_partition_results
+from parallel import worker_state, run_tasks, spawn_seeds
+
+# src/streaming_summary.py
+#
+# One-pass summaries of catalogue columns. Every numeric column keeps a count,
+# running moments (merged with Chan et al.'s pairwise update), min/max, a
+# KLL-style quantile sketch and a fixed-bin histogram, all of which are
+# mergeable: summaries of separate sky tiles can be built in parallel and
+# added together in any grouping. update_catalogue_summary() keeps one summary
+# per sky tile with the columnar cache and re-reads only the changed tiles.
+#
+# The sketch holds a few hundred items per column regardless of catalogue
+# size; items at level h stand for 2**h values. When a level overflows it is
+# sorted and every other item (from a random offset) moves up a level, which
+# keeps the rank error around 1/k.
+#
+# Histograms use fixed ranges for the known Euclid columns, binned finely
+# enough to be rebinned for plotting. Because bin counts are exact, they also
+# locate the bin that holds any order statistic, so select_tails() can find
+# exact quantile thresholds (linear interpolation, as np.quantile) in a second pass
+# that only keeps values from that bin plus the selected rows themselves.
+# Columns without a known range get their histogram from the sketch instead.
+
+DEFAULT_SKETCH_K = 200
+# Fine histogram bins: divisible by the bin counts used in the plots (50, 30)
+HISTOGRAM_BINS = 600
+HISTOGRAM_RANGES = {
+    'ellipticity': (0.0, 1.0),
+    'position_angle': (-90.0, 90.0),
+    'point_like_prob': (0.0, 1.0),
+    'extended_prob': (0.0, 1.0),
+    'blended_prob': (0.0, 1.0),
+}
+
+# Partitions are grouped into at most this many tasks, whatever the pool size
+MAX_TASKS = 64
+
+
+class QuantileSketch:
+    """Mergeable KLL-style quantile sketch of a stream of floats."""
+
+    def __init__(self, k=DEFAULT_SKETCH_K, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level))))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so the total weight is preserved
+                keep, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2)::2]])
+                self.levels[level] = keep
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate([self.levels[0], values[np.isfinite(values)]])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError("Cannot merge quantile sketches with different k.")
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compress()
+        return self
+
+    def weighted_items(self):
+        """Sorted retained items and the number of values each stands for."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        items, weights = self.weighted_items()
+        if not len(items):
+            return np.full(np.shape(q), np.nan)
+        # Each item sits at the middle of the rank range it represents
+        ranks = (np.cumsum(weights) - weights / 2) / weights.sum()
+        return np.interp(q, ranks, items)
+
+
+def _bin_index(values, value_range, bins=HISTOGRAM_BINS):
+    """Histogram slot per value: 0 = underflow, 1..bins, bins + 1 = overflow."""
+    lo, hi = value_range
+    index = np.floor((np.asarray(values, dtype=np.float64) - lo) / (hi - lo) * bins).astype(np.int64) + 1
+    return np.clip(index, 0, bins + 1)
+
+
+class ColumnSummary:
+    """Count, moments, extremes, quantile sketch and histogram of one column."""
+
+    def __init__(self, dtype, value_range=None, sketch_k=DEFAULT_SKETCH_K, seed=0):
+        self.dtype = str(dtype)
+        self.count = 0
+        self.n_missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(sketch_k, seed)
+        self.value_range = value_range
+        # Slots: underflow, HISTOGRAM_BINS bins, overflow
+        self.histogram = None if value_range is None else np.zeros(HISTOGRAM_BINS + 2, dtype=np.int64)
+
+    def _combine(self, count, mean, m2, lo, hi):
+        total = self.count + count
+        if count:
+            delta = mean - self.mean
+            self.mean += delta * count / total
+            self.m2 += m2 + delta ** 2 * self.count * count / total
+            self.min, self.max = min(self.min, lo), max(self.max, hi)
+        self.count = total
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        self.n_missing += len(values) - len(finite)
+        if len(finite):
+            mean = finite.mean()
+            self._combine(len(finite), mean, ((finite - mean) ** 2).sum(), finite.min(), finite.max())
+        self.sketch.update(finite)
+        if self.histogram is not None:
+            self.histogram += np.bincount(_bin_index(finite, self.value_range), minlength=len(self.histogram))
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        self.n_missing += other.n_missing
+        self.sketch.merge(other.sketch)
+        if self.histogram is not None:
+            self.histogram += other.histogram
+        return self
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1, as in pandas)."""
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def quantile(self, q):
+        """Approximate quantile(s) from the sketch, clipped to the observed range."""
+        return np.clip(self.sketch.quantile(q), self.min, self.max) if self.count else np.full(np.shape(q), np.nan)
+
+    def binned(self, bins=50):
+        """
+        Histogram counts and edges for plotting.
+
+        Fixed-range columns rebin their exact counts (bins must divide
+        HISTOGRAM_BINS; values outside the range are left out); other columns
+        use the sketch weights over [min, max].
+        """
+        if self.histogram is not None:
+            if HISTOGRAM_BINS % bins:
+                raise ValueError(f"bins must divide {HISTOGRAM_BINS}, got {bins}.")
+            return (self.histogram[1:-1].reshape(bins, -1).sum(axis=1),
+                    np.linspace(*self.value_range, bins + 1))
+        items, weights = self.sketch.weighted_items()
+        return np.histogram(items, bins=bins, range=(self.min, self.max) if self.count else None, weights=weights)
+
+
+class CatalogueSummary:
+    """Per-column summaries of a whole catalogue, built chunk by chunk."""
+
+    def __init__(self, sketch_k=DEFAULT_SKETCH_K, seed=0):
+        self.sketch_k = sketch_k
+        self.seed = seed
+        self.n_rows = 0
+        self.columns = {}
+
+    def update(self, chunk):
+        """Adds a DataFrame chunk; numeric columns are summarised, others ignored."""
+        self.n_rows += len(chunk)
+        for name in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(chunk[name]):
+                continue
+            if name not in self.columns:
+                seed = (self.seed, len(self.columns))
+                self.columns[name] = ColumnSummary(chunk[name].dtype, HISTOGRAM_RANGES.get(name), self.sketch_k, seed)
+            self.columns[name].update(chunk[name].values)
+        return self
+
+    def merge(self, other):
+        self.n_rows += other.n_rows
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+        return self
+
+    def describe(self):
+        """Table in the layout of DataFrame.describe() (quartiles from the sketches)."""
+        rows = {}
+        for name, c in self.columns.items():
+            q25, q50, q75 = c.quantile([0.25, 0.5, 0.75])
+            rows[name] = {'count': c.count, 'mean': c.mean if c.count else np.nan, 'std': c.std,
+                          'min': c.min if c.count else np.nan, '25%': q25, '50%': q50, '75%': q75,
+                          'max': c.max if c.count else np.nan}
+        return pd.DataFrame(rows)
+
+    def info(self):
+        """Columns, dtypes and non-null counts, as in DataFrame.info()."""
+        print(f"{self.n_rows} rows, {len(self.columns)} numeric columns")
+        print(f" #   {'Column':<20} {'Non-Null Count':>16}  Dtype")
+        for i, (name, c) in enumerate(self.columns.items()):
+            print(f" {i:<3} {name:<20} {c.count:>7} non-null  {c.dtype}")
+
+
+def _summarize_partitions(task):
+    """Summary of the rows in one task's partitions (None = whole catalogue)."""
+    partitions, seed = task
+    summary = CatalogueSummary(worker_state['sketch_k'], seed)
+    for chunk in iter_euclid_catalogue(worker_state['file_path'], columns=worker_state['columns'],
+                                       partitions=partitions):
+        summary.update(chunk)
+    return summary
+
+
+def summarize_catalogue(file_path, columns=None, sketch_k=DEFAULT_SKETCH_K, n_workers=None, seed=0):
+    """
+    Summarises every numeric column of a Euclid catalogue in one pass.
+
+    Groups of sky-tile partitions of the columnar cache are summarised
+    independently (on a process pool) and merged in partition order, so the
+    result for a given seed does not depend on the pool size.
+
+    Args:
+        file_path (str): Path to the catalogue CSV.
+        columns (list, optional): Columns to summarise. Defaults to all.
+        sketch_k (int): Quantile sketch size (rank error ~ 1/k).
+        n_workers (int, optional): Process pool size (defaults to CPU count).
+                                   Use 1 to run in-process.
+        seed (int): Seed for the sketches' compaction offsets.
+
+    Returns:
+        CatalogueSummary
+    """
+    keys = euclid_partitions(file_path)
+    groups = [None] if keys is None else [list(g) for g in np.array_split(keys, min(len(keys), MAX_TASKS)) if len(g)]
+    tasks = [(partitions, int(s.generate_state(1)[0])) for partitions, s in zip(groups, spawn_seeds(seed, len(groups)))]
+    results = run_tasks(_summarize_partitions, tasks,
+                        {'file_path': file_path, 'columns': columns, 'sketch_k': sketch_k}, n_workers)
+
+    summary = CatalogueSummary(sketch_k, seed)
+    for partial in results:
+        summary.merge(partial)
+    return summary
+
+
+def update_catalogue_summary(file_path, columns=None, sketch_k=DEFAULT_SKETCH_K, n_workers=None, seed=0):
+    """
+    summarize_catalogue() merged from per-sky-tile summaries stored with the
+    columnar cache; only tiles changed since they were stored are read.
+
+    Each tile's sketches are seeded from (seed, tile), so a stored tile does
+    not depend on which others changed. Quantiles agree with
+    summarize_catalogue() to within the sketch error; everything else is exact.
+
+    Returns:
+        (summary, recomputed): CatalogueSummary and the tiles read by this call
+        (None when there is no cache and the whole catalogue was read).
+    """
+    def compute(tiles):
+        tasks = [([tile], int(np.random.SeedSequence([seed, tile]).generate_state(1)[0])) for tile in tiles]
+        partials = run_tasks(_summarize_partitions, tasks,
+                             {'file_path': file_path, 'columns': columns, 'sketch_k': sketch_k}, n_workers,
+                             chunksize=None)
+        return dict(zip(tiles, partials))
+
+    name = f"summary_{'all' if columns is None else '+'.join(columns)}_k{sketch_k}_seed{seed}"
+    stored = euclid_partition_results(file_path, name, compute)
+    if stored is None:
+        return summarize_catalogue(file_path, columns, sketch_k, n_workers, seed), None
+    tile_summaries, recomputed = stored
+    summary = CatalogueSummary(sketch_k, seed)
+    for tile in sorted(tile_summaries):
+        summary.merge(tile_summaries[tile])
+    return summary, recomputed
+
+
+def _quantile_band(column, q):
+    """
+    Histogram slots holding the order statistics of the q-quantile.
+
+    Returns:
+        (first_slot, last_slot, rank, n_below): Slot range, the (fractional)
+        target rank as in np.quantile's linear interpolation, and the number of
+        values in slots before first_slot.
+    """
+    rank = q * (column.count - 1)
+    cumulative = np.cumsum(column.histogram)
+    first = int(np.searchsorted(cumulative, np.floor(rank), side='right'))
+    last = int(np.searchsorted(cumulative, np.ceil(rank), side='right'))
+    return first, last, rank, int(cumulative[first - 1]) if first else 0
+
+
+def _exact_quantile(band_values, rank, n_below):
+    values = np.sort(band_values)
+    lo, hi = values[int(np.floor(rank)) - n_below], values[int(np.ceil(rank)) - n_below]
+    # Same interpolation arithmetic as np.quantile, so thresholds match bit for bit
+    t = rank - np.floor(rank)
+    return hi - (hi - lo) * (1 - t) if t >= 0.5 else lo + (hi - lo) * t
+
+
+def select_tails(file_path, summary, column='ellipticity', lower_q=0.05, upper_q=0.95, columns=None):
+    """
+    Rows below the lower_q and above the upper_q quantile of a column.
+
+    A second pass over the catalogue keeps only the rows beyond the histogram
+    bins that hold each threshold, plus the column values inside those bins,
+    from which the thresholds are computed exactly.
+
+    Args:
+        file_path (str): Path to the catalogue CSV.
+        summary (CatalogueSummary): First-pass summary with a fixed-range
+                                    histogram for `column`.
+        column (str): Column to select on.
+        lower_q, upper_q (float): Quantiles defining the two tails.
+        columns (list, optional): Columns of the returned rows. Defaults to all.
+
+    Returns:
+        (low_threshold, low_rows, high_threshold, high_rows): Thresholds equal
+        to np.quantile() of the column (in float64) and the rows strictly
+        beyond each one, sorted by object_id (cache reads come in sky-tile
+        order, so this keeps the result independent of the partitioning).
+        Catalogues without object_id keep the read order.
+    """
+    stats = summary.columns[column]
+    if stats.histogram is None:
+        raise ValueError(f"Column '{column}' has no fixed-range histogram to select on.")
+    low_first, low_last, low_rank, low_below = _quantile_band(stats, lower_q)
+    high_first, high_last, high_rank, high_below = _quantile_band(stats, upper_q)
+
+    order_by = ['object_id'] if 'object_id' in pd.read_csv(file_path, nrows=0).columns else []
+    read_columns = None if columns is None else list(dict.fromkeys([*columns, column, *order_by]))
+    low_rows, high_rows, low_band, high_band = [], [], [], []
+    for chunk in iter_euclid_catalogue(file_path, columns=read_columns):
+        values = chunk[column].values.astype(np.float64)
+        finite = np.isfinite(values)
+        slots = np.full(len(values), -1, dtype=np.int64)
+        slots[finite] = _bin_index(values[finite], stats.value_range)
+        low_band.append(values[(slots >= low_first) & (slots <= low_last)])
+        high_band.append(values[(slots >= high_first) & (slots <= high_last)])
+        low_rows.append(chunk[(slots >= 0) & (slots <= low_last)])
+        high_rows.append(chunk[slots >= high_first])
+
+    low_threshold = _exact_quantile(np.concatenate(low_band), low_rank, low_below)
+    high_threshold = _exact_quantile(np.concatenate(high_band), high_rank, high_below)
+    low_rows = pd.concat(low_rows, ignore_index=True).sort_values(order_by, kind='stable')
+    high_rows = pd.concat(high_rows, ignore_index=True).sort_values(order_by, kind='stable')
+    select = columns if columns is not None else low_rows.columns
+    return (low_threshold, low_rows.loc[low_rows[column] < low_threshold, select].reset_index(drop=True),
+            high_threshold, high_rows.loc[high_rows[column] > high_threshold, select].reset_index(drop=True))
@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# src/tap_download.py
+#
+# Tiled, paged and resumable download of a large TAP table. The sky is split
+# into the same RA/Dec grid used by sky_index.sky_tile_ids / dataset_cache, each
+# tile is fetched page by page using keyset paging on an id column
+# (WHERE id > last ORDER BY id), and tiles run concurrently on a bounded thread
+# pool. Every page is written to its own file before the checkpoint is
+# advanced, so an interrupted run resumes from the last completed page.
+#
+# Ids are only a paging key, not a high-water mark: Euclid object_ids encode
+# the position, so a newly released source can sort below ids already
+# fetched. refresh() therefore re-pages every tile in full, as a new pass that
+# supersedes the earlier pages, and append_new_rows() adds only the rows whose
+# id is not in the local CSV yet.
+#
+# The `tap` argument only needs launch_job(query).get_results(), so a local
+# stub can stand in for astroquery's Euclid service.
+
+CHECKPOINT_NAME = 'checkpoint.json'
+
+
+def make_sky_tiles(tile_deg=10.0):
+    """Returns the RA/Dec grid tiles as dicts (tile_id matches sky_tile_ids)."""
+    n_ra = int(np.ceil(360.0 / tile_deg))
+    n_dec = int(np.ceil(180.0 / tile_deg))
+    tiles = []
+    for dec_band in range(n_dec):
+        for ra_band in range(n_ra):
+            tiles.append({
+                'tile_id': dec_band * n_ra + ra_band,
+                'ra_min': ra_band * tile_deg,
+                'ra_max': min((ra_band + 1) * tile_deg, 360.0),
+                'dec_min': -90.0 + dec_band * tile_deg,
+                'dec_max': min(-90.0 + (dec_band + 1) * tile_deg, 90.0),
+            })
+    return tiles
+
+
+def build_tile_query(select_columns, table, where, tile, id_column, after_id=None, page_size=2000,
+                     ra_column='right_ascension', dec_column='declination'):
+    """Builds the ADQL for one page of one tile."""
+    # Half-open boxes so each source lands in exactly one tile; the last
+    # declination band is closed to keep objects at the pole.
+    dec_op = '<=' if tile['dec_max'] >= 90.0 else '<'
+    conditions = [
+        f"{ra_column} >= {tile['ra_min']!r}",
+        f"{ra_column} < {tile['ra_max']!r}",
+        f"{dec_column} >= {tile['dec_min']!r}",
+        f"{dec_column} {dec_op} {tile['dec_max']!r}",
+    ]
+    if where:
+        conditions.insert(0, f"({where})")
+    if after_id is not None:
+        conditions.append(f"{id_column} > {after_id}")
+    return (f"SELECT TOP {page_size} {', '.join(select_columns)} FROM {table} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY {id_column}")
+
+
+def _results_to_frame(results):
+    if results is None:
+        return pd.DataFrame()
+    if hasattr(results, 'to_pandas'):
+        return results.to_pandas()
+    return pd.DataFrame(results)
+
+
+class TiledTapDownload:
+    """
+    Resumable tiled download of one TAP query into a checkpoint directory.
+
+    Layout of work_dir:
+        checkpoint.json             per-tile state (last id, pages, first page
+                                    of the current pass, merged pages, rows,
+                                    complete)
+        tile_000123/page_00000.csv  one file per fetched page
+    """
+
+    def __init__(self, tap, table, select_columns, work_dir, where=None, id_column='object_id',
+                 tile_deg=10.0, page_size=2000, max_workers=4, max_retries=3, retry_delay=2.0,
+                 ra_column='right_ascension', dec_column='declination'):
+        self.tap = tap
+        self.table = table
+        self.select_columns = list(select_columns)
+        self.work_dir = work_dir
+        self.where = where
+        self.id_column = id_column
+        self.tile_deg = tile_deg
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.ra_column = ra_column
+        self.dec_column = dec_column
+        self._lock = threading.Lock()
+        os.makedirs(work_dir, exist_ok=True)
+        self.state = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        path = os.path.join(self.work_dir, CHECKPOINT_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('query') == self._query_key():
+                return state
+            print(f"Checkpoint in {self.work_dir} is for a different query; starting afresh.")
+        return {'query': self._query_key(), 'tiles': {}}
+
+    def _query_key(self):
+        return {'table': self.table, 'columns': self.select_columns, 'where': self.where,
+                'id_column': self.id_column, 'tile_deg': self.tile_deg}
+
+    def _save_checkpoint(self):
+        # Caller holds self._lock
+        path = os.path.join(self.work_dir, CHECKPOINT_NAME)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, path)
+
+    def tile_dir(self, tile_id):
+        return os.path.join(self.work_dir, f'tile_{tile_id:06d}')
+
+    def _tile_state(self, tile_id):
+        return self.state['tiles'].get(str(tile_id), {'last_id': None, 'pages': 0, 'rows': 0, 'complete': False})
+
+    def _fetch_page(self, query):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return _results_to_frame(self.tap.launch_job(query).get_results())
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = self.retry_delay * 2 ** attempt
+                print(f"  Query failed ({e}); retrying in {wait:.0f}s...")
+                time.sleep(wait)
+
+    def _download_tile(self, tile):
+        tile_id = tile['tile_id']
+        with self._lock:
+            tile_state = dict(self._tile_state(tile_id))
+        if tile_state['complete']:
+            return tile_id, tile_state['rows']
+
+        out_dir = self.tile_dir(tile_id)
+        os.makedirs(out_dir, exist_ok=True)
+        while True:
+            query = build_tile_query(self.select_columns, self.table, self.where, tile, self.id_column,
+                                     tile_state['last_id'], self.page_size, self.ra_column, self.dec_column)
+            page = self._fetch_page(query)
+
+            if len(page):
+                # Page files are named by sequence number, so a page refetched
+                # after a crash simply overwrites its earlier partial copy.
+                page_path = os.path.join(out_dir, f"page_{tile_state['pages']:05d}.csv")
+                page.to_csv(page_path + '.tmp', index=False)
+                os.replace(page_path + '.tmp', page_path)
+                tile_state['last_id'] = int(page[self.id_column].max())
+                tile_state['pages'] += 1
+                tile_state['rows'] += len(page)
+            tile_state['complete'] = len(page) < self.page_size
+
+            with self._lock:
+                self.state['tiles'][str(tile_id)] = dict(tile_state)
+                self._save_checkpoint()
+            if tile_state['complete']:
+                return tile_id, tile_state['rows']
+
+    def run(self, tiles=None):
+        """
+        Downloads all (or the given) tiles, skipping those already complete.
+
+        Returns:
+            list: tile_ids that failed after all retries (empty on success).
+        """
+        if tiles is None:
+            tiles = make_sky_tiles(self.tile_deg)
+        pending = [t for t in tiles if not self._tile_state(t['tile_id'])['complete']]
+        print(f"{len(tiles) - len(pending)} of {len(tiles)} tiles already downloaded; fetching {len(pending)}...")
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._download_tile, t): t['tile_id'] for t in pending}
+            for future in as_completed(futures):
+                tile_id = futures[future]
+                try:
+                    _, rows = future.result()
+                    if rows:
+                        print(f"  Tile {tile_id}: {rows} rows")
+                except Exception as e:
+                    print(f"  Tile {tile_id} failed: {e}")
+                    failed.append(tile_id)
+        return sorted(failed)
+
+    def refresh(self, tiles=None):
+        """
+        Incremental update: re-pages every tile from the start as a new pass,
+        whose pages supersede the earlier ones. An interrupted refresh resumes
+        its pass instead of starting another.
+
+        Returns:
+            (rows, failed): {tile_id: rows in the new pass} for non-empty tiles,
+            and the tile_ids that failed after all retries.
+        """
+        stale = []
+        with self._lock:
+            if not self.state.get('refreshing'):
+                for tile_id, tile_state in self.state['tiles'].items():
+                    # Earlier pages were merged, or hold rows this pass fetches again
+                    stale.extend(os.path.join(self.tile_dir(int(tile_id)), f'page_{page:05d}.csv')
+                                 for page in range(tile_state.get('pass_start', 0), tile_state['pages']))
+                    tile_state.update(last_id=None, complete=False, rows=0, pass_start=tile_state['pages'],
+                                      merged_pages=tile_state['pages'])
+                self.state['refreshing'] = True
+                self._save_checkpoint()
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+
+        failed = self.run(tiles)
+        if not failed:
+            with self._lock:
+                self.state['refreshing'] = False
+                self._save_checkpoint()
+        rows = {int(t): s['rows'] for t, s in self.state['tiles'].items() if s['rows']}
+        return rows, failed
+
+    def page_files(self, tile_ids=None, unmerged_only=False):
+        """Page files of each tile's current pass, in tile/page order."""
+        if tile_ids is None:
+            tile_ids = sorted(int(t) for t in self.state['tiles'])
+        paths = []
+        for tile_id in tile_ids:
+            tile_state = self._tile_state(tile_id)
+            first = tile_state.get('merged_pages' if unmerged_only else 'pass_start', 0)
+            paths.extend(os.path.join(self.tile_dir(tile_id), f'page_{p:05d}.csv')
+                         for p in range(first, tile_state['pages']))
+        return paths
+
+    def _mark_merged(self):
+        with self._lock:
+            for tile_state in self.state['tiles'].values():
+                tile_state['merged_pages'] = tile_state['pages']
+            self._save_checkpoint()
+
+    def merge(self, output_file):
+        """Streams all downloaded pages into one CSV (written atomically)."""
+        tmp = output_file + '.tmp'
+        total = 0
+        with open(tmp, 'w') as out:
+            header_written = False
+            for path in self.page_files():
+                with open(path) as f:
+                    header = f.readline()
+                    if not header_written:
+                        out.write(header)
+                        header_written = True
+                    for line in f:
+                        out.write(line)
+                        total += 1
+            if not header_written:
+                out.write(','.join(self.select_columns) + '\n')
+        os.replace(tmp, output_file)
+        self._mark_merged()
+        return total
+
+    def append_new_rows(self, output_file, existing_ids=None):
+        """
+        Appends pages fetched since the last merge/append to output_file,
+        de-duplicated on the id column against rows already in the file.
+
+        Args:
+            output_file (str): CSV previously written by merge().
+            existing_ids (np.ndarray, optional): Ids already in output_file, if
+                the caller has a faster way to read them (e.g. a column cache).
+
+        Returns:
+            dict: {tile_id: rows appended} for tiles that gained rows.
+        """
+        if existing_ids is None:
+            existing_ids = pd.read_csv(output_file, usecols=[self.id_column])[self.id_column].to_numpy()
+        existing_ids = np.sort(np.asarray(existing_ids))
+        appended = {}
+        with open(output_file, 'a') as out:
+            for tile_id in sorted(int(t) for t in self.state['tiles']):
+                paths = self.page_files([tile_id], unmerged_only=True)
+                if not paths:
+                    continue
+                new = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+                new = new.drop_duplicates(self.id_column, keep='last')
+                # A crash between appending and checkpointing can leave rows
+                # already written; they are skipped here on the next run.
+                new = new[~np.isin(new[self.id_column].to_numpy(), existing_ids)]
+                if len(new):
+                    new[self.select_columns].to_csv(out, header=False, index=False)
+                    appended[tile_id] = len(new)
+        self._mark_merged()
+        return appended
+